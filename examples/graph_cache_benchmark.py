@@ -0,0 +1,68 @@
+import time
+import numpy as np
+import tensorflow as tf
+from pilco import graph_cache
+from pilco.models import PILCO
+from pilco.controllers import RbfController
+
+# Builds N PILCO objects of the same structure in one graph and calls their
+# autoflow methods (compute_action and mgpr.compute_prediction) once, with the
+# graphs of these methods shared (graph_cache.shared_autoflow) and with one
+# graph per object. Construction, which compiles the rollout objective of
+# every object, is timed separately, as the cache doesn't share it.
+
+state_dim = 4
+control_dim = 1
+N = 100
+bf = 10
+T = 10
+instances = 20
+
+
+def benchmark(shared):
+    np.random.seed(0)
+    graph_cache.clear()
+    # Without a structure_key, every object builds graphs of its own
+    structure_key = graph_cache.structure_key
+    if not shared:
+        graph_cache.structure_key = lambda obj: None
+    try:
+        with tf.Session(graph=tf.Graph()) as session:
+            start = time.time()
+            pilcos = []
+            for _ in range(instances):
+                X = np.random.rand(N, state_dim + control_dim)
+                Y = np.random.rand(N, state_dim)
+                controller = RbfController(state_dim, control_dim, num_basis_functions=bf)
+                # The initial state is part of the structure of a PILCO object,
+                # objects that start from different states share no graphs
+                pilcos.append(PILCO(X, Y, controller=controller, horizon=T,
+                                    m_init=np.zeros((1, state_dim)),
+                                    S_init=0.1 * np.eye(state_dim)))
+            construction_time = time.time() - start
+            operations = len(session.graph.get_operations())
+
+            x = np.random.rand(1, state_dim)
+            m = np.random.rand(1, state_dim + control_dim)
+            s = 0.1 * np.eye(state_dim + control_dim)
+            start = time.time()
+            values = [(pilco.compute_action(x), pilco.mgpr.compute_prediction(m, s))
+                      for pilco in pilcos]
+            autoflow_time = time.time() - start
+            autoflow_operations = len(session.graph.get_operations()) - operations
+            return values, construction_time, autoflow_time, autoflow_operations
+    finally:
+        graph_cache.structure_key = structure_key
+
+
+shared_values, shared_construction, shared_time, shared_operations = benchmark(shared=True)
+own_values, own_construction, own_time, own_operations = benchmark(shared=False)
+
+for shared_value, own_value in zip(tf.contrib.framework.nest.flatten(shared_values),
+                                   tf.contrib.framework.nest.flatten(own_values)):
+    np.testing.assert_allclose(shared_value, own_value, rtol=1e-8)
+print("%d objects, construction: %.2f s shared, %.2f s per object" %
+      (instances, shared_construction, own_construction))
+print("First autoflow calls:     %.2f s shared, %.2f s per object (%.2fx)" %
+      (shared_time, own_time, own_time / shared_time))
+print("Autoflow operations:      %d shared, %d per object" % (shared_operations, own_operations))
@@ -3,6 +3,7 @@ import gym
 from pilco.models import PILCO
 from pilco.controllers import RbfController, LinearController
 from pilco.rewards import ExponentialReward
+from pilco.training import train
 import tensorflow as tf
 from tensorflow import logging
 np.random.seed(0)
@@ -33,12 +34,10 @@ with tf.Session(graph=tf.Graph()) as sess:
     #pilco.controller.b = np.array([[0.0]])
     #pilco.controller.b.trainable = False
 
-    for rollouts in range(3):
-        pilco.optimize_models()
-        pilco.optimize_policy()
-        import pdb; pdb.set_trace()
-        X_new, Y_new = rollout(env=env, pilco=pilco, timesteps=100)
-        print("No of ops:", len(tf.get_default_graph().get_operations()))
-        # Update dataset
-        X = np.vstack((X, X_new)); Y = np.vstack((Y, Y_new))
-        pilco.mgpr.set_XY(X, Y)
+    # Each rollout runs in the background with the policy of the previous
+    # iteration, while the models and the policy are optimised, see
+    # pilco.training.train. Rendering is off, as the rollouts run outside
+    # the main thread.
+    X, Y = train(pilco, lambda policy: rollout(env=env, pilco=policy, timesteps=100, render=False),
+                 X, Y, iterations=3, staleness=1)
+    print("No of ops:", len(tf.get_default_graph().get_operations()))
@@ -0,0 +1,98 @@
+import time
+import numpy as np
+import tensorflow as tf
+from pilco.models import PILCO
+from pilco.controllers import RbfController
+
+# Times one evaluation of the rollout and its gradient (what L-BFGS-B needs
+# per iteration of the policy search) with and without XLA compilation, and
+# one step of the rollout with and without the model index and the weights of
+# the controller computed beforehand, as PILCO._rollout does.
+
+state_dim = 4
+control_dim = 1
+N = 200
+bf = 20
+T = 40
+repeats = 20
+# Basis functions of the controller in the step benchmark, more than above so
+# that its weights are a larger part of a step
+step_bf = 100
+
+
+def benchmark(jit):
+    np.random.seed(0)
+    X = np.random.rand(N, state_dim + control_dim)
+    A = np.random.rand(state_dim + control_dim, state_dim)
+    Y = 0.1 * np.sin(X).dot(A) + 1e-3*(np.random.rand(N, state_dim) - 0.5)
+    with tf.Session(graph=tf.Graph()):
+        controller = RbfController(state_dim=state_dim, control_dim=control_dim, num_basis_functions=bf)
+        pilco = PILCO(X, Y, controller=controller, horizon=T, jit=jit)
+        session = pilco.enquire_session()
+        ops = [pilco.objective] + tf.gradients(pilco.objective, pilco.trainable_tensors)
+        # The first run includes graph optimisation and, with jit, XLA compilation
+        start = time.time()
+        values = session.run(ops)
+        setup_time = time.time() - start
+        start = time.time()
+        for _ in range(repeats):
+            session.run(ops)
+        return values, setup_time, (time.time() - start) / repeats
+
+
+def benchmark_step():
+    np.random.seed(0)
+    X = np.random.rand(N, state_dim + control_dim)
+    A = np.random.rand(state_dim + control_dim, state_dim)
+    Y = 0.1 * np.sin(X).dot(A) + 1e-3*(np.random.rand(N, state_dim) - 0.5)
+    with tf.Session(graph=tf.Graph()):
+        controller = RbfController(state_dim=state_dim, control_dim=control_dim,
+                                   num_basis_functions=step_bf)
+        pilco = PILCO(X, Y, controller=controller, horizon=T)
+        session = pilco.enquire_session()
+        m = tf.constant(pilco.m_init, tf.float64)
+        s = tf.constant(pilco.S_init, tf.float64)
+        # The terms computed once before the loop of a rollout, fed with
+        # their values to time a step on its own: the factorizations only,
+        # also the model index, and also the weights of the controller
+        factorizations = pilco.mgpr.rollout_factorizations()
+        index = pilco.mgpr.model_index()
+        controller_terms = pilco.controller.rollout_terms()
+        steps = [(pilco.propagate(m, s, factorizations), [factorizations]),
+                 (pilco.propagate(m, s, factorizations, index), [factorizations, index]),
+                 (pilco.propagate(m, s, factorizations, index, controller_terms),
+                  [factorizations, index, controller_terms])]
+        feed_dicts, values = [], []
+        for ops, terms in steps:
+            terms = tf.contrib.framework.nest.flatten(terms)
+            feed_dicts.append(dict(zip(terms, session.run(terms))))
+            values.append(session.run(ops, feed_dict=feed_dicts[-1]))
+        # Interleaved, and the fastest of the runs, as a step is short
+        times = [[] for _ in steps]
+        for _ in range(50 * repeats):
+            for (ops, _), feed_dict, t in zip(steps, feed_dicts, times):
+                start = time.time()
+                session.run(ops, feed_dict=feed_dict)
+                t.append(time.time() - start)
+        return [(v, min(t)) for v, t in zip(values, times)]
+
+
+default_values, default_setup, default_time = benchmark(jit=False)
+jit_values, jit_setup, jit_time = benchmark(jit=True)
+
+for default_value, jit_value in zip(default_values, jit_values):
+    np.testing.assert_allclose(default_value, jit_value, rtol=1e-6)
+print("Default graph: %.4f s per evaluation (first run %.2f s)" % (default_time, default_setup))
+print("XLA:           %.4f s per evaluation (first run %.2f s)" % (jit_time, jit_setup))
+print("Speedup: %.2fx" % (default_time / jit_time))
+
+step_results = benchmark_step()
+for step_values, _ in step_results[1:]:
+    for value, reference in zip(step_values, step_results[0][0]):
+        np.testing.assert_allclose(value, reference, rtol=1e-8)
+(_, no_index_time), (_, index_time), (_, hoisted_time) = step_results
+print("Rollout step, model index per step:        %.5f s" % no_index_time)
+print("Rollout step, model index hoisted:         %.5f s (%.2fx)" %
+      (index_time, no_index_time / index_time))
+print("Rollout step, controller weights hoisted:  %.5f s (%.2fx)" %
+      (hoisted_time, index_time / hoisted_time))
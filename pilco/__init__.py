@@ -1,3 +1,21 @@
-from . import models
-from . import controllers
-from . import rewards
\ No newline at end of file
+import importlib
+import sys
+import types
+
+# Submodules are imported on first access, so that those that don't need
+# TensorFlow (numpy_backend, optimizers) can be used without importing it.
+_submodules = ['models', 'controllers', 'rewards', 'optimizers', 'numpy_backend',
+               'training', 'mpc', 'sessions', 'parallel', 'graph_cache']
+
+
+class _LazyModule(types.ModuleType):
+    def __getattr__(self, name):
+        if name in _submodules:
+            return importlib.import_module('.' + name, self.__name__)
+        raise AttributeError("module %r has no attribute %r" % (self.__name__, name))
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(_submodules))
+
+
+sys.modules[__name__].__class__ = _LazyModule
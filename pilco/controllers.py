@@ -3,6 +3,7 @@ import numpy as np
 import gpflow
 
 from .models import MGPR
+from .numpy_backend import factorize
 from gpflow import settings
 float_type = settings.dtypes.float_type
 
@@ -54,61 +55,203 @@ class LinearController(gpflow.Parameterized):
             V = V @ V2
         return M, S, V
 
+    def rollout_terms(self):
+        # Nothing of compute_action is independent of the state
+        return {}
+
+    def export(self):
+        return dict(W=self.W.value, b=self.b.value, max_action=self.max_action)
+
+    def export_population(self, values):
+        '''
+        As export, for a population of controllers: values maps the pathnames
+        of (some of) the parameters to their values for every member [P, ...].
+        '''
+        return dict(W=population_value(self.W, values),
+                    b=population_value(self.b, values), max_action=self.max_action)
+
     def randomize(self):
         mean = 0; sigma = 1
         self.W.assign(mean + sigma*np.random.normal(size=self.W.shape))
         self.b.assign(mean + sigma*np.random.normal(size=self.b.shape))
 
 
-class FakeGPR(gpflow.Parameterized):
-    def __init__(self, X, Y, kernel):
-        gpflow.Parameterized.__init__(self)
-        self.X = gpflow.Param(X)
-        self.Y = gpflow.Param(Y)
-        self.kern = kernel
-        self.likelihood = gpflow.likelihoods.Gaussian()
+def population_value(param, values):
+    # Parameters missing from values are shared by the whole population
+    return values.get(param.pathname, np.asarray(param.value)[None])
+
 
 class RbfController(MGPR):
     '''
     An RBF Controller implemented as a deterministic GP
     See Deisenroth et al 2015: Gaussian Processes for Data-Efficient Learning in Robotics and Control
     Section 5.3.2.
+    All the controls share one basis: the centers [B, D] and the targets
+    [B, U] are single parameters, as are the lengthscales [U, D], so the
+    basis functions are evaluated for every control at once.
     '''
     def __init__(self, state_dim, control_dim, num_basis_functions, max_action=None):
         MGPR.__init__(self,
             np.random.randn(num_basis_functions, state_dim),
             0.1*np.random.randn(num_basis_functions, control_dim)
         )
-        for model in self.models:
-            model.kern.variance = 1.0
-            model.kern.variance.trainable = False
-            self.max_action = max_action
+        self.max_action = max_action
 
     def create_models(self, X, Y):
-        self.models = gpflow.params.ParamList([])
-        for i in range(self.num_outputs):
-            kern = gpflow.kernels.RBF(input_dim=X.shape[1], ARD=True)
-            self.models.append(FakeGPR(X, Y[:, i:i+1], kern))
+        self.centers = gpflow.Param(X)
+        self.targets = gpflow.Param(Y)
+        self.basis_lengthscales = gpflow.Param(np.ones((self.num_outputs, self.num_dims)),
+                                               transform=gpflow.transforms.positive)
+        self.basis_variance = gpflow.Param(np.ones(self.num_outputs),
+                                           transform=gpflow.transforms.positive, trainable=False)
+        self.basis_noise = gpflow.Param(np.ones(self.num_outputs),
+                                        transform=gpflow.transforms.positive)
 
-    def compute_action(self, m, s, squash=True):
+    def set_XY(self, X, Y):
+        self.centers.assign(X)
+        self.targets.assign(Y)
+
+    def hyperparameter_values(self):
+        if not hasattr(self, 'centers'):
+            return MGPR.hyperparameter_values(self)
+        return self.basis_lengthscales.value, self.basis_variance.value, self.basis_noise.value
+
+    def compute_action(self, m, s, squash=True, weights=None, index=None):
         '''
         RBF Controller. See Deisenroth's Thesis Section
         IN: mean (m) and variance (s) of the state
         OUT: mean (M) and variance (S) of the action
+        weights, index: rollout_terms(), to share between actions
         '''
-        iK, beta = self.calculate_factorizations()
-        M, S, V = self.predict_given_factorizations(m, s, 0.0 * iK, beta)
+        if weights is None:
+            weights = self.calculate_weights()
+        M, S, V = self.predict_gaussian(m, s, None, weights, index)
         S = S - tf.diag(self.variance - 1e-6)
         if squash:
             M, S, V2 = squash_sin(M, S, self.max_action)
             V = V @ V2
         return M, S, V
 
+    def rollout_terms(self):
+        '''
+        The terms of compute_action that don't depend on the state: the
+        weights of the basis functions and their model_index. A rollout
+        computes them once, rather than at every step.
+        '''
+        return dict(weights=self.calculate_weights(), index=self.model_index())
+
+    def calculate_weights(self):
+        # Only beta of calculate_factorizations, the basis is deterministic
+        batched_eye = tf.eye(tf.shape(self.X)[0], batch_shape=[self.num_outputs], dtype=float_type)
+        L = tf.cholesky(self.K(self.X) + self.noise[:, None, None]*batched_eye)
+        return tf.cholesky_solve(L, tf.transpose(self.Y)[:, :, None])[:, :, 0]
+
+    def predict_given_factorizations(self, m, s, iK, beta, index=None):
+        '''
+        MGPR.predict_given_factorizations without the model uncertainty, for
+        the shared basis
+        IN: mean (m) [1, D] and variance (s) [D, D] of the state, beta [U, B]
+        OUT: mean (M) [1, U], variance (S) [U, U] and inv(s)*input-output
+             covariance (V) [D, U]
+        '''
+        if index is None:
+            index = self.model_index()
+        U, D = self.num_outputs, self.num_dims
+        l = self.lengthscales
+        iN = index['X_iL'] - m * index['iL'][:, None, :]
+        B = s[None, :, :] / (l[:, :, None] * l[:, None, :]) + tf.eye(D, dtype=float_type)
+        t = tf.linalg.transpose(tf.matrix_solve(B, tf.linalg.transpose(iN), adjoint=True))
+        lb = tf.exp(-tf.reduce_sum(iN * t, -1)/2) * beta
+        c = self.variance / tf.sqrt(tf.linalg.det(B))
+        M = (tf.reduce_sum(lb, -1) * c)[:, None]
+        V = tf.reduce_sum(t / l[:, None, :] * lb[:, :, None], 1) * c[:, None]
+
+        # One [U, U, D, D] solve for all the pairs of controls
+        R = s[None, None, :, :] * index['pair_iL2'][:, :, None, :] + tf.eye(D, dtype=float_type)
+        Q = tf.matrix_solve(R, tf.tile(s[None, None, :, :], [U, U, 1, 1]))/2
+        Xd = index['X_iL2'] - m * index['iL2'][:, None, :]
+        Xa = tf.tile(Xd[:, None, :, :], [1, U, 1, 1])
+        Xb = tf.tile(Xd[None, :, :, :], [U, 1, 1, 1])
+        XaQ = Xa @ Q
+        maha = 2 * tf.matmul(XaQ, Xb, adjoint_b=True) + \
+            tf.reduce_sum(XaQ * Xa, -1)[:, :, :, None] + \
+            tf.reduce_sum(Xb @ Q * Xb, -1)[:, :, None, :]
+        k = index['log_variance'][:, None] - tf.reduce_sum(tf.square(iN), -1)/2
+        L = tf.exp(k[:, None, :, None] + k[None, :, None, :] + maha)
+        S = tf.reduce_sum(beta[:, None, :] * tf.reduce_sum(L * beta[None, :, None, :], -1), -1)
+        S = S / tf.sqrt(tf.linalg.det(R)) + tf.diag(self.variance) - M @ tf.transpose(M)
+        return tf.transpose(M), S, tf.transpose(V)
+
+    def predict_at_points(self, x, iK, beta):
+        # Without model uncertainty the variance is the prior one
+        k = self.K(x, self.X)
+        mean = tf.reduce_sum(k * beta[:, None, :], -1)
+        var = self.variance[:, None] * tf.ones_like(mean)
+        return tf.transpose(mean), tf.transpose(var)
+
+    def K(self, X1, X2=None):
+        '''
+        Basis functions of every control at once [U, N1, N2]
+        '''
+        if X2 is None:
+            X2 = X1
+        X1 = X1[None, :, :] / self.lengthscales[:, None, :]
+        X2 = X2[None, :, :] / self.lengthscales[:, None, :]
+        dist = tf.reduce_sum(tf.square(X1), -1)[:, :, None] + \
+            tf.reduce_sum(tf.square(X2), -1)[:, None, :] - 2 * tf.matmul(X1, X2, adjoint_b=True)
+        return self.variance[:, None, None] * tf.exp(-tf.maximum(dist, 0.0)/2)
+
+    @property
+    def X(self):
+        return self.centers.parameter_tensor
+
+    @property
+    def Y(self):
+        return self.targets.parameter_tensor
+
+    @property
+    def lengthscales(self):
+        return self.basis_lengthscales.constrained_tensor
+
+    @property
+    def variance(self):
+        return self.basis_variance.constrained_tensor
+
+    @property
+    def noise(self):
+        return self.basis_noise.constrained_tensor
+
+    def export(self):
+        lengthscales, variance, noise = self.hyperparameter_values()
+        X = self.centers.value
+        iK, beta = factorize(X[None], self.targets.value[None], lengthscales[None],
+                             variance[None], noise[None])
+        return dict(X=X, lengthscales=lengthscales, variance=variance, iK=iK[0],
+                    beta=beta[0], noise=noise, max_action=self.max_action)
+
+    def export_population(self, values):
+        '''
+        As export, for a population of controllers: values maps the pathnames
+        of (some of) the parameters to their values for every member [P, ...].
+        The factorizations are recomputed in NumPy.
+        '''
+        X = population_value(self.centers, values)
+        lengthscales = population_value(self.basis_lengthscales, values)
+        variance = population_value(self.basis_variance, values)
+        noise = population_value(self.basis_noise, values)
+        iK, beta = factorize(X, population_value(self.targets, values),
+                             lengthscales, variance, noise)
+        P = max(iK.shape[0], beta.shape[0])
+        X, lengthscales, variance, noise, iK, beta = [np.broadcast_to(a, (P,) + a.shape[1:])
+            for a in (X, lengthscales, variance, noise, iK, beta)]
+        return dict(X=X, lengthscales=lengthscales, variance=variance,
+                    iK=iK, beta=beta, noise=noise, max_action=self.max_action)
+
     def randomize(self):
         print("Randomising controller")
-        for m in self.models:
-            mean = 0; sigma = 0.1
-            m.X.assign(mean + sigma*np.random.normal(size=m.X.shape))
-            m.Y.assign(mean + sigma*np.random.normal(size=m.Y.shape))
-            mean = 1; sigma = 0.1
-            m.kern.lengthscales.assign(mean + sigma*np.random.normal(size=m.kern.lengthscales.shape))
+        mean = 0; sigma = 0.1
+        self.centers.assign(mean + sigma*np.random.normal(size=self.centers.shape))
+        self.targets.assign(mean + sigma*np.random.normal(size=self.targets.shape))
+        mean = 1; sigma = 0.1
+        self.basis_lengthscales.assign(
+            mean + sigma*np.random.normal(size=self.basis_lengthscales.shape))
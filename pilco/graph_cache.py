@@ -0,0 +1,172 @@
+import functools
+import weakref
+import numpy as np
+import tensorflow as tf
+import gpflow
+from gpflow.core.autoflow import AutoFlow
+
+# Graphs of shared_autoflow methods, by graph, then by method and
+# structure_key. The entries hold the names of their tensors rather than the
+# tensors, which would keep the graph alive.
+_graphs = weakref.WeakKeyDictionary()
+
+# Value of an attribute whose effect on the graphs can't be told
+_UNKNOWN = object()
+
+
+def _nodes(root):
+    # Every Parameterized object under root (included), with its path
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node.pathname[len(root.pathname):], node
+        stack.extend(child for child in node.params if isinstance(child, gpflow.Parameterized))
+
+
+def _roots(obj):
+    # obj, and the GP models of the MGPR objects within it, which are kept in
+    # a list rather than as children
+    roots = [('', obj)]
+    for path, node in _nodes(obj):
+        for i, model in enumerate(getattr(node, 'models', None) or []):
+            if isinstance(model, gpflow.Parameterized):
+                roots.append(('%s/models/%d' % (path, i), model))
+    return roots
+
+
+def _parameters(obj):
+    # Parameters and data of obj by path, with the variables holding them.
+    # Those of parameters hold their unconstrained values, from which the
+    # graphs compute the constrained ones, and which some objects read
+    # directly (e.g. RbfController.X).
+    tensors = []
+    for prefix, root in _roots(obj):
+        for param in root.parameters:
+            tensors.append((prefix + param.pathname[len(root.pathname):], param,
+                            param.parameter_tensor))
+        for holder in root.data_holders:
+            tensors.append((prefix + holder.pathname[len(root.pathname):], holder,
+                            holder.parameter_tensor))
+    return tensors
+
+
+def _ignored(value):
+    # Attributes the graphs don't depend on, or whose part in them is
+    # already in the key: objects of the tree, models, optimisers, sessions
+    if isinstance(value, (list, tuple)):
+        return all(_ignored(item) for item in value)
+    return isinstance(value, (gpflow.core.Node, gpflow.training.optimizer.Optimizer, tf.Session))
+
+
+def _constant(value):
+    # Hashable description of an attribute built into the graphs as a
+    # constant, or _UNKNOWN
+    if isinstance(value, (bool, int, float, str, type(None))):
+        return (type(value).__name__, value)
+    if isinstance(value, np.generic):
+        return (value.dtype.str, value.item())
+    if isinstance(value, np.ndarray):
+        return (value.shape, value.dtype.str, value.tobytes())
+    if isinstance(value, slice):
+        # e.g. the active_dims of kernels
+        value = ('slice', value.start, value.stop, value.step)
+    if isinstance(value, (list, tuple)):
+        items = tuple(_constant(item) for item in value)
+        return _UNKNOWN if _UNKNOWN in items else (type(value).__name__, items)
+    if isinstance(value, gpflow.transforms.Transform):
+        # Their parameters are private, e.g. the lower bound of Log1pe
+        items = tuple((name, _constant(item)) for name, item in sorted(vars(value).items()))
+        if any(item is _UNKNOWN for _, item in items):
+            return _UNKNOWN
+        return (type(value).__name__, items)
+    return _UNKNOWN
+
+
+def _attributes(node):
+    # Plain attributes of a node, e.g. dimensions, horizon and options, which
+    # are built into the graphs as constants. _UNKNOWN if the node has one of
+    # a type that can't be compared, e.g. a function.
+    ignored = getattr(node, 'graph_independent', ())
+    attributes = []
+    for name, value in sorted(vars(node).items()):
+        if name.startswith('_') or name in ignored or _ignored(value):
+            continue
+        value = _constant(value)
+        if value is _UNKNOWN:
+            return _UNKNOWN
+        attributes.append((name, value))
+    return tuple(attributes)
+
+
+def structure_key(obj):
+    '''
+    What a graph built for obj depends on besides the values of its
+    parameters and data: the classes and plain attributes of the objects in
+    it, and the paths, (fixed) shapes and transforms of the parameters.
+    Objects with the same key evaluate the same graph, fed with their own
+    values. None if an attribute can't be compared, and obj can't share.
+    '''
+    key = []
+    for prefix, root in _roots(obj):
+        for path, node in _nodes(root):
+            attributes = _attributes(node)
+            if attributes is _UNKNOWN:
+                return None
+            key.append((prefix + path, type(node).__name__, attributes))
+    for path, param, _ in _parameters(obj):
+        shape = tuple(param.shape) if param.fixed_shape else len(param.shape)
+        transform = _constant(getattr(param, 'transform', None))
+        if transform is _UNKNOWN:
+            return None
+        key.append((path, type(param).__name__, shape, transform))
+    return tuple(key)
+
+
+def clear():
+    _graphs.clear()
+
+
+def shared_autoflow(*arg_specs):
+    '''
+    As gpflow.autoflow, but the graph of the method is built once for all the
+    objects with the same structure_key, rather than once per object. The
+    first object to call it builds the graph. The others run it with the
+    values of their parameters and data fed in place of those of the first.
+    Objects without a structure_key get a graph of their own, as with
+    gpflow.autoflow.
+    arg_specs: (dtype, shape) of the placeholders of the arguments
+    '''
+    def decorator(method):
+        def build(obj):
+            with tf.name_scope('autoflow/shared/' + method.__name__):
+                placeholders = [tf.placeholder(*spec) for spec in arg_specs]
+                result = method(obj, *placeholders)
+            return dict(placeholders=[p.name for p in placeholders],
+                        result=tf.contrib.framework.nest.map_structure(lambda t: t.name, result),
+                        template=[tensor.name for _, _, tensor in _parameters(obj)])
+
+        @functools.wraps(method)
+        def runnable(obj, *args):
+            session = obj.enquire_session()
+            graph = session.graph
+            key = structure_key(obj)
+            if key is None:
+                entries = AutoFlow.get_autoflow(obj, method.__name__)
+                key = 'own'
+            else:
+                entries = _graphs.setdefault(graph, {})
+                key = (method.__module__, method.__qualname__, key)
+            if key not in entries:
+                with graph.as_default():
+                    entries[key] = build(obj)
+            entry = entries[key]
+            obj.initialize(session=session)
+            feed_dict = dict(zip(entry['placeholders'], args))
+            tensors = [tensor for _, _, tensor in _parameters(obj)]
+            if any(name != tensor.name for name, tensor in zip(entry['template'], tensors)):
+                feed_dict.update(zip(entry['template'], session.run(tensors)))
+            result = tf.contrib.framework.nest.map_structure(graph.get_tensor_by_name,
+                                                             entry['result'])
+            return session.run(result, feed_dict=feed_dict)
+        return runnable
+    return decorator
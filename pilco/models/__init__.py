@@ -1,3 +1,21 @@
-from .mgpr import MGPR
-from .smgpr import SMGPR
-from .pilco import PILCO
\ No newline at end of file
+import importlib
+import sys
+import types
+
+# The models are imported on first access, so that e.g. active_set can be
+# used without importing TensorFlow.
+_models = {'MGPR': 'mgpr', 'SMGPR': 'smgpr', 'RFFMGPR': 'rffmgpr', 'PILCO': 'pilco'}
+
+
+class _LazyModule(types.ModuleType):
+    def __getattr__(self, name):
+        if name in _models:
+            module = importlib.import_module('.' + _models[name], self.__name__)
+            return getattr(module, name)
+        raise AttributeError("module %r has no attribute %r" % (self.__name__, name))
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(_models))
+
+
+sys.modules[__name__].__class__ = _LazyModule
@@ -0,0 +1,59 @@
+import numpy as np
+
+
+def rbf(X1, X2, lengthscales, variance):
+    d = (X1[:, None, :] - X2[None, :, :]) / lengthscales
+    return variance * np.exp(-np.sum(np.square(d), -1) / 2)
+
+
+def select_by_recency(X, max_points):
+    return np.arange(max(X.shape[0] - max_points, 0), X.shape[0])
+
+
+def select_by_variance(X, lengthscales, variances, noises, max_points):
+    '''
+    Greedy selection of the points with the largest posterior variance given
+    the points already selected, summed over the outputs after normalising by
+    the signal variances. Points that are redundant under the current
+    hyperparameters are therefore the first to go.
+    Implemented as a pivoted, incomplete Cholesky factorisation of the noisy
+    kernel matrices, so it costs O(E*N*max_points^2).
+    IN: inputs X [N, D], lengthscales [E, D], variances [E], noises [E]
+    OUT: sorted indices of the selected points
+    '''
+    E, N = lengthscales.shape[0], X.shape[0]
+    max_points = min(max_points, N)
+    posterior_variance = np.tile(variances[:, None], [1, N])
+    L = np.zeros((E, max_points, N))
+    selected = []
+    for j in range(max_points):
+        score = np.sum(posterior_variance / variances[:, None], 0)
+        score[selected] = -np.inf
+        i = int(np.argmax(score))
+        selected.append(i)
+        for e in range(E):
+            k = rbf(X[i:i+1], X, lengthscales[e], variances[e])[0]
+            l = (k - L[e, :j, i] @ L[e, :j, :]) / \
+                np.sqrt(posterior_variance[e, i] + noises[e])
+            L[e, j] = l
+            posterior_variance[e] = np.maximum(posterior_variance[e] - np.square(l), 0)
+    return np.sort(selected)
+
+
+def prediction_error(X, Y, active, lengthscales, variances, noises):
+    '''
+    Root mean squared error of the posterior mean, given only the active
+    points, on the points that were left out.
+    OUT: array [E] with one error per output (zeros if nothing was left out)
+    '''
+    dropped = np.setdiff1d(np.arange(X.shape[0]), active)
+    if len(dropped) == 0:
+        return np.zeros(Y.shape[1])
+    errors = []
+    for e in range(Y.shape[1]):
+        K = rbf(X[active], X[active], lengthscales[e], variances[e]) + \
+            noises[e] * np.eye(len(active))
+        Ks = rbf(X[dropped], X[active], lengthscales[e], variances[e])
+        mean = Ks @ np.linalg.solve(K, Y[active, e])
+        errors.append(np.sqrt(np.mean(np.square(mean - Y[dropped, e]))))
+    return np.array(errors)
@@ -0,0 +1,198 @@
+import numpy as np
+import tensorflow as tf
+import gpflow
+
+float_type = gpflow.settings.dtypes.float_type
+
+# Defaults of the iterative solver, see MGPR with solver='cg'
+PRECONDITIONER_RANK = 50
+NUM_PROBES = 10
+MAX_ITERATIONS = 1000
+TOLERANCE = 1e-6
+
+
+def pivoted_cholesky(K, rank=PRECONDITIONER_RANK):
+    '''
+    Partial pivoted Cholesky factorization, greedily pivoting on the largest
+    remaining diagonal entry. Columns past the numerical rank of K are zero.
+    IN: batched positive semidefinite matrices K [E, N, N]
+    OUT: L [E, N, rank] with L L^T ~= K
+    '''
+    d = tf.linalg.diag_part(K)
+    batch = tf.range(tf.shape(K)[0])
+    columns = []
+    for _ in range(rank):
+        # (matrix, pivot) pairs, as the shapes needn't be known
+        i = tf.stack([batch, tf.argmax(d, axis=-1, output_type=tf.int32)], 1)
+        row = tf.gather_nd(K, i)
+        if columns:
+            L = tf.stack(columns, -1)
+            row = row - tf.reduce_sum(L * tf.gather_nd(L, i)[:, None, :], -1)
+        pivot = tf.gather_nd(d, i)[:, None]
+        column = tf.where(tf.tile(pivot > gpflow.settings.jitter, [1, tf.shape(d)[1]]),
+                          row / tf.sqrt(tf.maximum(pivot, gpflow.settings.jitter)),
+                          tf.zeros_like(row))
+        d = d - tf.square(column)
+        columns.append(column)
+    return tf.stack(columns, -1)
+
+
+def preconditioner(L, noise):
+    '''
+    The preconditioner P = L L^T + noise*I, for L from pivoted_cholesky
+    IN: L [E, N, k], noise [E]
+    OUT: function applying inv(P) to [E, N, R] matrices, and log det(P) [E]
+    '''
+    k = tf.shape(L)[2]
+    A = tf.matmul(L, L, transpose_a=True) + \
+        noise[:, None, None] * tf.eye(k, batch_shape=[tf.shape(L)[0]], dtype=float_type)
+    chol_A = tf.cholesky(A)
+
+    def solve(R):
+        # Woodbury identity
+        return (R - L @ tf.cholesky_solve(chol_A, tf.matmul(L, R, transpose_a=True))) \
+            / noise[:, None, None]
+
+    N = tf.cast(tf.shape(L)[1] - k, float_type)
+    logdet = N * tf.log(noise) + \
+        2 * tf.reduce_sum(tf.log(tf.linalg.diag_part(chol_A)), -1)
+    return solve, logdet
+
+
+def conjugate_gradient(K, B, precondition=None, max_iterations=MAX_ITERATIONS,
+                       tolerance=TOLERANCE):
+    '''
+    Solves K X = B with preconditioned conjugate gradients, batched over the
+    matrices and the right hand sides, with matrix-vector products only.
+    Each system stops once its residual is below `tolerance` relative to B.
+    IN: K [E, N, N], B [E, N, R], precondition: inv(P) for a preconditioner P
+        (see preconditioner), None for none
+    OUT: X [E, N, R] and the coefficients alpha, beta [J, E, R] of the J
+         iterations, with the iterations each system was still running, see
+         lanczos_logdet
+    '''
+    if precondition is None:
+        precondition = tf.identity
+
+    def dot(a, b):
+        return tf.reduce_sum(a * b, 1)
+
+    norm = tf.sqrt(dot(B, B))
+
+    def running(R):
+        return tf.sqrt(dot(R, R)) > tolerance * norm
+
+    def condition(i, X, R, P, rz, *coefficients):
+        return (i < max_iterations) & ((i == 0) | tf.reduce_any(running(R)))
+
+    def body(i, X, R, P, rz, alphas, betas, active):
+        run = running(R)
+        KP = K @ P
+        alpha = tf.where(run, rz / dot(P, KP), tf.zeros_like(rz))
+        X = X + alpha[:, None, :] * P
+        R = R - alpha[:, None, :] * KP
+        Z = precondition(R)
+        rz_new = dot(R, Z)
+        beta = tf.where(run, rz_new / rz, tf.zeros_like(rz))
+        P = Z + beta[:, None, :] * P
+        rz = tf.where(run, rz_new, rz)
+        return i + 1, X, R, P, rz, alphas.write(i, alpha), betas.write(i, beta), active.write(i, run)
+
+    Z = precondition(B)
+    arrays = [tf.TensorArray(dtype, size=0, dynamic_size=True)
+              for dtype in [float_type, float_type, tf.bool]]
+    _, X, _, _, _, alphas, betas, active = tf.while_loop(
+        condition, body, [tf.constant(0), tf.zeros_like(B), B, Z, dot(B, Z)] + arrays,
+        back_prop=False)
+    return X, alphas.stack(), betas.stack(), active.stack()
+
+
+def lanczos_logdet(alphas, betas, active, norms):
+    '''
+    Stochastic Lanczos quadrature: the tridiagonal Lanczos matrices of
+    (preconditioned) conjugate gradients started from probe vectors z give
+    z^T log(inv(P) K) z, averaged here over the probes.
+    IN: alphas, betas, active [J, E, R] from conjugate_gradient, and
+        norms [E, R]: z^T inv(P) z of the probes
+    OUT: estimate of log det(inv(P) K) [E]
+    '''
+    alphas = tf.transpose(alphas, [1, 2, 0])
+    betas = tf.transpose(betas, [1, 2, 0])
+    active = tf.transpose(active, [1, 2, 0])
+    ones = tf.ones_like(alphas)
+    safe_alphas = tf.where(active, alphas, ones)
+    previous = tf.concat([tf.zeros_like(betas[..., :1]), (betas / safe_alphas)[..., :-1]], -1)
+    # The steps a system didn't run get an identity block, which doesn't
+    # change the quadrature
+    diagonal = tf.where(active, 1 / safe_alphas + previous, ones)
+    next_active = tf.concat([active[..., 1:], tf.zeros_like(active[..., :1])], -1)
+    off_diagonal = tf.where(next_active, tf.sqrt(betas) / safe_alphas, tf.zeros_like(betas))
+    upper = tf.pad(tf.matrix_diag(off_diagonal[..., :-1]), [[0, 0], [0, 0], [0, 1], [1, 0]])
+    T = tf.matrix_diag(diagonal) + upper + tf.linalg.transpose(upper)
+    eigenvalues, eigenvectors = tf.self_adjoint_eig(T)
+    quadrature = tf.reduce_sum(tf.square(eigenvectors[..., 0, :]) *
+                               tf.log(tf.maximum(eigenvalues, gpflow.settings.jitter)), -1)
+    return tf.reduce_mean(norms * quadrature, -1)
+
+
+def probes(L, noise, num_probes, seed=0):
+    '''
+    Fixed Gaussian probe vectors with covariance the preconditioner
+    L L^T + noise*I, the same at every evaluation so that estimates are
+    deterministic functions of the hyperparameters.
+    OUT: [E, N, num_probes]
+    '''
+    shape = tf.shape(L)
+    e1 = tf.random.stateless_normal([shape[0], shape[2], num_probes], [seed, 0], dtype=float_type)
+    e2 = tf.random.stateless_normal([shape[0], shape[1], num_probes], [seed, 1], dtype=float_type)
+    return L @ e1 + tf.sqrt(noise)[:, None, None] * e2
+
+
+class CGGPR(gpflow.models.GPR):
+    '''
+    GPR whose log marginal likelihood, and its gradient, are computed
+    without factorizing the N x N covariance: the quadratic term with
+    preconditioned conjugate gradients, and the log determinant with
+    stochastic Lanczos quadrature from num_probes fixed probe vectors.
+    Predictions (predict_f etc.) are those of GPR.
+    '''
+    def __init__(self, X, Y, kern, preconditioner_rank=PRECONDITIONER_RANK,
+                 num_probes=NUM_PROBES, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE,
+                 **kwargs):
+        super(CGGPR, self).__init__(X, Y, kern, **kwargs)
+        self.preconditioner_rank = preconditioner_rank
+        self.num_probes = num_probes
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+
+    @gpflow.name_scope('likelihood')
+    @gpflow.params_as_tensors
+    def _build_likelihood(self):
+        Kf = self.kern.K(self.X)[None]
+        noise = self.likelihood.variance[None]
+        N = tf.shape(self.X)[0]
+        K = Kf + noise[:, None, None] * tf.eye(N, dtype=float_type)
+        err = (self.Y - self.mean_function(self.X))[None]
+
+        # The solves have no gradient. The terms below are built so that
+        # their values are the estimates and their gradients those of
+        # the exact terms, given the solves.
+        L = pivoted_cholesky(tf.stop_gradient(Kf), self.preconditioner_rank)
+        precondition, precondition_logdet = preconditioner(L, tf.stop_gradient(noise))
+        Z = probes(L, tf.stop_gradient(noise), self.num_probes)
+        X, alphas, betas, active = conjugate_gradient(
+            tf.stop_gradient(K), tf.concat([tf.stop_gradient(err), Z], -1), precondition,
+            self.max_iterations, self.tolerance)
+        alpha, W = X[:, :, :1], X[:, :, 1:]
+        V = precondition(Z)
+
+        # d log det(K) = tr(inv(K) dK) ~= mean of w^T dK v over the probes,
+        # with w = inv(K) z, v = inv(P) z and E[z z^T] = P
+        logdet_gradient = tf.reduce_mean(tf.reduce_sum(W * (K @ V), 1), -1)
+        logdet = precondition_logdet + lanczos_logdet(
+            alphas[..., 1:], betas[..., 1:], active[..., 1:], tf.reduce_sum(Z * V, 1))
+        logdet = tf.stop_gradient(logdet - logdet_gradient) + logdet_gradient
+        # 2 err^T alpha - alpha^T K alpha = err^T inv(K) err at the solution
+        quadratic = 2 * tf.reduce_sum(err * alpha) - tf.reduce_sum(alpha * (K @ alpha))
+
+        return -0.5 * (tf.cast(N, float_type) * np.log(2 * np.pi) + logdet[0] + quadratic)
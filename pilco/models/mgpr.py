@@ -1,6 +1,11 @@
 import tensorflow as tf
 import gpflow
 import numpy as np
+
+from ..optimizers import optimize_with_restarts, run_optimizer
+from .active_set import select_by_recency, select_by_variance, prediction_error
+from . import iterative
+from ..graph_cache import shared_autoflow
 float_type = gpflow.settings.dtypes.float_type
 
 def randomize(model):
@@ -14,61 +19,322 @@ def randomize(model):
         model.likelihood.variance.assign(
             mean + sigma*np.random.normal())
 
+def unit_scale(X):
+    # Standard deviations, with constant columns left unscaled
+    std = X.std(0)
+    return np.where(std > 0, std, 1.0)
+
 class MGPR(gpflow.Parameterized):
-    def __init__(self, X, Y, name=None):
+    # Diagnostics the graphs don't depend on, see graph_cache.structure_key
+    graph_independent = ('log_likelihoods', 'selection_error')
+
+    def __init__(self, X, Y, name=None, max_datapoints=None, selection='variance',
+                 cache_factorizations=False, normalize=False, solver='cholesky',
+                 active_dims=None):
         super(MGPR, self).__init__(name)
 
         self.num_outputs = Y.shape[1]
-        self.num_dims = X.shape[1]
+        # Inputs the models depend on, see prune_inputs. None for all of them.
+        self.input_dim = X.shape[1]
+        self.active_dims = None if active_dims is None else np.asarray(active_dims)
+        self.num_dims = X.shape[1] if active_dims is None else len(self.active_dims)
+        # Cap on the size of the training set, and how the points to keep are
+        # chosen ('variance' or 'recency'), see select_data
+        self.max_datapoints = max_datapoints
+        self.selection = selection
+        # Approximation used for predictions at Gaussian inputs, one of
+        # 'moment_matching' (exact moments), 'unscented' or 'linearized'
+        self.propagation = 'moment_matching'
+        # Linear algebra of the GPs: 'cholesky', or 'cg' for conjugate
+        # gradients, which never factorize the N x N covariances, see
+        # calculate_factorizations and iterative.CGGPR
+        if solver not in ('cholesky', 'cg'):
+            raise ValueError('Unknown solver: %s' % solver)
+        self.solver = solver
+        # Fit the GPs to inputs and outputs scaled to zero mean and unit
+        # variance, with the statistics of the data given here. Predictions
+        # are mapped back exactly, see predict_gaussian.
+        self.normalize = normalize
+        if normalize:
+            self.input_mean, self.input_scale = X.mean(0), unit_scale(X)
+            self.output_mean, self.output_scale = Y.mean(0), unit_scale(Y)
+        X, Y = self.model_data(X, Y)
+        X, Y = self.select_data(X, Y)
         self.num_datapoints = X.shape[0]
 
         self.create_models(X, Y)
         self.optimizers = []
+        # Log marginal likelihood per datapoint of each model after the last
+        # optimize, the reference of warm-started refits
+        self.log_likelihoods = None
+
+        # Rollouts can read the factorizations from non-trainable copies,
+        # rather than recomputing them at every evaluation, see
+        # update_factorizations
+        self.cache_factorizations = cache_factorizations
+        if cache_factorizations:
+            self.factorization_cache = gpflow.params.ParamList([
+                gpflow.DataHolder(np.zeros((self.num_outputs, 0, 0))),
+                gpflow.DataHolder(np.zeros((self.num_outputs, 0)))])
+            self.compile()
+            self.update_factorizations()
 
     def create_models(self, X, Y):
         self.models = []
         for i in range(self.num_outputs):
-            kern = gpflow.kernels.RBF(input_dim=X.shape[1], ARD=True)
-            #TODO: Maybe fix noise for better conditioning
-            kern.lengthscales.prior = gpflow.priors.Gamma(1,10) # priors have to be included before
-            kern.variance.prior = gpflow.priors.Gamma(1.5,2)    # before the model gets compiled
-            self.models.append(gpflow.models.GPR(X, Y[:, i:i+1], kern))
-            self.models[i].clear(); self.models[i].compile()
+            # Nothing is built until the model is complete, and then only once
+            with gpflow.defer_build():
+                kern = gpflow.kernels.RBF(input_dim=X.shape[1], ARD=True)
+                #TODO: Maybe fix noise for better conditioning
+                kern.lengthscales.prior = gpflow.priors.Gamma(1,10) # priors have to be included before
+                kern.variance.prior = gpflow.priors.Gamma(1.5,2)    # before the model gets compiled
+                if self.solver == 'cg':
+                    self.models.append(iterative.CGGPR(X, Y[:, i:i+1], kern))
+                else:
+                    self.models.append(gpflow.models.GPR(X, Y[:, i:i+1], kern))
+            self.models[i].compile()
 
     def set_XY(self, X, Y):
+        X, Y = self.model_data(X, Y)
+        X, Y = self.select_data(X, Y)
+        self.num_datapoints = X.shape[0]
         for i in range(len(self.models)):
             self.models[i].X = X
             self.models[i].Y = Y[:, i:i+1]
+        self.update_factorizations()
+
+    def select_data(self, X, Y):
+        '''
+        Keeps at most max_datapoints of the given transitions: either the most
+        recent ones, or those with the largest posterior variance under the
+        current hyperparameters. The root mean squared error, per output, of
+        predicting the dropped transitions from the kept ones is stored in
+        self.selection_error.
+        '''
+        self.selection_error = None
+        if self.max_datapoints is None or X.shape[0] <= self.max_datapoints:
+            return X, Y
+        lengthscales, variances, noises = self.hyperparameter_values()
+        if self.selection == 'recency':
+            active = select_by_recency(X, self.max_datapoints)
+        elif self.selection == 'variance':
+            active = select_by_variance(X, lengthscales, variances, noises, self.max_datapoints)
+        else:
+            raise ValueError('Unknown data selection method: %s' % self.selection)
+        self.selection_error = prediction_error(X, Y, active, lengthscales, variances, noises)
+        if self.normalize:
+            self.selection_error = self.selection_error * self.output_scale
+        return X[active], Y[active]
+
+    def model_data(self, X, Y):
+        '''
+        Transitions in the units, and with the inputs, the models are fitted to
+        '''
+        if self.normalize:
+            X, Y = self.normalize_data(X, Y)
+        if self.active_dims is not None:
+            X = X[:, self.active_dims]
+        return X, Y
+
+    def normalize_data(self, X, Y):
+        return (X - self.input_mean) / self.input_scale, (Y - self.output_mean) / self.output_scale
 
-    def optimize(self, restarts=1):
+    def hyperparameter_values(self):
+        if not hasattr(self, 'models'):
+            # Before the models are created, use their initial values
+            return np.ones((self.num_outputs, self.num_dims)), \
+                np.ones(self.num_outputs), np.ones(self.num_outputs)
+        lengthscales = np.stack(
+            [model.kern.lengthscales.value * np.ones(self.num_dims) for model in self.models])
+        variances = np.array([model.kern.variance.value for model in self.models])
+        noises = np.array([model.likelihood.variance.value for model in self.models])
+        return lengthscales, variances, noises
+
+    def set_hyperparameters(self, lengthscales, variances, noises):
+        for model, l, v, n in zip(self.models, lengthscales, variances, noises):
+            model.kern.lengthscales.assign(l)
+            model.kern.variance.assign(v)
+            if model.likelihood.variance.trainable:
+                model.likelihood.variance.assign(n)
+
+    def optimize(self, restarts=1, maxiter=1000, scheduler=None, warm_start_iter=None,
+                 restart_threshold=0.1):
+        '''
+        Fits the hyperparameters, with random restarts.
+        warm_start_iter: after the first call, refit each model with this many
+            iterations from its current hyperparameters, and only run the
+            restarts if its log marginal likelihood per datapoint has dropped
+            by more than restart_threshold since the last call. None always
+            runs the restarts.
+        '''
+        deadline = scheduler.deadline('models') if scheduler is not None else None
+        warm_start = warm_start_iter is not None and self.log_likelihoods is not None
         if len(self.optimizers) == 0:  # This is the first call to optimize();
             for model in self.models:
                 # Create an gpflow.train.ScipyOptimizer object for every model embedded in mgpr
                 optimizer = gpflow.train.ScipyOptimizer(method='L-BFGS-B')
-                optimizer.minimize(model)
+                if deadline is None:
+                    optimizer.minimize(model, maxiter=maxiter)
+                else:
+                    # A single iteration builds it, the rest keeps to the deadline
+                    optimizer.minimize(model, maxiter=0)
+                    run_optimizer(optimizer, maxiter, deadline=deadline)
                 self.optimizers.append(optimizer)
-                restarts -= 1
-
-        for model, optimizer in zip(self.models, self.optimizers):
-            session = optimizer._model.enquire_session(None)
-            best_parameters = model.read_values(session=session)
-            best_likelihood = model.compute_log_likelihood()
-            for restart in range(restarts):
-                randomize(model)
-                optimizer._optimizer.minimize(session=session,
-                            feed_dict=optimizer._gen_feed_dict(optimizer._model, None),
-                            step_callback=None)
-                likelihood = model.compute_log_likelihood()
-                if likelihood > best_likelihood:
-                    best_parameters = model.read_values(session=session)
-                    best_likelihood = likelihood
-            model.assign(best_parameters)
+            restarts -= 1
+
+        for i, (model, optimizer) in enumerate(zip(self.models, self.optimizers)):
+            if warm_start:
+                run_optimizer(optimizer, warm_start_iter)
+                log_likelihood = model.compute_log_likelihood() / self.num_datapoints
+                if log_likelihood >= self.log_likelihoods[i] - restart_threshold:
+                    continue
+            optimize_with_restarts(optimizer,
+                objective=model.compute_log_likelihood,
+                randomize=lambda: randomize(model),
+                restarts=restarts, maxiter=maxiter,
+                scheduler=scheduler, deadline=deadline)
+        self.log_likelihoods = [model.compute_log_likelihood() / self.num_datapoints
+                                for model in self.models]
+        self.update_factorizations()
+
+    def prune_inputs(self, threshold=0.05):
+        '''
+        Drops the inputs that none of the outputs depends on, judging by the
+        learned lengthscales: an input is irrelevant to an output when the
+        spread of the data along it is below threshold times its lengthscale.
+        Predictions then run on the remaining inputs only. The models are
+        rebuilt with the current hyperparameters, so anything built on them
+        has to be rebuilt too, see PILCO.prune_inputs.
+        OUT: indices of the inputs kept
+        '''
+        active = self.active_dims if self.active_dims is not None else np.arange(self.input_dim)
+        X = self.models[0].X.value
+        Y = np.hstack([model.Y.value for model in self.models])
+        lengthscales, _, _ = self.hyperparameter_values()
+        relevance = X.std(0) / lengthscales
+        keep = np.any(relevance >= threshold, 0)
+        if np.all(keep):
+            return active
+        if not np.any(keep):
+            keep[np.argmax(np.max(relevance, 0))] = True
+
+        self.active_dims = active[keep]
+        self.num_dims = len(self.active_dims)
+        old_models = self.models
+        self.create_models(X[:, keep], Y)
+        for model, old_model, l in zip(self.models, old_models, lengthscales):
+            model.kern.lengthscales.assign(l[keep])
+            model.kern.variance.assign(old_model.kern.variance.value)
+            model.likelihood.variance.assign(old_model.likelihood.variance.value)
+            if hasattr(model, 'feature'):
+                model.feature.Z.assign(old_model.feature.Z.value[:, keep])
+        # The graphs of autoflow methods were built on the old models
+        gpflow.core.AutoFlow.clear_autoflow(self)
+        self.optimizers = []
+        self.log_likelihoods = None
+        self.update_factorizations()
+        return self.active_dims
+
+    def update_factorizations(self):
+        '''
+        Refreshes the cached factorizations (with cache_factorizations), which
+        optimize and set_XY do. Has to be called after any other change of the
+        hyperparameters or of the data.
+        '''
+        if not self.cache_factorizations:
+            return
+        for holder, value in zip(self.factorization_cache, self.compute_factorizations()):
+            holder.assign(value)
+
+    def rollout_factorizations(self):
+        '''
+        The factorizations for predictions: the cached ones, if any, which
+        are shared by everything that predicts with this model.
+        '''
+        if not self.cache_factorizations:
+            return self.calculate_factorizations()
+        return tuple(holder.parameter_tensor for holder in self.factorization_cache)
+
+    @shared_autoflow()
+    def compute_factorizations(self):
+        iK, beta = self.calculate_factorizations()
+        return iK, beta, self.centralized_input(0.0)
+
+    def export(self):
+        '''
+        Hyperparameters and factorizations as numpy arrays, the arguments of
+        numpy_backend.MGPR
+        '''
+        if self.solver == 'cg':
+            raise ValueError('numpy_backend needs the inverse covariances, '
+                             'which the cg solver never forms')
+        iK, beta, X = self.compute_factorizations()
+        lengthscales, variance, noise = self.hyperparameter_values()
+        params = dict(X=X, lengthscales=lengthscales, variance=variance,
+                      iK=iK, beta=beta, noise=noise)
+        if self.normalize:
+            params.update(input_mean=self.input_mean, input_scale=self.input_scale,
+                          output_mean=self.output_mean, output_scale=self.output_scale)
+        if self.active_dims is not None:
+            params.update(active_dims=self.active_dims, input_dim=self.input_dim)
+        return params
+
+    @shared_autoflow((float_type,[None, None]), (float_type,[None, None]))
+    def compute_prediction(self, m, s):
+        return self.predict_on_noisy_inputs(m, s)
 
     def predict_on_noisy_inputs(self, m, s):
         iK, beta = self.calculate_factorizations()
-        return self.predict_given_factorizations(m, s, iK, beta)
+        return self.predict_gaussian(m, s, iK, beta)
+
+    def predict_gaussian(self, m, s, iK, beta, index=None):
+        '''
+        Prediction at a Gaussian input with the approximation in self.propagation.
+        All of them return the same (M, S, V) as predict_given_factorizations.
+        index: model_index(), to share between predictions
+        '''
+        if self.normalize:
+            m = (m - self.input_mean) / self.input_scale
+            s = s / (self.input_scale[:, None] * self.input_scale[None, :])
+        if self.active_dims is not None:
+            m = tf.gather(m, self.active_dims, axis=1)
+            s = tf.gather(tf.gather(s, self.active_dims, axis=0), self.active_dims, axis=1)
+        if self.propagation == 'moment_matching':
+            M, S, V = self.predict_given_factorizations(m, s, iK, beta, index)
+        elif self.propagation == 'unscented':
+            M, S, V = self.predict_unscented(m, s, iK, beta)
+        elif self.propagation == 'linearized':
+            M, S, V = self.predict_linearized(m, s, iK, beta)
+        else:
+            raise ValueError('Unknown propagation method: %s' % self.propagation)
+        if self.active_dims is not None:
+            # The outputs depend on the other inputs only through their
+            # correlation with the active ones, so the rows of
+            # inv(s)*input-output covariance for them are zero
+            V = tf.scatter_nd(self.active_dims[:, None], V, [self.input_dim, self.num_outputs])
+        if self.normalize:
+            # The maps are affine, so the moments transform exactly
+            M = M * self.output_scale + self.output_mean
+            S = S * (self.output_scale[:, None] * self.output_scale[None, :])
+            V = V * self.output_scale[None, :] / self.input_scale[:, None]
+        return M, S, V
 
     def calculate_factorizations(self):
+        '''
+        OUT: inverse covariances iK [E, N, N] and beta = inv(K) Y [E, N]. With
+             the cg solver the first is instead the covariances with the
+             factors of their preconditioners appended [E, N, N + k], which
+             inverse_quadratic solves with.
+        '''
+        if self.solver == 'cg':
+            N = tf.shape(self.X)[0]
+            K = self.K(self.X)
+            L = iterative.pivoted_cholesky(K)
+            K = K + self.noise[:, None, None] * tf.eye(N, dtype=float_type)
+            precondition = iterative.preconditioner(L, self.noise)[0]
+            beta = iterative.conjugate_gradient(K, tf.transpose(self.Y)[:, :, None],
+                                                precondition)[0][:, :, 0]
+            return tf.concat([K, L], -1), beta
         K = self.K(self.X)
         batched_eye = tf.eye(tf.shape(self.X)[0], batch_shape=[self.num_outputs], dtype=float_type)
         L = tf.cholesky(K + self.noise[:, None, None]*batched_eye)
@@ -78,21 +344,41 @@ class MGPR(gpflow.Parameterized):
         beta = tf.cholesky_solve(L, Y_)[:, :, 0]
         return iK, beta
 
-    def predict_given_factorizations(self, m, s, iK, beta):
+    def model_index(self):
+        '''
+        The terms of moment matching that only depend on the data and the
+        hyperparameters. A rollout computes them once, rather than at every
+        step, see predict_given_factorizations.
+        '''
+        X = self.centralized_input(0.0)
+        iL = 1/self.lengthscales
+        iL2 = tf.square(iL)
+        return dict(
+            X=X, iL=iL, iL2=iL2,
+            X_iL=X[None, :, :] * iL[:, None, :],
+            X_iL2=X[None, :, :] * iL2[:, None, :],
+            # Lengthscales of the products of the kernels of pairs of outputs
+            pair_iL2=iL2[None, :, :] + iL2[:, None, :],
+            log_variance=tf.log(self.variance))
+
+    def predict_given_factorizations(self, m, s, iK, beta, index=None):
         """
         Approximate GP regression at noisy inputs via moment matching
         IN: mean (m) (row vector) and (s) variance of the state
         OUT: mean (M) (row vector), variance (S) of the action
              and inv(s)*input-ouputcovariance
         """
+        if index is None:
+            index = self.model_index()
+        E = self.num_outputs
+        iL, iL2 = index['iL'], index['iL2']
 
-        s = tf.tile(s[None, None, :, :], [self.num_outputs, self.num_outputs, 1, 1])
-        inp = tf.tile(self.centralized_input(m)[None, :, :], [self.num_outputs, 1, 1])
+        s = tf.tile(s[None, None, :, :], [E, E, 1, 1])
+        # The inputs centered at m, scaled by the lengthscales
+        iN = index['X_iL'] - m * iL[:, None, :]
 
         # Calculate M and V: mean and inv(s) times input-output covariance
-        iL = tf.matrix_diag(1/self.lengthscales)
-        iN = inp @ iL
-        B = iL @ s[0, ...] @ iL + tf.eye(self.num_dims, dtype=float_type)
+        B = iL[:, :, None] * s[0, ...] * iL[:, None, :] + tf.eye(self.num_dims, dtype=float_type)
 
         # Redefine iN as in^T and t --> t^T
         # B is symmetric so its the same
@@ -101,28 +387,27 @@ class MGPR(gpflow.Parameterized):
             )
 
         lb = tf.exp(-tf.reduce_sum(iN * t, -1)/2) * beta
-        tiL = t @ iL
+        tiL = t * iL[:, None, :]
         c = self.variance / tf.sqrt(tf.linalg.det(B))
 
         M = (tf.reduce_sum(lb, -1) * c)[:, None]
         V = tf.matmul(tiL, lb[:, :, None], adjoint_a=True)[..., 0] * c[:, None]
 
         # Calculate S: Predictive Covariance
-        R = s @ tf.matrix_diag(
-                1/tf.square(self.lengthscales[None, :, :]) +
-                1/tf.square(self.lengthscales[:, None, :])
-            ) + tf.eye(self.num_dims, dtype=float_type)
+        R = s * index['pair_iL2'][:, :, None, :] + tf.eye(self.num_dims, dtype=float_type)
 
         # TODO: change this block according to the PR of tensorflow. Maybe move it into a function?
-        X = inp[None, :, :, :]/tf.square(self.lengthscales[:, None, None, :])
-        X2 = -inp[:, None, :, :]/tf.square(self.lengthscales[None, :, None, :])
+        # The inputs centered at m, scaled by the squared lengthscales
+        Xd = index['X_iL2'] - m * iL2[:, None, :]
+        X = tf.tile(Xd[:, None, :, :], [1, E, 1, 1])
+        X2 = tf.tile(-Xd[None, :, :, :], [E, 1, 1, 1])
         Q = tf.matrix_solve(R, s)/2
         Xs = tf.reduce_sum(X @ Q * X, -1)
         X2s = tf.reduce_sum(X2 @ Q * X2, -1)
         maha = -2 * tf.matmul(X @ Q, X2, adjoint_b=True) + \
             Xs[:, :, :, None] + X2s[:, :, None, :]
         #
-        k = tf.log(self.variance)[:, None] - \
+        k = index['log_variance'][:, None] - \
             tf.reduce_sum(tf.square(iN), -1)/2
         L = tf.exp(k[:, None, :, None] + k[None, :, None, :] + maha)
         S = (tf.tile(beta[:, None, None, :], [1, self.num_outputs, 1, 1])
@@ -130,14 +415,96 @@ class MGPR(gpflow.Parameterized):
                 tf.tile(beta[None, :, :, None], [self.num_outputs, 1, 1, 1])
             )[:, :, 0, 0]
 
-        diagL = tf.transpose(tf.linalg.diag_part(tf.transpose(L)))
-        S = S - tf.diag(tf.reduce_sum(tf.multiply(iK, diagL), [1, 2]))
-        S = S / tf.sqrt(tf.linalg.det(R))
+        if self.solver == 'cg':
+            # The expected posterior variance E[k(x)^T inv(K) k(x)] needs
+            # inv(K), in place of which it is taken at the sigma points of
+            # the unscented transform, one solve per point
+            points, weights, _ = self.sigma_points(m, s[0, 0])
+            uncertainty = self.inverse_quadratic(iK, self.K(points, index['X']))
+            S = S / tf.sqrt(tf.linalg.det(R)) - \
+                tf.diag(tf.reduce_sum(uncertainty * weights[:, 0], -1))
+        else:
+            diagL = tf.transpose(tf.linalg.diag_part(tf.transpose(L)))
+            S = S - tf.diag(tf.reduce_sum(tf.multiply(iK, diagL), [1, 2]))
+            S = S / tf.sqrt(tf.linalg.det(R))
         S = S + tf.diag(self.variance)
         S = S - M @ tf.transpose(M)
 
         return tf.transpose(M), S, tf.transpose(V)
 
+    def predict_at_points(self, x, iK, beta):
+        '''
+        Posterior mean and variance of the latent functions at deterministic inputs
+        IN: inputs x [P, D]
+        OUT: mean [P, E] and variance [P, E]
+        '''
+        # centralized_input(0) are the points the factorizations refer to:
+        # the training inputs, or the inducing inputs of the sparse model
+        k = self.K(x, self.centralized_input(0.0))
+        mean = tf.reduce_sum(k * beta[:, None, :], -1)
+        var = self.variance[:, None] - self.inverse_quadratic(iK, k)
+        return tf.transpose(mean), tf.transpose(var)
+
+    def inverse_quadratic(self, iK, k):
+        '''
+        k^T inv(K) k for each of the vectors k [E, P, N]
+        OUT: [E, P]
+        '''
+        if self.solver == 'cholesky':
+            return tf.reduce_sum((k @ iK) * k, -1)
+        N = tf.shape(iK)[1]
+        K, L = iK[:, :, :N], iK[:, :, N:]
+        w = iterative.conjugate_gradient(
+            K, tf.stop_gradient(tf.linalg.transpose(k)),
+            iterative.preconditioner(L, self.noise)[0])[0]
+        w = tf.linalg.transpose(tf.stop_gradient(w))
+        # Equal to k^T inv(K) k at the solution, with its gradient
+        return tf.reduce_sum(2 * w * k - w * (w @ K), -1)
+
+    def sigma_points(self, m, s, kappa=1.0):
+        '''
+        Sigma points [2D+1, D] of the unscented transform, with their weights
+        [2D+1, 1] and the Cholesky factor of s
+        '''
+        D = self.num_dims
+        L = tf.cholesky(s + gpflow.settings.jitter * tf.eye(D, dtype=float_type))
+        offsets = np.sqrt(D + kappa) * tf.transpose(L)
+        points = tf.concat([m, m + offsets, m - offsets], axis=0)
+        weights = tf.constant(
+            [kappa / (D + kappa)] + [1 / (2 * (D + kappa))] * (2 * D), float_type)[:, None]
+        return points, weights, L
+
+    def predict_unscented(self, m, s, iK, beta, kappa=1.0):
+        '''
+        Unscented transform: moments of the GP posterior means and variances
+        evaluated at 2D+1 sigma points of the input distribution
+        IN: mean (m) (row vector) and (s) variance of the state
+        OUT: mean (M) (row vector), variance (S) of the prediction
+             and inv(s)*input-ouputcovariance
+        '''
+        points, weights, L = self.sigma_points(m, s, kappa)
+        mean, var = self.predict_at_points(points, iK, beta)
+        M = tf.reduce_sum(weights * mean, 0, keepdims=True)
+        dev = mean - M
+        S = tf.matmul(weights * dev, dev, transpose_a=True) + \
+            tf.diag(tf.reduce_sum(weights * var, 0))
+        C = tf.matmul(weights * (points - m), dev, transpose_a=True)
+        return M, S, tf.cholesky_solve(L, C)
+
+    def predict_linearized(self, m, s, iK, beta):
+        '''
+        First order Taylor expansion of the posterior mean around m, plus the
+        posterior variance at m
+        IN: mean (m) (row vector) and (s) variance of the state
+        OUT: mean (M) (row vector), variance (S) of the prediction
+             and inv(s)*input-ouputcovariance
+        '''
+        mean, var = self.predict_at_points(m, iK, beta)
+        k = self.K(m, self.centralized_input(0.0))[:, 0, :]
+        J = (k * beta) @ self.centralized_input(m) / tf.square(self.lengthscales)
+        S = J @ s @ tf.transpose(J) + tf.diag(var[0])
+        return mean, S, tf.transpose(J)
+
     def centralized_input(self, m):
         return self.X - m
 
@@ -0,0 +1,106 @@
+import time
+import numpy as np
+import gpflow
+import tensorflow as tf
+
+from .smgpr import SMGPR
+from ..sessions import session_scope
+
+# Number of [E, E, P, P] tensors that moment matching keeps alive at once,
+# P being the number of training or inducing points
+LIVE_TENSORS = 4
+# Fewest inducing points considered
+MIN_INDUCING_POINTS = 10
+
+
+def affordable_points(num_outputs, memory_budget=None, time_budget=None, measured=None):
+    '''
+    Largest number of points, training or inducing, that a prediction of a
+    model with num_outputs outputs can use within the budgets. Both memory
+    and time grow with the square of the number of points.
+    memory_budget: bytes for the largest terms of moment matching
+    time_budget: seconds per prediction, extrapolated from measured
+    measured: (number of points, seconds) of a timed prediction, see time_prediction
+    '''
+    points = np.inf
+    if memory_budget is not None:
+        itemsize = np.dtype(gpflow.settings.float_type).itemsize
+        points = min(points, np.sqrt(memory_budget / (LIVE_TENSORS * itemsize * num_outputs**2)))
+    if time_budget is not None:
+        measured_points, seconds = measured
+        points = min(points, measured_points * np.sqrt(time_budget / seconds))
+    return points
+
+
+def time_prediction(mgpr, repeats=3):
+    '''
+    OUT: number of points the predictions of mgpr use, and the fastest of
+         `repeats` timed predictions at a Gaussian input, in seconds
+    '''
+    m = np.zeros((1, mgpr.input_dim))
+    s = 0.1 * np.eye(mgpr.input_dim)
+    mgpr.compute_prediction(m, s)  # Builds the graph
+    times = []
+    for _ in range(repeats):
+        start = time.time()
+        mgpr.compute_prediction(m, s)
+        times.append(time.time() - start)
+    points = getattr(mgpr, 'num_induced_points', mgpr.num_datapoints)
+    return points, min(times)
+
+
+def heldout_error(mgpr, X, Y):
+    '''
+    Root mean squared error of the posterior means of mgpr at X, per output,
+    in the units the models are fitted in
+    '''
+    X, Y = mgpr.model_data(X, Y)
+    return np.array([np.sqrt(np.mean(np.square(model.predict_f(X)[0][:, 0] - Y[:, i])))
+                     for i, model in enumerate(mgpr.models)])
+
+
+def select_model(X, Y, max_points, holdout=0.2, tolerance=0.05, maxiter=100,
+                 hyperparameters=None, **kwargs):
+    '''
+    The exact model if the data fit within max_points. Otherwise the sparse
+    model with the fewest inducing points, halving from max_points, whose
+    error on a random held-out fraction of the data is within `tolerance`
+    (relative, for every output) of that of max_points inducing points.
+    Every candidate is fitted: with the inducing points optimized from random
+    starts, fewer of them aren't necessarily worse. The candidates are built
+    in graphs of their own, dropped once fitted, and only the selected one is
+    built in the default graph, on all the data, with its fitted
+    hyperparameters and inducing points.
+    hyperparameters: initial (lengthscales, variances, noises) of the fits
+    kwargs: further arguments of the models
+    OUT: the selected SMGPR, None for the exact model
+    '''
+    if X.shape[0] <= max_points:
+        return None
+    test = np.random.rand(X.shape[0]) < holdout
+    candidates = []
+    M = int(max_points)
+    while M >= MIN_INDUCING_POINTS or not candidates:
+        candidates.append(M)
+        M //= 2
+    errors, fits = [], []
+    for M in candidates:
+        with tf.Session(graph=tf.Graph()) as session, session_scope(session):
+            # The cached factorizations only serve rollouts
+            model = SMGPR(X[~test], Y[~test], M, **dict(kwargs, cache_factorizations=False))
+            if hyperparameters is not None:
+                model.set_hyperparameters(*hyperparameters)
+            model.optimize(maxiter=maxiter)
+            errors.append(heldout_error(model, X[test], Y[test]))
+            fits.append((model.hyperparameter_values(),
+                         [m.feature.Z.value for m in model.models]))
+    within = [i for i, error in enumerate(errors)
+              if np.all(error <= (1 + tolerance) * errors[0])]
+    best = min(within, key=lambda i: candidates[i])
+    fitted_hyperparameters, inducing_points = fits[best]
+    model = SMGPR(X, Y, candidates[best], **kwargs)
+    model.set_hyperparameters(*fitted_hyperparameters)
+    for m, Z in zip(model.models, inducing_points):
+        m.feature.Z.assign(Z)
+    model.update_factorizations()
+    return model
@@ -1,28 +1,91 @@
 import numpy as np
 import tensorflow as tf
 import gpflow
-import pandas as pd
 import time
+import weakref
 
 from .mgpr import MGPR
 from .smgpr import SMGPR
+from .rffmgpr import RFFMGPR
+from . import model_selection
 from .. import controllers
 from .. import rewards
+from .. import numpy_backend
+from ..optimizers import optimize_with_restarts, run_optimizer, cross_entropy_method
+from ..sessions import in_session, session_scope
+from ..graph_cache import shared_autoflow
 
 float_type = gpflow.settings.dtypes.float_type
 
 
+def print_table(title, columns):
+    # pandas is optional, and only imported when there is something to print
+    print('---' + title + '---')
+    try:
+        import pandas as pd
+    except ImportError:
+        for name, values in columns.items():
+            print(name, np.array2string(values, precision=3))
+        return
+    pd.set_option('precision', 3)
+    print(pd.DataFrame(data=columns))
+
+
+def numpy_counterpart(reward):
+    # numpy_backend copy of a reward, from its export()
+    if isinstance(reward, rewards.CombinedRewards):
+        return numpy_backend.CombinedRewards(
+            [numpy_counterpart(r) for r in reward.base_rewards], reward.coefs)
+    return getattr(numpy_backend, type(reward).__name__)(**reward.export())
+
+
 class PILCO(gpflow.models.Model):
+    # The time budget of the optimisations, see graph_cache.structure_key
+    graph_independent = ('scheduler',)
+
     def __init__(self, X, Y, num_induced_points=None, horizon=30, controller=None,
-                reward=None, m_init=None, S_init=None, name=None):
+                reward=None, m_init=None, S_init=None, scheduler=None, jit=False, checkpoints=None,
+                max_datapoints=None, num_features=None, propagation='moment_matching',
+                session=None, mgpr=None, cache_factorizations=False,
+                normalize=False, solver='cholesky', max_variance=None, min_reward=None,
+                name=None):
         super(PILCO, self).__init__(name)
-        if not num_induced_points:
-            self.mgpr = MGPR(X, Y)
-        else:
-            self.mgpr = SMGPR(X, Y, num_induced_points)
+        # Session everything runs in, e.g. one from sessions.make_session with
+        # bounded threads, possibly shared with other instances. None for the
+        # default session at the time of each call.
+        self.session = session
+        # mgpr: a dynamics model shared with other PILCO objects, e.g. with
+        # other rewards, see share_model. A TensorFlow model (MGPR or a
+        # subclass): parallel.ShardedMGPR only works with evaluate_policies
+        # and mpc.MPC.
+        if mgpr is None:
+            with session_scope(session):
+                if num_induced_points:
+                    mgpr = SMGPR(X, Y, num_induced_points, max_datapoints=max_datapoints,
+                                 cache_factorizations=cache_factorizations, normalize=normalize)
+                elif num_features:
+                    mgpr = RFFMGPR(X, Y, num_features, max_datapoints=max_datapoints,
+                                   cache_factorizations=cache_factorizations, normalize=normalize)
+                else:
+                    mgpr = MGPR(X, Y, max_datapoints=max_datapoints,
+                                cache_factorizations=cache_factorizations, normalize=normalize,
+                                solver=solver)
+        self._set_model(mgpr)
         self.state_dim = Y.shape[1]
         self.control_dim = X.shape[1] - Y.shape[1]
+        # Solver of the full model, also when autotune_model switches to the
+        # sparse one in between
+        self.solver = solver
         self.horizon = horizon
+        # The number of steps of the objective is fed to the rollout, so that
+        # set_horizon doesn't rebuild it
+        self.rollout_horizon = gpflow.DataHolder(np.array(horizon, dtype=np.int32))
+        # A rollout stops once the trace of the state variance exceeds
+        # max_variance, or the expected reward of a step falls below
+        # min_reward. Its remaining steps are scored with the reward of the
+        # last state. None never stops.
+        self.max_variance = max_variance
+        self.min_reward = min_reward
 
         if controller is None:
             self.controller = controllers.LinearController(self.state_dim, self.control_dim)
@@ -43,18 +106,83 @@ class PILCO(gpflow.models.Model):
             self.m_init = m_init
             self.S_init = S_init
         self.optimizer = None
+        # Optional optimizers.Scheduler, spreading a time budget between
+        # optimize_models and optimize_policy
+        self.scheduler = scheduler
+        # Compile the rollout, and its gradient, with XLA. Has to be set before
+        # the model is built, i.e. at construction time.
+        self.jit = jit
+        # Number of segments the horizon is split into when backpropagating
+        # through it, see _checkpointed_predict. None keeps the whole rollout.
+        self.checkpoints = checkpoints
+        self._set_propagation(propagation)
+        self._rollout_cache = None
+
+    @property
+    def mgpr(self):
+        # The dynamics model. It is kept out of the tree of parameters of this
+        # object, so that sharing it doesn't reparent it, and rebuilding the
+        # objective of one of the objects sharing it doesn't rebuild it.
+        return self._mgpr
+
+    def _set_model(self, mgpr):
+        self._mgpr = mgpr
+        # The objects using the model, to keep in step when it changes
+        if not hasattr(mgpr, '_pilcos'):
+            mgpr._pilcos = weakref.WeakSet()
+        mgpr._pilcos.add(self)
+
+    def _sharers(self):
+        # This object and the others sharing its dynamics model
+        return list(self.mgpr._pilcos)
+
+    def enquire_session(self, session=None):
+        if session is None:
+            session = self.session
+        return super(PILCO, self).enquire_session(session)
+
+    def build(self):
+        # Also called by gpflow's AutoBuild right after __init__, i.e. outside
+        # the session_scope of the constructor
+        with session_scope(self.session):
+            super(PILCO, self).build()
 
     @gpflow.name_scope('likelihood')
     def _build_likelihood(self):
         # This is for tuning controller's parameters
-        reward = self.predict(self.m_init, self.S_init, self.horizon)[2]
+        m, s, reward = self.predict(self.m_init, self.S_init,
+                                    self.rollout_horizon.parameter_tensor)
+        # Fetched along with the reward to cache rollouts, see compute_rollout
+        self._rollout_tensors = [m, s, reward]
+        # The dynamics model and its GP models are not children of this
+        # object, their parameters and data are added separately
+        self._state_tensors = [p.parameter_tensor for p in self.parameters] + \
+            [p.parameter_tensor for p in self.mgpr.parameters] + \
+            [p.parameter_tensor for model in self.mgpr.models for p in model.parameters] + \
+            [model.X.parameter_tensor for model in self.mgpr.models] + \
+            [model.Y.parameter_tensor for model in self.mgpr.models] + \
+            [self.rollout_horizon.parameter_tensor]
+        self._rollout_cache = None
         return reward
 
-    def optimize_models(self, maxiter=200, restarts=1):
+    @in_session
+    def set_horizon(self, horizon):
+        '''
+        Number of steps of the rollouts of the objective, e.g. growing across
+        iterations with training.HorizonCurriculum. The optimizer is kept.
+        '''
+        self.horizon = horizon
+        self.rollout_horizon.assign(np.array(horizon, dtype=np.int32))
+
+    @in_session
+    def optimize_models(self, maxiter=200, restarts=1, warm_start_iter=None, restart_threshold=0.1):
         '''
-        Optimize GP models
+        Optimize GP models, see MGPR.optimize for warm-started refits
         '''
-        self.mgpr.optimize(restarts=restarts)
+        if self.scheduler is not None:
+            self.scheduler.start_iteration()
+        self.mgpr.optimize(restarts=restarts, maxiter=maxiter, scheduler=self.scheduler,
+                           warm_start_iter=warm_start_iter, restart_threshold=restart_threshold)
         # Print the resulting model parameters
         # ToDo: only do this if verbosity is large enough
         lengthscales = {}; variances = {}; noises = {};
@@ -65,88 +193,367 @@ class PILCO(gpflow.models.Model):
             noises['GP' + str(i)] = np.array([model.likelihood.variance.value])
             i += 1
         print('-----Learned models------')
-        pd.set_option('precision', 3)
-        print('---Lengthscales---')
-        print(pd.DataFrame(data=lengthscales))
-        print('---Variances---')
-        print(pd.DataFrame(data=variances))
-        print('---Noises---')
-        print(pd.DataFrame(data=noises))
+        print_table('Lengthscales', lengthscales)
+        print_table('Variances', variances)
+        print_table('Noises', noises)
 
+    @in_session
     def optimize_policy(self, maxiter=50, restarts=1):
         '''
         Optimize controller's parameter's
         '''
-        start = time.time()
+        if self.scheduler is not None:
+            deadline = self.scheduler.deadline('policy')
+        else:
+            deadline = None
+        cache_rollouts = self._minimize_kwargs()
         if not self.optimizer:
-            self.optimizer = gpflow.train.ScipyOptimizer(method="L-BFGS-B")
+            self.build_policy_optimizer()
             start = time.time()
-            self.optimizer.minimize(self, maxiter=maxiter)
+            run_optimizer(self.optimizer, maxiter, deadline=deadline, **cache_rollouts)
             end = time.time()
             print("Controller's optimization: done in %.1f seconds with reward=%.3f." % (end - start, self.compute_reward()))
             restarts -= 1
 
-        session = self.optimizer._model.enquire_session(None)
         if restarts > 0:
-            start = time.time()
-            self.optimizer._optimizer.minimize(session=session,
-                        feed_dict=self.optimizer._gen_feed_dict(self.optimizer._model, None),
-                        step_callback=None)
-            end = time.time()
+            run_optimizer(self.optimizer, maxiter, **cache_rollouts)
             restarts -= 1
-        best_parameters = self.read_values(session=session)
-        best_reward = self.compute_reward()
-        for restart in range(restarts):
-            self.controller.randomize()
-            start = time.time()
-            self.optimizer._optimizer.minimize(session=session,
-                        feed_dict=self.optimizer._gen_feed_dict(self.optimizer._model, None),
-                        step_callback=None)
-            end = time.time()
-            reward = self.compute_reward()
-            print("Controller's optimization: done in %.1f seconds with reward=%.3f." % (end - start, self.compute_reward()))
-            if reward > best_reward:
-                best_parameters = self.read_values(session=session)
-                best_reward = reward
+        optimize_with_restarts(self.optimizer,
+            objective=self.compute_reward,
+            randomize=self.controller.randomize,
+            restarts=restarts, maxiter=maxiter,
+            scheduler=self.scheduler, deadline=deadline,
+            message="Controller's optimization: done in %.1f seconds with reward=%.3f.",
+            minimize_kwargs=cache_rollouts)
+
+    @in_session
+    def build_policy_optimizer(self):
+        '''
+        Builds the L-BFGS-B optimizer of the policy, without running it. Done
+        by the first optimize_policy otherwise, but graph construction isn't
+        thread-safe, see training.optimize_policies.
+        '''
+        if self.optimizer:
+            return
+        self.optimizer = gpflow.train.ScipyOptimizer(method="L-BFGS-B")
+        # No iterations, only the graph of the optimizer and one evaluation
+        self.optimizer.minimize(self, maxiter=0)
 
-        self.assign(best_parameters)
+    def share_model(self, controller=None, reward=None, **kwargs):
+        '''
+        New PILCO object with another controller and reward (and any other
+        constructor argument, e.g. m_init and S_init) but the same dynamics
+        model, data, and session. Fitting the model through any of them
+        updates it for all, and set_propagation, prune_inputs and
+        autotune_model, which change the model, rebuild the objectives of all.
+        '''
+        kwargs.setdefault('horizon', self.horizon)
+        kwargs.setdefault('m_init', self.m_init)
+        kwargs.setdefault('S_init', self.S_init)
+        kwargs.setdefault('scheduler', self.scheduler)
+        kwargs.setdefault('session', self.session)
+        kwargs.setdefault('max_variance', self.max_variance)
+        kwargs.setdefault('min_reward', self.min_reward)
+        kwargs.setdefault('solver', self.solver)
+        X = np.zeros((1, self.state_dim + self.control_dim))
+        Y = np.zeros((1, self.state_dim))
+        return PILCO(X, Y, controller=controller, reward=reward, mgpr=self.mgpr,
+                     propagation=self.propagation, **kwargs)
+
+    @in_session
+    def optimize_policy_population(self, iterations=20, population_size=64, num_elites=8,
+                                   sigma=0.5, polish=0, maxiter=50):
+        '''
+        Gradient-free policy search with the cross-entropy method, over the
+        unconstrained values of the controller's trainable parameters. Every
+        population is evaluated in a single batched rollout, see
+        evaluate_policies. Then the `polish` best controllers of the last
+        population are refined with L-BFGS-B, keeping the best of them.
+        '''
+        # The dynamics model is fixed during the search, export it once (and
+        # fail before anything else if it can't be)
+        mgpr = numpy_backend.MGPR(**self.mgpr.export())
+        if self.scheduler is not None:
+            deadline = self.scheduler.deadline('policy')
+        else:
+            deadline = None
+        start = time.time()
+        best, value, elites = cross_entropy_method(
+            lambda population: self.evaluate_policies(population, mgpr),
+            self._policy_vector(), sigma, population_size=population_size,
+            num_elites=num_elites, iterations=iterations, deadline=deadline)
+        self._set_policy_vector(best)
+        print("Controller's population search: done in %.1f seconds with reward=%.3f." %
+              (time.time() - start, self.compute_reward()))
 
-        end = time.time()
+        if polish > 0:
+            cache_rollouts = self._minimize_kwargs()
+            if not self.optimizer:
+                self.build_policy_optimizer()
+            run_optimizer(self.optimizer, maxiter, **cache_rollouts)
+            others = iter(elites[1:polish])
+            optimize_with_restarts(self.optimizer,
+                objective=self.compute_reward,
+                randomize=lambda: self._set_policy_vector(next(others)),
+                restarts=min(polish, len(elites)) - 1, maxiter=maxiter,
+                scheduler=self.scheduler, deadline=deadline,
+                message="Controller's optimization: done in %.1f seconds with reward=%.3f.",
+                minimize_kwargs=cache_rollouts)
 
-    @gpflow.autoflow((float_type,[None, None]))
+    @in_session
+    def evaluate_policies(self, population, mgpr=None):
+        '''
+        Total rewards of a population of controllers [P], one per row of the
+        given unconstrained parameter vectors [P, n] (as _policy_vector),
+        computed with numpy_backend in a single rollout batched over the
+        population. Propagation is always by moment matching, and the dynamics
+        model has to support export() (i.e. SMGPR, or MGPR with the cholesky
+        solver).
+        mgpr: the numpy_backend.MGPR of the dynamics model, exported here if
+            None, or another model with its predict_on_noisy_inputs, e.g. a
+            parallel.ShardedMGPR for data too large for the exact model
+        '''
+        if mgpr is None:
+            mgpr = numpy_backend.MGPR(**self.mgpr.export())
+        parameters = list(self.controller.trainable_parameters)
+        sizes = [np.size(p.value) for p in parameters]
+        chunks = np.split(population, np.cumsum(sizes)[:-1], axis=1)
+        values = {p.pathname: p.transform.forward(c).reshape((-1,) + np.shape(p.value))
+                  for p, c in zip(parameters, chunks)}
+        controller = getattr(numpy_backend, type(self.controller).__name__)(
+            **self.controller.export_population(values))
+        np_pilco = numpy_backend.PILCO(mgpr, controller, numpy_counterpart(self.reward),
+                                       self.max_variance, self.min_reward)
+        P = population.shape[0]
+        m = np.tile(self.m_init, [P, 1])
+        s = np.tile(self.S_init[None], [P, 1, 1])
+        return np_pilco.predict(m, s, self.horizon)[2]
+
+    def _policy_vector(self):
+        return np.concatenate([p.transform.backward(p.value).ravel()
+                               for p in self.controller.trainable_parameters])
+
+    def _set_policy_vector(self, vector):
+        parameters = list(self.controller.trainable_parameters)
+        sizes = [np.size(p.value) for p in parameters]
+        for p, c in zip(parameters, np.split(vector, np.cumsum(sizes)[:-1])):
+            p.assign(p.transform.forward(c).reshape(np.shape(p.value)))
+
+    def _minimize_kwargs(self):
+        # Every evaluation of the optimizer also fills the rollout cache, so
+        # that compute_reward() at the optimum doesn't need a new rollout
+        return dict(fetches=self._rollout_tensors + self._state_tensors,
+                    loss_callback=self._cache_rollout)
+
+    @in_session
+    def set_propagation(self, propagation):
+        '''
+        Switches the approximation used to propagate the state distribution
+        ('moment_matching', 'unscented' or 'linearized') and rebuilds the
+        objective, e.g. to refine with exact moment matching a policy found
+        with a cheaper approximation. The approximation is a setting of the
+        dynamics model, the objects sharing it switch as well.
+        '''
+        for pilco in self._sharers():
+            pilco._set_propagation(propagation)
+            pilco._rebuild()
+
+    @in_session
+    def prune_inputs(self, threshold=0.05):
+        '''
+        Drops the state and control dimensions the dynamics don't depend on
+        from the model, see MGPR.prune_inputs, and rebuilds the objectives of
+        the objects using it.
+        OUT: indices of the inputs kept
+        '''
+        active_dims = self.mgpr.prune_inputs(threshold)
+        for pilco in self._sharers():
+            pilco._rebuild()
+        return active_dims
+
+    @in_session
+    def autotune_model(self, X, Y, memory_budget=None, time_budget=None, **kwargs):
+        '''
+        Sets the data of the dynamics model, switching between the full and
+        the sparse model, and choosing the number of inducing points, so that
+        predictions stay within the budgets, see model_selection. A sparse
+        model is installed as fitted by select_model, an exact one with the
+        hyperparameters of the current model.
+        memory_budget: bytes for the largest terms of moment matching
+        time_budget: seconds per one-step prediction, extrapolated from the
+            current model
+        kwargs: passed to model_selection.select_model
+        OUT: number of inducing points, None for the full model
+        '''
+        measured = None
+        if time_budget is not None:
+            measured = model_selection.time_prediction(self.mgpr)
+        max_points = model_selection.affordable_points(self.state_dim, memory_budget,
+                                                       time_budget, measured)
+        # The new models, and the candidates of select_model, keep the inputs
+        # (see prune_inputs) and the settings of the current one, and start
+        # from its fitted hyperparameters
+        settings = dict(max_datapoints=self.mgpr.max_datapoints, selection=self.mgpr.selection,
+                        normalize=self.mgpr.normalize, active_dims=self.mgpr.active_dims,
+                        cache_factorizations=hasattr(self.mgpr, 'factorization_cache'))
+        hyperparameters = self.mgpr.hyperparameter_values()
+        if max_points >= min(X.shape[0], self.mgpr.max_datapoints or np.inf):
+            mgpr = None
+        else:
+            mgpr = model_selection.select_model(X, Y, int(max_points),
+                hyperparameters=hyperparameters, **dict(settings, **kwargs))
+        if mgpr is None:
+            # The exact model stays, with the new data
+            if getattr(self.mgpr, 'num_induced_points', None) is None:
+                self.mgpr.set_XY(X, Y)
+                return None
+            mgpr = MGPR(X, Y, solver=self.solver, **settings)
+            mgpr.set_hyperparameters(*hyperparameters)
+            mgpr.update_factorizations()
+        mgpr.propagation = self.mgpr.propagation
+        # The objects sharing the model switch to the new one as well
+        for pilco in self._sharers():
+            pilco._rebuild(mgpr)
+        return getattr(mgpr, 'num_induced_points', None)
+
+    def _rebuild(self, mgpr=None):
+        session = self.enquire_session()
+        self.anchor(session)
+        self.clear()
+        if mgpr is not None:
+            self._set_model(mgpr)
+        self.compile(session)
+        self._rollout_cache = None
+        # The optimizer refers to the tensors of the previous graph
+        self.optimizer = None
+
+    def _set_propagation(self, propagation):
+        self.propagation = propagation
+        self.mgpr.propagation = propagation
+        # The RBF controller shares the prediction code of the dynamics model
+        if isinstance(self.controller, MGPR):
+            self.controller.propagation = propagation
+
+    @in_session
+    @shared_autoflow((float_type,[None, None]))
     def compute_action(self, x_m):
         return self.controller.compute_action(x_m, tf.zeros([self.state_dim, self.state_dim], float_type))[0]
 
     def predict(self, m_x, s_x, n):
+        if self.jit:
+            # Ops that XLA cannot compile are left to the default executor,
+            # the rest of the loop is clustered into fused kernels.
+            with tf.xla.experimental.jit_scope():
+                return self._predict(m_x, s_x, n)
+        return self._predict(m_x, s_x, n)
+
+    def _predict(self, m_x, s_x, n):
+        if self.checkpoints:
+            return self._checkpointed_predict(m_x, s_x, n)
+        return self._rollout(m_x, s_x, n)
+
+    def _rollout(self, m_x, s_x, n):
+        # The factorizations, the model index and the weights of the
+        # controller don't depend on the state, compute them once
+        factorizations = self.mgpr.rollout_factorizations()
+        index = self.mgpr.model_index()
+        controller_terms = self.controller.rollout_terms()
+        # The reward of the current state is carried along, so that the
+        # condition and the body share it
         loop_vars = [
             tf.constant(0, tf.int32),
             m_x,
             s_x,
+            self.reward.compute_reward(m_x, s_x)[0],
             tf.constant([[0]], float_type)
         ]
 
-        _, m_x, s_x, reward = tf.while_loop(
+        def step(j, m_x, s_x, r, reward):
+            m_x, s_x = self.propagate(m_x, s_x, factorizations, index, controller_terms)
+            return [j + 1, m_x, s_x, self.reward.compute_reward(m_x, s_x)[0], reward + r]
+
+        j, m_x, s_x, r, reward = tf.while_loop(
             # Termination condition
-            lambda j, m_x, s_x, reward: j < n,
+            lambda j, m_x, s_x, r, reward: tf.logical_and(
+                j < n, tf.logical_not(self._saturated(s_x, r))),
             # Body function
-            lambda j, m_x, s_x, reward: (
-                j + 1,
-                *self.propagate(m_x, s_x),
-                tf.add(reward, self.reward.compute_reward(m_x, s_x)[0])
-            ), loop_vars
+            step, loop_vars,
+            # Needed for the gradient of the loop with XLA
+            maximum_iterations=tf.reshape(n, [])
         )
+        if self.max_variance is not None or self.min_reward is not None:
+            # The remaining steps are scored with the reward of the last state
+            reward = reward + tf.cast(n - j, float_type) * r
 
         return m_x, s_x, reward
 
-    def propagate(self, m_x, s_x):
-        m_u, s_u, c_xu = self.controller.compute_action(m_x, s_x)
+    def _saturated(self, s_x, r):
+        # Whether the predictions of the rollout carry no more signal
+        saturated = tf.constant(False)
+        if self.max_variance is not None:
+            saturated = tf.logical_or(saturated, tf.trace(s_x) > self.max_variance)
+        if self.min_reward is not None:
+            saturated = tf.logical_or(saturated, tf.reduce_all(r < self.min_reward))
+        return saturated
+
+    def _checkpointed_predict(self, m_x, s_x, n):
+        '''
+        Rollout whose gradient is obtained by recomputing the horizon one
+        segment at a time, in reverse, keeping only the states at the segment
+        boundaries. Peak memory then grows with the segment length rather than
+        with the horizon. Only the returned reward carries gradients, w.r.t.
+        the trainable parameters and the initial state.
+        '''
+        segment = (n + self.checkpoints - 1) // self.checkpoints
+        steps = [tf.clip_by_value(n - k * segment, 0, segment) for k in range(self.checkpoints)]
+
+        # Forward pass. No gradients are taken through these loops, so none of
+        # their intermediate tensors are kept.
+        states = [(m_x, s_x)]
+        rewards = []
+        for k in range(self.checkpoints):
+            m, s, reward = self._rollout(
+                tf.stop_gradient(states[k][0]), tf.stop_gradient(states[k][1]), steps[k])
+            states.append((m, s))
+            rewards.append(reward)
+
+        # Backward pass, one recomputed segment at a time. The control
+        # dependencies stop a segment from being recomputed before the
+        # adjoints of the following one are available.
+        params = self.trainable_tensors
+        a_m = tf.zeros_like(states[-1][0])
+        a_s = tf.zeros_like(states[-1][1])
+        param_grads = [tf.zeros_like(p) for p in params]
+        for k in reversed(range(self.checkpoints)):
+            with tf.control_dependencies([a_m, a_s]):
+                m_in = tf.stop_gradient(states[k][0])
+                s_in = tf.stop_gradient(states[k][1])
+            m_out, s_out, reward = self._rollout(m_in, s_in, steps[k])
+            xs = [m_in, s_in] + params
+            grads = tf.gradients([reward, m_out, s_out], xs,
+                                 grad_ys=[tf.ones_like(reward), a_m, a_s])
+            grads = [tf.zeros_like(x) if g is None else g for g, x in zip(grads, xs)]
+            a_m, a_s = grads[0], grads[1]
+            param_grads = [pg + g for pg, g in zip(param_grads, grads[2:])]
+
+        # Surrogate whose value is zero and whose gradient is the one above
+        xs = [m_x, s_x] + params
+        gs = [a_m, a_s] + param_grads
+        surrogate = tf.add_n([tf.reduce_sum(tf.stop_gradient(g) * x) for g, x in zip(gs, xs)])
+        reward = tf.stop_gradient(tf.add_n(rewards)) + surrogate - tf.stop_gradient(surrogate)
+        return states[-1][0], states[-1][1], reward
+
+    def propagate(self, m_x, s_x, factorizations=None, index=None, controller_terms=None):
+        m_u, s_u, c_xu = self.controller.compute_action(m_x, s_x, **(controller_terms or {}))
 
         m = tf.concat([m_x, m_u], axis=1)
         s1 = tf.concat([s_x, s_x@c_xu], axis=1)
         s2 = tf.concat([tf.transpose(s_x@c_xu), s_u], axis=1)
         s = tf.concat([s1, s2], axis=0)
 
-        M_dx, S_dx, C_dx = self.mgpr.predict_on_noisy_inputs(m, s)
+        if factorizations is None:
+            factorizations = self.mgpr.rollout_factorizations()
+        M_dx, S_dx, C_dx = self.mgpr.predict_gaussian(m, s, *factorizations, index=index)
         M_x = M_dx + m_x
         #TODO: cleanup the following line
         S_x = S_dx + s_x + s1@C_dx + tf.matmul(C_dx, s1, transpose_a=True, transpose_b=True)
@@ -155,6 +562,28 @@ class PILCO(gpflow.models.Model):
         M_x.set_shape([1, self.state_dim]); S_x.set_shape([self.state_dim, self.state_dim])
         return M_x, S_x
 
-    @gpflow.autoflow()
+    @in_session
     def compute_reward(self):
-        return self._build_likelihood()
+        return self.compute_rollout()[2]
+
+    @in_session
+    def compute_rollout(self):
+        '''
+        Mean and variance of the final state and the total reward of a
+        rollout from (m_init, S_init). The last rollout, whether computed here
+        or evaluated by the policy optimizer, is reused for as long as the
+        parameters and the data are unchanged, whatever changed them
+        (assign, randomize, set_XY or an optimizer).
+        '''
+        session = self.enquire_session()
+        state = session.run(self._state_tensors, feed_dict=self.feeds)
+        if self._rollout_cache is not None:
+            cached_state, rollout = self._rollout_cache
+            if all(np.array_equal(a, b) for a, b in zip(cached_state, state)):
+                return rollout
+        rollout = session.run(self._rollout_tensors, feed_dict=self.feeds)
+        self._rollout_cache = (state, rollout)
+        return rollout
+
+    def _cache_rollout(self, *values):
+        self._rollout_cache = (values[3:], list(values[:3]))
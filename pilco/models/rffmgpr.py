@@ -0,0 +1,189 @@
+import gpflow
+import tensorflow as tf
+import numpy as np
+
+from .mgpr import MGPR
+
+float_type = gpflow.settings.dtypes.float_type
+
+
+class RFFGPR(gpflow.models.GPModel):
+    '''
+    Bayesian linear regression on random Fourier features of an RBF kernel:
+        phi(x) = sqrt(2 * variance / F) * cos(directions @ (x / lengthscales) + phases)
+    with directions ~ N(0, I) and phases ~ U(0, 2*pi) drawn once, so that
+    lengthscales and variance remain trainable hyperparameters.
+    Training costs O(N*F^2) instead of O(N^3).
+    '''
+    def __init__(self, X, Y, kern, num_features, name=None):
+        likelihood = gpflow.likelihoods.Gaussian()
+        gpflow.models.GPModel.__init__(self, X, Y, kern, likelihood, None, name=name)
+        self.num_features = num_features
+        self.directions = np.random.randn(num_features, X.shape[1])
+        self.phases = 2 * np.pi * np.random.rand(num_features)
+
+    @gpflow.params_as_tensors
+    def _build_features(self, X):
+        omega = tf.constant(self.directions, float_type) / self.kern.lengthscales
+        return tf.sqrt(2 * self.kern.variance / self.num_features) * \
+            tf.cos(tf.matmul(X, omega, transpose_b=True) + self.phases)
+
+    @gpflow.params_as_tensors
+    def _build_factorization(self):
+        Phi = self._build_features(self.X)
+        A = tf.matmul(Phi, Phi, transpose_a=True) + \
+            self.likelihood.variance * tf.eye(self.num_features, dtype=float_type)
+        return Phi, tf.cholesky(A)
+
+    @gpflow.name_scope('likelihood')
+    @gpflow.params_as_tensors
+    def _build_likelihood(self):
+        Phi, L = self._build_factorization()
+        N = tf.cast(tf.shape(self.X)[0], float_type)
+        noise = self.likelihood.variance
+        c = tf.matrix_triangular_solve(L, tf.matmul(Phi, self.Y, transpose_a=True))
+        return -(tf.reduce_sum(tf.square(self.Y)) - tf.reduce_sum(tf.square(c))) / noise / 2 \
+            - (N - self.num_features) * tf.log(noise) / 2 \
+            - tf.reduce_sum(tf.log(tf.matrix_diag_part(L))) \
+            - N * np.log(2 * np.pi) / 2
+
+    @gpflow.name_scope('predict')
+    @gpflow.params_as_tensors
+    def _build_predict(self, Xnew, full_cov=False):
+        Phi, L = self._build_factorization()
+        phi = self._build_features(Xnew)
+        w = tf.cholesky_solve(L, tf.matmul(Phi, self.Y, transpose_a=True))
+        tmp = tf.matrix_triangular_solve(L, tf.transpose(phi))
+        num_latent = tf.shape(self.Y)[1]
+        if full_cov:
+            var = self.likelihood.variance * tf.matmul(tmp, tmp, transpose_a=True)
+            var = tf.tile(var[None, :, :], [num_latent, 1, 1])
+        else:
+            var = self.likelihood.variance * tf.reduce_sum(tf.square(tmp), 0)
+            var = tf.tile(var[:, None], [1, num_latent])
+        return phi @ w, var
+
+
+class RFFMGPR(MGPR):
+    '''
+    Multi-output model of random Fourier feature regressions, with closed form
+    moment matching at Gaussian inputs. A prediction costs O(F^2*E^2), for F
+    features per output, independently of the number of datapoints.
+    '''
+    def __init__(self, X, Y, num_features, name=None, max_datapoints=None,
+                 selection='variance', cache_factorizations=False, normalize=False,
+                 active_dims=None):
+        gpflow.Parameterized.__init__(self, name)
+        self.num_features = num_features
+        MGPR.__init__(self, X, Y, name, max_datapoints, selection, cache_factorizations,
+                      normalize, active_dims=active_dims)
+
+    def create_models(self, X, Y):
+        self.models = []
+        for i in range(self.num_outputs):
+            with gpflow.defer_build():
+                kern = gpflow.kernels.RBF(input_dim=X.shape[1], ARD=True)
+                kern.lengthscales.prior = gpflow.priors.Gamma(1,10)
+                kern.variance.prior = gpflow.priors.Gamma(1.5,2)
+                self.models.append(RFFGPR(X, Y[:, i:i+1], kern, self.num_features))
+            self.models[i].compile()
+
+    def calculate_factorizations(self):
+        '''
+        OUT: posterior covariance (Sigma) and mean (w) of the feature weights,
+             taking the place of iK and beta in predict_given_factorizations
+        '''
+        Phi = self.features(self.X)
+        batched_eye = tf.eye(self.num_features, batch_shape=[self.num_outputs], dtype=float_type)
+        L = tf.cholesky(tf.matmul(Phi, Phi, transpose_a=True) + self.noise[:, None, None]*batched_eye)
+        Y_ = tf.transpose(self.Y)[:, :, None]
+        w = tf.cholesky_solve(L, tf.matmul(Phi, Y_, transpose_a=True))[:, :, 0]
+        Sigma = self.noise[:, None, None] * tf.cholesky_solve(L, batched_eye)
+        return Sigma, w
+
+    def export(self):
+        raise TypeError('numpy_backend supports MGPR and SMGPR, not RFFMGPR')
+
+    def model_index(self):
+        # The features are drawn once, there is nothing left to precompute
+        return None
+
+    def predict_given_factorizations(self, m, s, Sigma, w, index=None):
+        '''
+        Moment matching of the feature expansion at a Gaussian input
+        IN: mean (m) (row vector) and (s) variance of the state
+        OUT: mean (M) (row vector), variance (S) of the prediction
+             and inv(s)*input-ouputcovariance
+        '''
+        E, F = self.num_outputs, self.num_features
+        omega = self.omega  # [E, F, D]
+        a = self.amplitudes
+
+        mu = tf.reduce_sum(omega * m[None, :, :], -1) + self.phases  # [E, F]
+        omega_s = tf.tensordot(omega, s, [[2], [0]])
+        v = tf.reduce_sum(omega_s * omega, -1)  # [E, F]
+
+        # Mean and inv(s) times input-output covariance
+        Ephi = a[:, None] * tf.exp(-v/2) * tf.cos(mu)
+        M = tf.reduce_sum(w * Ephi, -1)[:, None]
+        V = -tf.reduce_sum(
+            (a[:, None] * w * tf.exp(-v/2) * tf.sin(mu))[:, :, None] * omega, 1)
+
+        # Second moments of the features, via the product-to-sum identity
+        C = tf.reshape(omega_s, [E*F, -1]) @ tf.transpose(tf.reshape(omega, [E*F, -1]))
+        C = tf.transpose(tf.reshape(C, [E, F, E, F]), [0, 2, 1, 3])  # [E, E, F, F]
+        v_sum = v[:, None, :, None] + v[None, :, None, :]
+        mu_i = mu[:, None, :, None]
+        mu_j = mu[None, :, None, :]
+        Ephiphi = (tf.exp(-(v_sum + 2*C)/2) * tf.cos(mu_i + mu_j) +
+                   tf.exp(-(v_sum - 2*C)/2) * tf.cos(mu_i - mu_j)) / 2
+        Ephiphi = a[:, None, None, None] * a[None, :, None, None] * Ephiphi
+
+        S = tf.reduce_sum(w[:, None, :, None] * Ephiphi * w[None, :, None, :], [2, 3])
+        # Uncertainty of the weights only adds to the diagonal
+        diagEphiphi = tf.transpose(tf.linalg.diag_part(tf.transpose(Ephiphi, [2, 3, 0, 1])), [2, 0, 1])
+        S = S + tf.diag(tf.reduce_sum(Sigma * diagEphiphi, [1, 2]))
+        S = S - M @ tf.transpose(M)
+
+        return tf.transpose(M), S, tf.transpose(V)
+
+    def predict_at_points(self, x, Sigma, w):
+        '''
+        Posterior mean and variance of the latent functions at deterministic inputs
+        IN: inputs x [P, D]
+        OUT: mean [P, E] and variance [P, E]
+        '''
+        Phi = self.features(x)
+        mean = tf.reduce_sum(Phi * w[:, None, :], -1)
+        var = tf.reduce_sum((Phi @ Sigma) * Phi, -1)
+        return tf.transpose(mean), tf.transpose(var)
+
+    def predict_linearized(self, m, s, Sigma, w):
+        mean, var = self.predict_at_points(m, Sigma, w)
+        mu = tf.reduce_sum(self.omega * m[None, :, :], -1) + self.phases
+        J = -tf.reduce_sum(
+            (self.amplitudes[:, None] * w * tf.sin(mu))[:, :, None] * self.omega, 1)
+        S = J @ s @ tf.transpose(J) + tf.diag(var[0])
+        return mean, S, tf.transpose(J)
+
+    def features(self, x):
+        '''
+        IN: inputs x [P, D]
+        OUT: features of every output [E, P, F]
+        '''
+        x = tf.tile(x[None, :, :], [self.num_outputs, 1, 1])
+        return self.amplitudes[:, None, None] * \
+            tf.cos(tf.matmul(x, self.omega, transpose_b=True) + self.phases[:, None, :])
+
+    @property
+    def omega(self):
+        directions = np.stack([model.directions for model in self.models])
+        return tf.constant(directions, float_type) / self.lengthscales[:, None, :]
+
+    @property
+    def phases(self):
+        return tf.constant(np.stack([model.phases for model in self.models]), float_type)
+
+    @property
+    def amplitudes(self):
+        return tf.sqrt(2 * self.variance / self.num_features)
@@ -8,19 +8,23 @@ float_type = gpflow.settings.dtypes.float_type
 
 
 class SMGPR(MGPR):
-    def __init__(self, X, Y, num_induced_points, name=None):
+    def __init__(self, X, Y, num_induced_points, name=None, max_datapoints=None,
+                 selection='variance', cache_factorizations=False, normalize=False,
+                 active_dims=None):
         gpflow.Parameterized.__init__(self, name)
         self.num_induced_points = num_induced_points
-        MGPR.__init__(self, X, Y, name)
+        MGPR.__init__(self, X, Y, name, max_datapoints, selection, cache_factorizations,
+                      normalize, active_dims=active_dims)
 
     def create_models(self, X, Y):
         self.models = []
         for i in range(self.num_outputs):
-            kern = gpflow.kernels.RBF(input_dim=X.shape[1], ARD=True)
             Z = np.random.rand(self.num_induced_points, self.num_dims)
-            #TODO: Maybe fix noise for better conditioning
-            self.models.append(gpflow.models.SGPR(X, Y[:, i:i+1], kern, Z=Z))
-            self.models[i].clear(); self.models[i].compile()
+            with gpflow.defer_build():
+                kern = gpflow.kernels.RBF(input_dim=X.shape[1], ARD=True)
+                #TODO: Maybe fix noise for better conditioning
+                self.models.append(gpflow.models.SGPR(X, Y[:, i:i+1], kern, Z=Z))
+            self.models[i].compile()
     
     def calculate_factorizations(self):
         batched_eye = tf.eye(self.num_induced_points, batch_shape=[self.num_outputs], dtype=float_type)
@@ -0,0 +1,114 @@
+import time
+import numpy as np
+
+from . import numpy_backend
+from .optimizers import cross_entropy_method
+
+
+class MPC:
+    '''
+    Receding-horizon control with a learned dynamics model. At every step an
+    open-loop sequence of actions is optimised with the cross-entropy method,
+    by propagating the state distribution through the model with moment
+    matching as in PILCO, and only its first action is applied. The next plan
+    is warm-started from the remainder of the current one.
+    Built on numpy_backend, so the factorizations of the model are computed
+    once, when it is exported, and every population of candidate sequences is
+    evaluated in a single batched rollout, without TensorFlow.
+    mgpr: numpy_backend.MGPR, reward: numpy_backend reward
+    horizon: number of planned steps
+    max_action: bound on the absolute value of the actions (None for none)
+    sigma: initial standard deviation of the search over the actions
+    time_budget: seconds compute_action may take. When the budget runs out
+        the best plan found so far is used, and the warm start if none.
+    '''
+    def __init__(self, mgpr, reward, control_dim, horizon=10, max_action=None,
+                 population_size=64, num_elites=8, iterations=5, sigma=None,
+                 time_budget=None):
+        self.mgpr = mgpr
+        self.reward = reward
+        self.control_dim = control_dim
+        self.horizon = horizon
+        self.max_action = max_action
+        self.population_size = population_size
+        self.num_elites = num_elites
+        self.iterations = iterations
+        if sigma is None:
+            sigma = 0.5 if max_action is None else 0.5 * max_action
+        self.sigma = sigma
+        self.time_budget = time_budget
+        self.reset()
+
+    @classmethod
+    def from_pilco(cls, pilco, **kwargs):
+        '''
+        MPC with the dynamics model and the reward of a PILCO object, and the
+        bounds of its controller.
+        '''
+        from .models.pilco import numpy_counterpart
+        mgpr = numpy_backend.MGPR(**pilco.mgpr.export())
+        kwargs.setdefault('max_action', getattr(pilco.controller, 'max_action', None))
+        return cls(mgpr, numpy_counterpart(pilco.reward), pilco.control_dim, **kwargs)
+
+    def reset(self):
+        '''
+        Forgets the current plan, e.g. at the start of an episode.
+        '''
+        self.plan = np.zeros((self.horizon, self.control_dim))
+
+    def set_model(self, mgpr):
+        '''
+        Replaces the dynamics model, e.g. after it has been refitted.
+        '''
+        self.mgpr = mgpr
+
+    def evaluate(self, m_x, s_x, actions):
+        '''
+        Total expected rewards of a batch of action sequences.
+        IN: mean (m_x) [1, D] and variance (s_x) [D, D] of the current state,
+            actions [P, H, U]
+        OUT: rewards [P]
+        '''
+        P, H, U = actions.shape
+        D = m_x.shape[1]
+        m_x = np.tile(m_x, [P, 1])
+        s_x = np.tile(s_x[None], [P, 1, 1])
+        reward = np.zeros(P)
+        for t in range(H):
+            reward = reward + self.reward.compute_reward(m_x, s_x)[0]
+            # The actions are deterministic, so they only shift the input
+            m = np.concatenate([m_x, actions[:, t]], axis=1)
+            s = np.zeros((P, D + U, D + U))
+            s[:, :D, :D] = s_x
+            M_dx, S_dx, C_dx = self.mgpr.predict_on_noisy_inputs(m, s)
+            SC = s[:, :D] @ C_dx
+            m_x = M_dx + m_x
+            s_x = S_dx + s_x + SC + np.swapaxes(SC, 1, 2)
+        return reward
+
+    def compute_action(self, x_m, x_s=None):
+        '''
+        Plans from the given state, a point (x_s=None) or a Gaussian, and
+        returns the first action of the plan [1, U].
+        '''
+        start = time.time()
+        if x_s is None:
+            x_s = np.zeros((x_m.shape[1], x_m.shape[1]))
+        deadline = start + self.time_budget if self.time_budget is not None else None
+        shape = (self.horizon, self.control_dim)
+
+        def objective(population):
+            return self.evaluate(x_m, x_s, self.clip(population.reshape((-1,) + shape)))
+
+        # Warm start from the previous plan, shifted by one step
+        warm_start = np.vstack((self.plan[1:], self.plan[-1:]))
+        best, value, _ = cross_entropy_method(objective, warm_start.ravel(), self.sigma,
+            population_size=self.population_size, num_elites=self.num_elites,
+            iterations=self.iterations, deadline=deadline)
+        self.plan = self.clip(best.reshape(shape))
+        return self.plan[0:1]
+
+    def clip(self, actions):
+        if self.max_action is None:
+            return actions
+        return np.clip(actions, -self.max_action, self.max_action)
@@ -0,0 +1,394 @@
+'''
+TensorFlow-free implementation of the forward passes of PILCO, for prediction
+only. Models are loaded from the arrays returned by the export() methods of
+their TensorFlow counterparts, and every method is vectorized over a batch of
+input distributions:
+    m: [B, D], s: [B, D, D]
+The parameters of the models may also have a leading batch dimension of size
+B, e.g. to evaluate a population of controllers in a single rollout, see
+models.PILCO.optimize_policy_population.
+'''
+import numpy as np
+
+
+def batched(a, ndim):
+    '''Adds a leading batch dimension of size 1 to unbatched parameters'''
+    a = np.asarray(a)
+    return a[None] if a.ndim == ndim else a
+
+
+def squash_sin(m, s, max_action=None):
+    '''
+    Squashing function, as controllers.squash_sin, for a batch of inputs.
+    IN: mean (m) [B, k] and variance (s) [B, k, k] of the control input
+    OUT: mean (M) [B, k], variance (S) [B, k, k] and input-output (C)
+         covariance [B, k, k] of the squashed control input
+    '''
+    k = m.shape[1]
+    if max_action is None:
+        max_action = np.ones(k)
+    else:
+        max_action = max_action * np.ones(k)
+    d = np.diagonal(s, axis1=1, axis2=2)
+
+    M = max_action * np.exp(-d/2) * np.sin(m)
+
+    lq = -(d[:, :, None] + d[:, None, :]) / 2
+    q = np.exp(lq)
+    S = (np.exp(lq + s) - q) * np.cos(m[:, :, None] - m[:, None, :]) \
+        - (np.exp(lq - s) - q) * np.cos(m[:, :, None] + m[:, None, :])
+    S = max_action[:, None] * max_action[None, :] * S / 2
+
+    C = max_action * np.exp(-d/2) * np.cos(m)
+    C = C[:, :, None] * np.eye(k)
+    return M, S, C
+
+
+def factorize(X, Y, lengthscales, variance, noise):
+    '''
+    Batched MGPR.calculate_factorizations.
+    IN: X [B, N, D], Y [B, N, E], lengthscales [B, E, D], variance [B, E] and
+        noise [B, E]
+    OUT: iK [B, E, N, N], beta [B, E, N]
+    '''
+    d = (X[:, None, :, None, :] - X[:, None, None, :, :]) / lengthscales[:, :, None, None, :]
+    K = variance[:, :, None, None] * np.exp(-np.sum(np.square(d), -1) / 2)
+    K = K + noise[:, :, None, None] * np.eye(X.shape[1])
+    iK = np.linalg.inv(K)
+    beta = np.einsum('...enm,...me->...en', iK, Y)
+    return iK, beta
+
+
+def kernel(X1, X2, lengthscales, variance):
+    '''
+    Squared exponential kernel of every output
+    IN: X1 [N1, D], X2 [N2, D], lengthscales [E, D], variance [E]
+    OUT: [E, N1, N2]
+    '''
+    X1 = X1[None] / lengthscales[:, None, :]
+    X2 = X2[None] / lengthscales[:, None, :]
+    d = np.sum(np.square(X1), -1)[:, :, None] + np.sum(np.square(X2), -1)[:, None, :] \
+        - 2 * X1 @ np.swapaxes(X2, 1, 2)
+    return variance[:, None, None] * np.exp(-np.maximum(d, 0) / 2)
+
+
+def pivoted_cholesky(X, lengthscales, variance, rank):
+    '''
+    models.iterative.pivoted_cholesky of the kernel matrices of X, computing
+    only the rows it pivots on.
+    OUT: L [E, N, rank]
+    '''
+    E, N = variance.shape[0], X.shape[0]
+    d = np.tile(variance[:, None], [1, N])
+    L = np.zeros((E, N, rank))
+    for j in range(rank):
+        i = np.argmax(d, -1)
+        row = np.stack([kernel(X[i[e]:i[e]+1], X, lengthscales[e:e+1], variance[e:e+1])[0, 0]
+                        for e in range(E)])
+        row = row - np.einsum('enk,ek->en', L[:, :, :j], L[np.arange(E), i, :j])
+        pivot = d[np.arange(E), i]
+        L[:, :, j] = np.where(pivot[:, None] > 1e-6, row / np.sqrt(np.maximum(pivot, 1e-6))[:, None], 0)
+        d = d - np.square(L[:, :, j])
+    return L
+
+
+def preconditioner(L, noise):
+    '''
+    models.iterative.preconditioner
+    OUT: function applying inv(L L^T + noise*I) to [E, N, R], and its log det [E]
+    '''
+    A = np.swapaxes(L, 1, 2) @ L + noise[:, None, None] * np.eye(L.shape[2])
+    chol_A = np.linalg.cholesky(A)
+
+    def solve(R):
+        return (R - L @ np.linalg.solve(A, np.swapaxes(L, 1, 2) @ R)) / noise[:, None, None]
+
+    logdet = (L.shape[1] - L.shape[2]) * np.log(noise) + \
+        2 * np.sum(np.log(np.diagonal(chol_A, axis1=1, axis2=2)), -1)
+    return solve, logdet
+
+
+def conjugate_gradient(matvec, B, precondition=None, max_iterations=1000, tolerance=1e-6):
+    '''
+    models.iterative.conjugate_gradient, with K given by the function
+    matvec computing K V for V [E, N, R]
+    OUT: X [E, N, R], alphas, betas, active [J, E, R]
+    '''
+    if precondition is None:
+        precondition = lambda R: R
+    norm = np.linalg.norm(B, axis=1)
+    X = np.zeros_like(B)
+    R = B.copy()
+    Z = precondition(R)
+    P = Z
+    rz = np.sum(R * Z, 1)
+    alphas, betas, active = [], [], []
+    for i in range(max_iterations):
+        run = np.linalg.norm(R, axis=1) > tolerance * norm
+        if i > 0 and not run.any():
+            break
+        KP = matvec(P)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alpha = np.where(run, rz / np.sum(P * KP, 1), 0)
+            X = X + alpha[:, None, :] * P
+            R = R - alpha[:, None, :] * KP
+            Z = precondition(R)
+            rz_new = np.sum(R * Z, 1)
+            beta = np.where(run, rz_new / rz, 0)
+        P = Z + beta[:, None, :] * P
+        rz = np.where(run, rz_new, rz)
+        alphas.append(alpha); betas.append(beta); active.append(run)
+    return X, np.array(alphas), np.array(betas), np.array(active)
+
+
+def lanczos_logdet(alphas, betas, active, norms):
+    '''
+    models.iterative.lanczos_logdet
+    OUT: estimate of log det(inv(P) K) [E]
+    '''
+    alphas, betas, active = [np.moveaxis(a, 0, -1) for a in (alphas, betas, active)]
+    safe_alphas = np.where(active, alphas, 1)
+    previous = np.concatenate([np.zeros_like(betas[..., :1]), (betas / safe_alphas)[..., :-1]], -1)
+    diagonal = np.where(active, 1 / safe_alphas + previous, 1)
+    next_active = np.concatenate([active[..., 1:], np.zeros_like(active[..., :1])], -1)
+    off_diagonal = np.where(next_active, np.sqrt(betas) / safe_alphas, 0)[..., :-1]
+    J = diagonal.shape[-1]
+    T = diagonal[..., :, None] * np.eye(J)
+    T[..., np.arange(J - 1), np.arange(1, J)] = off_diagonal
+    T[..., np.arange(1, J), np.arange(J - 1)] = off_diagonal
+    eigenvalues, eigenvectors = np.linalg.eigh(T)
+    quadrature = np.sum(np.square(eigenvectors[..., 0, :]) *
+                        np.log(np.maximum(eigenvalues, 1e-6)), -1)
+    return np.mean(norms * quadrature, -1)
+
+
+class MGPR:
+    '''
+    Moment matching prediction of MGPR (and SMGPR) at Gaussian inputs, from
+    exported hyperparameters and factorizations.
+    X: points the factorizations refer to [N, D] (training or inducing inputs)
+    lengthscales [E, D], variance [E], iK [E, N, N], beta [E, N]
+    or all of them with a leading batch dimension.
+    input_mean, input_scale [D], output_mean, output_scale [E]: the
+    normalization of a model fitted with normalize=True
+    active_dims, input_dim: the inputs a pruned model depends on, out of
+    input_dim, see models.MGPR.prune_inputs
+    '''
+    def __init__(self, X, lengthscales, variance, iK, beta, noise=None,
+                 input_mean=None, input_scale=None, output_mean=None, output_scale=None,
+                 active_dims=None, input_dim=None):
+        self.X = batched(X, 2)
+        self.lengthscales = batched(lengthscales, 2)
+        self.variance = batched(variance, 1)
+        self.iK = batched(iK, 3)
+        self.beta = batched(beta, 2)
+        self.noise = noise
+        self.num_outputs, self.num_dims = self.lengthscales.shape[1:]
+        self.normalize = input_mean is not None
+        self.input_mean, self.input_scale = input_mean, input_scale
+        self.output_mean, self.output_scale = output_mean, output_scale
+        self.active_dims, self.input_dim = active_dims, input_dim
+
+    def predict_on_noisy_inputs(self, m, s):
+        '''
+        IN: mean (m) [B, D] and variance (s) [B, D, D] of the input
+        OUT: mean (M) [B, E], variance (S) [B, E, E] of the prediction
+             and inv(s)*input-ouputcovariance [B, D, E]
+        '''
+        if self.normalize:
+            m = (m - self.input_mean) / self.input_scale
+            s = s / (self.input_scale[:, None] * self.input_scale[None, :])
+        if self.active_dims is not None:
+            m = m[:, self.active_dims]
+            s = s[:, self.active_dims][:, :, self.active_dims]
+        E, D = self.num_outputs, self.num_dims
+        beta, iK, variance = self.beta, self.iK, self.variance
+        inp = self.X - m[:, None, :]
+
+        # Calculate M and V: mean and inv(s) times input-output covariance
+        iL = 1 / self.lengthscales
+        iN = inp[:, None, :, :] * iL[:, :, None, :]
+        B = iL[:, :, :, None] * s[:, None, :, :] * iL[:, :, None, :] + np.eye(D)
+        t = np.swapaxes(np.linalg.solve(B, np.swapaxes(iN, -1, -2)), -1, -2)
+
+        lb = np.exp(-np.sum(iN * t, -1) / 2) * beta
+        tiL = t * iL[:, :, None, :]
+        c = variance / np.sqrt(np.linalg.det(B))
+
+        M = np.sum(lb, -1) * c
+        V = np.einsum('bend,ben->bed', tiL, lb) * c[:, :, None]
+
+        # Calculate S: Predictive Covariance
+        iL2 = np.square(iL)
+        R = s[:, None, None, :, :] * \
+            (iL2[:, :, None, :] + iL2[:, None, :, :])[:, :, :, None, :] + np.eye(D)
+        Q = np.linalg.solve(R, np.broadcast_to(s[:, None, None, :, :], R.shape)) / 2
+        X = inp[:, None, None, :, :] * iL2[:, :, None, None, :]
+        X2 = -inp[:, None, None, :, :] * iL2[:, None, :, None, :]
+        XQ = X @ Q
+        Xs = np.sum(XQ * X, -1)
+        X2s = np.sum((X2 @ Q) * X2, -1)
+        maha = -2 * XQ @ np.swapaxes(X2, -1, -2) + Xs[..., :, None] + X2s[..., None, :]
+
+        k = np.log(variance)[:, :, None] - np.sum(np.square(iN), -1) / 2
+        L = np.exp(k[:, :, None, :, None] + k[:, None, :, None, :] + maha)
+        beta = np.broadcast_to(beta, (m.shape[0],) + beta.shape[1:])
+        S = np.einsum('bin,bijnm,bjm->bij', beta, L, beta)
+
+        diagL = L[:, np.arange(E), np.arange(E)]
+        S[:, np.arange(E), np.arange(E)] -= np.sum(iK * diagL, (2, 3))
+        S = S / np.sqrt(np.linalg.det(R))
+        S = S + variance[:, :, None] * np.eye(E)
+        S = S - M[:, :, None] * M[:, None, :]
+        V = np.swapaxes(V, 1, 2)
+
+        if self.active_dims is not None:
+            V_full = np.zeros((V.shape[0], self.input_dim, E))
+            V_full[:, self.active_dims] = V
+            V = V_full
+        if self.normalize:
+            M = M * self.output_scale + self.output_mean
+            S = S * (self.output_scale[:, None] * self.output_scale[None, :])
+            V = V * self.output_scale[None, :] / self.input_scale[:, None]
+        return M, S, V
+
+
+class LinearController:
+    '''
+    W [U, D], b [1, U] or both with a leading batch dimension
+    '''
+    def __init__(self, W, b, max_action=None):
+        self.W = batched(W, 2)
+        self.b = batched(b, 2)
+        self.max_action = max_action
+
+    def compute_action(self, m, s, squash=True):
+        '''
+        IN: mean (m) [B, D] and variance (s) [B, D, D] of the state
+        OUT: mean (M) [B, U], variance (S) [B, U, U] of the action and
+             inv(s)*input-output covariance [B, D, U]
+        '''
+        Wt = np.swapaxes(self.W, 1, 2)
+        M = (m[:, None, :] @ Wt)[:, 0, :] + self.b[:, 0, :]
+        S = self.W @ s @ Wt
+        V = np.broadcast_to(Wt, (m.shape[0],) + Wt.shape[1:])
+        if squash:
+            M, S, V2 = squash_sin(M, S, self.max_action)
+            V = V @ V2
+        return M, S, V
+
+
+class RbfController(MGPR):
+    def __init__(self, X, lengthscales, variance, iK, beta, noise=None, max_action=None):
+        MGPR.__init__(self, X, lengthscales, variance, 0.0 * iK, beta, noise)
+        self.max_action = max_action
+
+    def compute_action(self, m, s, squash=True):
+        M, S, V = self.predict_on_noisy_inputs(m, s)
+        S = S - (self.variance - 1e-6)[:, :, None] * np.eye(self.num_outputs)
+        if squash:
+            M, S, V2 = squash_sin(M, S, self.max_action)
+            V = V @ V2
+        return M, S, V
+
+
+class ExponentialReward:
+    def __init__(self, W, t):
+        self.W = W
+        self.t = t
+        self.state_dim = W.shape[0]
+
+    def compute_reward(self, m, s):
+        '''
+        IN: mean (m) [B, k] and variance (s) [B, k, k] of the state
+        OUT: mean [B] and variance [B] of the reward
+        '''
+        I = np.eye(self.state_dim)
+        SW = s @ self.W
+        d = (m - self.t)[:, None, :]
+
+        iSpW = np.swapaxes(np.linalg.solve(np.swapaxes(I + SW, 1, 2), np.broadcast_to(self.W.T, SW.shape)), 1, 2)
+        muR = np.exp(-(d @ iSpW @ np.swapaxes(d, 1, 2))[:, 0, 0] / 2) / \
+            np.sqrt(np.linalg.det(I + SW))
+
+        i2SpW = np.swapaxes(np.linalg.solve(np.swapaxes(I + 2*SW, 1, 2), np.broadcast_to(self.W.T, SW.shape)), 1, 2)
+        r2 = np.exp(-(d @ i2SpW @ np.swapaxes(d, 1, 2))[:, 0, 0]) / \
+            np.sqrt(np.linalg.det(I + 2*SW))
+        return muR, r2 - muR**2
+
+
+class LinearReward:
+    def __init__(self, W):
+        self.W = W
+
+    def compute_reward(self, m, s):
+        return (m @ self.W)[:, 0], (self.W.T @ s @ self.W)[:, 0, 0]
+
+
+class CombinedRewards:
+    def __init__(self, rewards, coefs):
+        self.base_rewards = rewards
+        self.coefs = coefs
+
+    def compute_reward(self, m, s):
+        muR = 0
+        sR = 0
+        for c, r in zip(self.coefs, self.base_rewards):
+            tmp1, tmp2 = r.compute_reward(m, s)
+            muR += c * tmp1
+            sR += c**2 * tmp2
+        return muR, sR
+
+
+class PILCO:
+    '''
+    Rollouts of a controller through the dynamics model, as models.PILCO.predict
+    '''
+    def __init__(self, mgpr, controller, reward, max_variance=None, min_reward=None):
+        self.mgpr = mgpr
+        self.controller = controller
+        self.reward = reward
+        self.max_variance = max_variance
+        self.min_reward = min_reward
+
+    def saturated(self, s_x, reward):
+        # Rollouts [B] whose predictions carry no more signal, see models.PILCO
+        done = np.zeros(s_x.shape[0], dtype=bool)
+        if self.max_variance is not None:
+            done |= np.trace(s_x, axis1=1, axis2=2) > self.max_variance
+        if self.min_reward is not None:
+            done |= reward < self.min_reward
+        return done
+
+    def propagate(self, m_x, s_x):
+        m_u, s_u, c_xu = self.controller.compute_action(m_x, s_x)
+
+        m = np.concatenate([m_x, m_u], axis=1)
+        s1 = np.concatenate([s_x, s_x @ c_xu], axis=2)
+        s2 = np.concatenate([np.swapaxes(s_x @ c_xu, 1, 2), s_u], axis=2)
+        s = np.concatenate([s1, s2], axis=1)
+
+        M_dx, S_dx, C_dx = self.mgpr.predict_on_noisy_inputs(m, s)
+        M_x = M_dx + m_x
+        S_x = S_dx + s_x + s1 @ C_dx + np.swapaxes(s1 @ C_dx, 1, 2)
+        return M_x, S_x
+
+    def predict(self, m_x, s_x, n):
+        '''
+        OUT: mean and variance of the state after n steps, and the sum of
+             the expected rewards along the way [B]
+        '''
+        reward = np.zeros(m_x.shape[0])
+        done = np.zeros(m_x.shape[0], dtype=bool)
+        for i in range(n):
+            r = self.reward.compute_reward(m_x, s_x)[0]
+            done |= self.saturated(s_x, r)
+            if done.all():
+                # The remaining steps are scored with the reward of the last state
+                return m_x, s_x, reward + (n - i) * r
+            reward = reward + r
+            M_x, S_x = self.propagate(m_x, s_x)
+            # Saturated rollouts stay at their last state
+            m_x = np.where(done[:, None], m_x, M_x)
+            s_x = np.where(done[:, None, None], s_x, S_x)
+        return m_x, s_x, reward
@@ -0,0 +1,151 @@
+import time
+import numpy as np
+
+
+class Scheduler:
+    '''
+    Splits a per-iteration wall-clock budget between model fitting and policy
+    search, and decides when a random restart is worth finishing.
+    time_budget: seconds available for one optimize_models + optimize_policy
+        pair (None for no time limit)
+    model_share: fraction of the budget reserved for model fitting; time the
+        models leave unused is given to the policy search
+    probe_iter: iterations a restart runs before it is compared against the
+        incumbent (None to always run restarts up to maxiter)
+    probe_margin: a probed restart is abandoned when its objective trails the
+        incumbent by more than this fraction of the incumbent's magnitude
+    '''
+    def __init__(self, time_budget=None, model_share=0.3, probe_iter=None, probe_margin=0.1):
+        self.time_budget = time_budget
+        self.model_share = model_share
+        self.probe_iter = probe_iter
+        self.probe_margin = probe_margin
+        self.iteration_start = None
+        self.policy_started = False
+
+    def start_iteration(self):
+        self.iteration_start = time.time()
+        self.policy_started = False
+
+    def deadline(self, stage):
+        '''
+        Absolute time by which the given stage ('models' or 'policy') has to
+        finish. A policy search ends the iteration, so a second one without a
+        model fit in between starts a new iteration.
+        '''
+        if self.time_budget is None:
+            return None
+        if self.iteration_start is None or self.policy_started:
+            self.start_iteration()
+        if stage == 'policy':
+            self.policy_started = True
+        share = self.model_share if stage == 'models' else 1.0
+        return self.iteration_start + share * self.time_budget
+
+    def is_hopeless(self, value, best_value):
+        return value < best_value - self.probe_margin * np.abs(best_value)
+
+
+def set_maxiter(optimizer, maxiter):
+    '''
+    Changes the iteration limit of an already built gpflow.train.ScipyOptimizer,
+    so that restarts can reuse its graph with a different maxiter.
+    '''
+    optimizer._optimizer.optimizer_kwargs.setdefault('options', {})['maxiter'] = maxiter
+
+
+def run_optimizer(optimizer, maxiter, deadline=None, chunks=10, **kwargs):
+    '''
+    Runs an already built optimizer again, e.g. for a restart. Any kwargs
+    (fetches, loss_callback) are passed to ScipyOptimizerInterface.minimize.
+    deadline: absolute time after which no more iterations are started. The
+        run is then split into `chunks` runs, checking the time between them.
+        Each of them starts L-BFGS-B afresh, without the curvature estimate
+        of the previous one.
+    '''
+    model = optimizer._model
+    session = model.enquire_session(None)
+    size = maxiter if deadline is None else max(1, -(-maxiter // chunks))
+    done = 0
+    while done < maxiter and (deadline is None or time.time() < deadline):
+        set_maxiter(optimizer, min(size, maxiter - done))
+        optimizer._optimizer.minimize(session=session,
+                    feed_dict=optimizer._gen_feed_dict(model, None),
+                    step_callback=None, **kwargs)
+        done += size
+
+
+def optimize_with_restarts(optimizer, objective, randomize, restarts, maxiter,
+                           scheduler=None, deadline=None, message=None, minimize_kwargs=None):
+    '''
+    Runs up to `restarts` randomised optimisations of optimizer._model and
+    keeps the parameters with the largest objective().
+    Restarts stop being started once the next one would, judging by the ones
+    already run, overrun the deadline. With a scheduler that sets probe_iter,
+    restarts that trail the incumbent after probe_iter iterations are dropped.
+    minimize_kwargs are passed on to run_optimizer.
+    Returns the best value of the objective.
+    '''
+    minimize_kwargs = minimize_kwargs or {}
+    model = optimizer._model
+    session = model.enquire_session(None)
+    best_parameters = model.read_values(session=session)
+    best_value = objective()
+    probe_iter = scheduler.probe_iter if scheduler is not None else None
+    durations = []
+    for restart in range(restarts):
+        expected = np.mean(durations) if durations else 0.0
+        if deadline is not None and time.time() + expected > deadline:
+            break
+        start = time.time()
+        randomize()
+        if probe_iter is not None and probe_iter < maxiter:
+            run_optimizer(optimizer, probe_iter, **minimize_kwargs)
+            if not scheduler.is_hopeless(objective(), best_value):
+                run_optimizer(optimizer, maxiter - probe_iter, **minimize_kwargs)
+        else:
+            run_optimizer(optimizer, maxiter, **minimize_kwargs)
+        value = objective()
+        durations.append(time.time() - start)
+        if message is not None:
+            print(message % (durations[-1], value))
+        if value > best_value:
+            best_parameters = model.read_values(session=session)
+            best_value = value
+    model.assign(best_parameters)
+    return best_value
+
+
+def cross_entropy_method(objective, mean, sigma, population_size=64, num_elites=8,
+                         iterations=20, smoothing=0.2, min_sigma=1e-3, deadline=None):
+    '''
+    Gradient-free maximisation of objective() with the cross-entropy method:
+    each iteration samples a population from a diagonal Gaussian and refits
+    the Gaussian to the num_elites best samples. The mean of the previous
+    search distribution is always part of the population.
+    objective: function from a population [P, n] to its values [P]
+    mean [n], sigma (scalar or [n]): initial search distribution
+    smoothing: weight of the previous distribution in each refit
+    min_sigma: floor on the standard deviations, against premature convergence
+    OUT: best sample [n], its value, and the elites of the last iteration [num_elites, n]
+    '''
+    mean = np.array(mean, dtype=float)
+    sigma = sigma * np.ones_like(mean)
+    best, best_value = mean, -np.inf
+    elites = mean[None]
+    for iteration in range(iterations):
+        if deadline is not None and time.time() > deadline:
+            break
+        population = mean + sigma * np.random.normal(size=(population_size - 1, mean.size))
+        population = np.vstack((mean[None], population))
+        values = objective(population)
+        # NaNs, e.g. from a rollout that diverged, rank last
+        values = np.where(np.isnan(values), -np.inf, values)
+        order = np.argsort(-values)[:num_elites]
+        elites = population[order]
+        if values[order[0]] > best_value:
+            best, best_value = population[order[0]], values[order[0]]
+        mean = smoothing * mean + (1 - smoothing) * np.mean(elites, 0)
+        sigma = smoothing * sigma + (1 - smoothing) * np.std(elites, 0)
+        sigma = np.maximum(sigma, min_sigma)
+    return best, best_value, elites
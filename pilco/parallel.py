@@ -0,0 +1,294 @@
+'''
+Exact GP dynamics model with its kernel matrices split over worker
+processes, for training sets whose [E, N, N] kernel doesn't fit, or can't be
+factorized, in one process. Each worker holds a block of rows of the kernel
+matrices, [E, N/P, N] for P workers, and the parent process only ever holds
+[E, N, R] matrices. Built on numpy_backend, so the workers don't import
+TensorFlow, and the model can be used wherever a numpy_backend.MGPR is, e.g.
+by mpc.MPC.
+'''
+import multiprocessing
+import numpy as np
+from scipy.optimize import minimize
+
+from .numpy_backend import (kernel, pivoted_cholesky, preconditioner, conjugate_gradient,
+                            lanczos_logdet)
+
+
+def _serve(connection, X, rows):
+    '''
+    Worker loop, computing with the rows `rows` of the kernel matrices
+    '''
+    X_rows = X[rows]
+    while True:
+        command, args = connection.recv()
+        if command == 'close':
+            break
+        try:
+            if command == 'hyperparameters':
+                lengthscales, variance, noise = args
+                K = kernel(X_rows, X, lengthscales, variance)
+                result = None
+            elif command == 'matvec':
+                V, = args
+                result = K @ V + noise[:, None, None] * V[:, rows]
+            elif command == 'gradient':
+                W, U = args
+                result = _gradient_sums(X_rows, X, K, lengthscales, W[:, rows], U)
+            elif command == 'moments':
+                m, s, beta = args
+                result = _moment_sums(X_rows, X, lengthscales, variance, m, s,
+                                      beta[:, rows], beta)
+            else:
+                raise ValueError('Unknown command: %s' % command)
+        except Exception as error:
+            connection.send((False, error))
+        else:
+            connection.send((True, result))
+    connection.close()
+
+
+def _gradient_sums(X_rows, X, K, lengthscales, W, U):
+    '''
+    w^T dK u for the derivatives of the kernel matrices with respect to the
+    log lengthscales and log variance, over the rows of the block, for each
+    pair of columns of W (its rows of the block) and U [E, N, R]
+    OUT: [E, D + 1, R]
+    '''
+    sums = []
+    for d in range(X.shape[1]):
+        dK = K * np.square(X_rows[None, :, None, d] - X[None, None, :, d]) / \
+            np.square(lengthscales[:, d])[:, None, None]
+        sums.append(np.einsum('enr,enm,emr->er', W, dK, U))
+    sums.append(np.einsum('enr,enm,emr->er', W, K, U))
+    return np.stack(sums, 1)
+
+
+def _moment_sums(X_rows, X, lengthscales, variance, m, s, beta_rows, beta):
+    '''
+    The sums over the training points in numpy_backend.MGPR.predict_on_noisy_inputs,
+    over the rows of the block, without the factors that don't depend on them
+    IN: m [B, D], s [B, D, D], beta_rows [E, n] of the block, beta [E, N]
+    OUT: partial sums of M [B, E], V [B, E, D] and S [B, E, E]
+    '''
+    D = X.shape[1]
+    iL = 1 / lengthscales
+    iL2 = np.square(iL)
+    inp_rows = X_rows - m[:, None, :]
+    inp = X - m[:, None, :]
+
+    iN_rows = inp_rows[:, None, :, :] * iL[:, None, :]
+    B = iL[:, :, None] * s[:, None, :, :] * iL[:, None, :] + np.eye(D)
+    t = np.swapaxes(np.linalg.solve(B, np.swapaxes(iN_rows, -1, -2)), -1, -2)
+    lb = np.exp(-np.sum(iN_rows * t, -1) / 2) * beta_rows
+    M = np.sum(lb, -1)
+    V = np.einsum('bend,ben->bed', t * iL[:, None, :], lb)
+
+    R = s[:, None, None, :, :] * \
+        (iL2[:, None, :] + iL2[None, :, :])[None, :, :, None, :] + np.eye(D)
+    Q = np.linalg.solve(R, np.broadcast_to(s[:, None, None, :, :], R.shape)) / 2
+    X1 = inp_rows[:, None, None, :, :] * iL2[None, :, None, None, :]
+    X2 = -inp[:, None, None, :, :] * iL2[None, None, :, None, :]
+    X1Q = X1 @ Q
+    maha = -2 * X1Q @ np.swapaxes(X2, -1, -2) + \
+        np.sum(X1Q * X1, -1)[..., :, None] + np.sum((X2 @ Q) * X2, -1)[..., None, :]
+    k_rows = np.log(variance)[:, None] - np.sum(np.square(iN_rows), -1) / 2
+    k = np.log(variance)[:, None] - np.sum(np.square(inp[:, None, :, :] * iL[:, None, :]), -1) / 2
+    L = np.exp(k_rows[:, :, None, :, None] + k[:, None, :, None, :] + maha)
+    S = np.einsum('in,bijnm,jm->bij', beta_rows, L, beta)
+    return M, V, S
+
+
+class ShardedMGPR:
+    '''
+    Exact multi-output GP with squared exponential kernels, with the rows of
+    its kernel matrices split over `processes` worker processes.
+    Linear algebra is by conjugate gradients (preconditioned with a partial
+    pivoted Cholesky factor computed in the parent), which only needs the
+    matrix-vector products the workers compute in parallel, and so is the
+    training: the log marginal likelihood is estimated by stochastic Lanczos
+    quadrature and its gradient from sums the workers compute, as
+    models.iterative.CGGPR. Predictions at Gaussian inputs gather the sums
+    of moment matching from the workers; the expected posterior variance,
+    which would need the inverse kernel matrices, is taken at the sigma
+    points of the unscented transform, as models.MGPR with solver='cg'.
+    It isn't a TensorFlow model, so it can't be the dynamics model of
+    models.PILCO, whose rollouts are TensorFlow graphs, but it can replace
+    the exported model in PILCO.evaluate_policies (its `mgpr` argument) and
+    in mpc.MPC.
+    X [N, D], Y [N, E]
+    hyperparameters: initial (lengthscales [E, D], variances [E], noises [E]),
+        e.g. MGPR.hyperparameter_values() of a model fitted to a subset
+    Call close() (or use it as a context manager) to stop the workers.
+    '''
+    def __init__(self, X, Y, processes=None, hyperparameters=None, preconditioner_rank=50,
+                 num_probes=10, max_iterations=1000, tolerance=1e-6, seed=0):
+        self.X, self.Y = X, Y
+        self.num_datapoints, self.num_dims = X.shape
+        self.num_outputs = Y.shape[1]
+        self.preconditioner_rank = min(preconditioner_rank, self.num_datapoints)
+        self.num_probes = num_probes
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        # Fixed probes, so that the estimates are deterministic functions of
+        # the hyperparameters
+        random = np.random.RandomState(seed)
+        self.probes = (random.randn(self.num_outputs, self.preconditioner_rank, num_probes),
+                       random.randn(self.num_outputs, self.num_datapoints, num_probes))
+
+        processes = processes or multiprocessing.cpu_count()
+        self.rows = np.array_split(np.arange(self.num_datapoints), processes)
+        self.connections, self.workers = [], []
+        for rows in self.rows:
+            parent, child = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_serve, args=(child, X, rows), daemon=True)
+            worker.start()
+            self.connections.append(parent)
+            self.workers.append(worker)
+
+        if hyperparameters is None:
+            hyperparameters = (np.ones((self.num_outputs, self.num_dims)),
+                               np.ones(self.num_outputs), np.ones(self.num_outputs))
+        self.set_hyperparameters(*hyperparameters)
+
+    def _run(self, command, *args):
+        # The same command on every worker, in parallel. Every reply is read
+        # before raising the error of a worker, so the next command doesn't
+        # get the replies to this one.
+        for connection in self.connections:
+            connection.send((command, args))
+        replies = [connection.recv() for connection in self.connections]
+        for ok, result in replies:
+            if not ok:
+                raise result
+        return [result for _, result in replies]
+
+    def set_hyperparameters(self, lengthscales, variances, noises):
+        self.lengthscales = np.asarray(lengthscales, dtype=float)
+        self.variance = np.asarray(variances, dtype=float)
+        self.noise = np.asarray(noises, dtype=float)
+        self._run('hyperparameters', self.lengthscales, self.variance, self.noise)
+        L = pivoted_cholesky(self.X, self.lengthscales, self.variance, self.preconditioner_rank)
+        self.precondition, self.precondition_logdet = preconditioner(L, self.noise)
+        self.probe_vectors = L @ self.probes[0] + np.sqrt(self.noise)[:, None, None] * self.probes[1]
+        self.beta = self.solve(self.Y.T[:, :, None])[0][:, :, 0]
+
+    def hyperparameter_values(self):
+        return self.lengthscales, self.variance, self.noise
+
+    def matvec(self, V):
+        '''
+        (K + noise*I) V for V [E, N, R]
+        '''
+        return np.concatenate(self._run('matvec', V), 1)
+
+    def solve(self, B):
+        '''
+        inv(K + noise*I) B for B [E, N, R], with the coefficients of
+        conjugate_gradient
+        '''
+        return conjugate_gradient(self.matvec, B, self.precondition,
+                                  self.max_iterations, self.tolerance)
+
+    def log_likelihood(self, gradient=False):
+        '''
+        Log marginal likelihood of each output [E], including the priors of
+        models.MGPR, and optionally its gradient with respect to the log
+        lengthscales, log variance and log noise [E, D + 2]
+        '''
+        Z = self.probe_vectors
+        X, alphas, betas, active = self.solve(np.concatenate([self.Y.T[:, :, None], Z], -1))
+        alpha, W = X[:, :, :1], X[:, :, 1:]
+        V = self.precondition(Z)
+        logdet = self.precondition_logdet + lanczos_logdet(
+            alphas[..., 1:], betas[..., 1:], active[..., 1:], np.sum(Z * V, 1))
+        N = self.num_datapoints
+        likelihood = -0.5 * (N * np.log(2 * np.pi) + logdet +
+                             np.sum(self.Y.T * alpha[:, :, 0], -1))
+        # Gamma priors on the lengthscales and variances, see models.MGPR
+        likelihood += -np.sum(self.lengthscales, -1) / 10 + \
+            0.5 * np.log(self.variance) - self.variance / 2
+        if not gradient:
+            return likelihood
+        # d/dtheta = alpha^T dK alpha / 2 - tr(inv(K) dK) / 2, the trace
+        # estimated from the probes, see models.iterative.CGGPR
+        sums = sum(self._run('gradient', np.concatenate([alpha, W], -1),
+                             np.concatenate([alpha, V], -1)))
+        dkernel = 0.5 * sums[:, :, 0] - 0.5 * np.mean(sums[:, :, 1:], -1)
+        dnoise = 0.5 * self.noise * (np.sum(np.square(alpha[:, :, 0]), -1) -
+                                     np.mean(np.sum(W * V, 1), -1))
+        dprior = np.concatenate([-self.lengthscales / 10,
+                                 (0.5 - self.variance / 2)[:, None]], -1)
+        return likelihood, np.concatenate([dkernel + dprior, dnoise[:, None]], -1)
+
+    def optimize(self, maxiter=100):
+        '''
+        Maximizes the log marginal likelihood of all the outputs, with L-BFGS
+        over the log hyperparameters
+        '''
+        E, D = self.num_outputs, self.num_dims
+
+        def set_vector(x):
+            x = np.exp(x.reshape(E, D + 2))
+            self.set_hyperparameters(x[:, :D], x[:, D], x[:, D + 1])
+
+        def objective(x):
+            set_vector(x)
+            value, gradient = self.log_likelihood(gradient=True)
+            return -np.sum(value), -gradient.ravel()
+
+        x0 = np.log(np.concatenate([self.lengthscales, self.variance[:, None],
+                                    self.noise[:, None]], -1)).ravel()
+        result = minimize(objective, x0, jac=True, method='L-BFGS-B',
+                          options=dict(maxiter=maxiter))
+        set_vector(result.x)
+        return result
+
+    def predict_on_noisy_inputs(self, m, s):
+        '''
+        As numpy_backend.MGPR.predict_on_noisy_inputs
+        IN: mean (m) [B, D] and variance (s) [B, D, D] of the input
+        OUT: mean (M) [B, E], variance (S) [B, E, E] of the prediction
+             and inv(s)*input-ouputcovariance [B, D, E]
+        '''
+        E, D = self.num_outputs, self.num_dims
+        sums = zip(*self._run('moments', m, s, self.beta))
+        M, V, S = [sum(parts) for parts in sums]
+
+        iL = 1 / self.lengthscales
+        B = iL[:, :, None] * s[:, None, :, :] * iL[:, None, :] + np.eye(D)
+        c = self.variance / np.sqrt(np.linalg.det(B))
+        M = M * c
+        V = V * c[:, :, None]
+        iL2 = np.square(iL)
+        R = s[:, None, None, :, :] * \
+            (iL2[:, None, :] + iL2[None, :, :])[None, :, :, None, :] + np.eye(D)
+        S = S / np.sqrt(np.linalg.det(R))
+
+        # Expected posterior variance at the sigma points
+        kappa = 1.0
+        offsets = np.sqrt(D + kappa) * np.swapaxes(np.linalg.cholesky(s + 1e-6 * np.eye(D)), 1, 2)
+        points = np.concatenate([m[:, None], m[:, None] + offsets, m[:, None] - offsets], 1)
+        weights = np.array([kappa / (D + kappa)] + [1 / (2 * (D + kappa))] * (2 * D))
+        k = kernel(points.reshape(-1, D), self.X, self.lengthscales, self.variance)
+        w = self.solve(np.swapaxes(k, 1, 2))[0]
+        quadratic = np.sum(np.swapaxes(k, 1, 2) * w, 1).reshape(E, -1, 2 * D + 1)
+        uncertainty = np.sum(quadratic * weights, -1).T
+
+        S = S - uncertainty[:, :, None] * np.eye(E)
+        S = S + self.variance[:, None] * np.eye(E)
+        S = S - M[:, :, None] * M[:, None, :]
+        return M, S, np.swapaxes(V, 1, 2)
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(('close', ()))
+        for worker in self.workers:
+            worker.join()
+        self.connections, self.workers = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -63,6 +63,9 @@ class ExponentialReward(Reward):
         sR.set_shape([1, 1])
         return muR, sR
 
+    def export(self):
+        return dict(W=self.W.value, t=self.t.value)
+
 class LinearReward(Reward):
     def __init__(self, state_dim, W):
         Reward.__init__(self)
@@ -75,6 +78,9 @@ class LinearReward(Reward):
         sR = tf.transpose(self.W) @ s @ self.W
         return muR, sR
 
+    def export(self):
+        return dict(W=self.W.value)
+
 
 class CombinedRewards(Reward):
     def __init__(self, state_dim, rewards=[], coefs=None):
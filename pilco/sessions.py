@@ -0,0 +1,61 @@
+import contextlib
+import functools
+import os
+import tensorflow as tf
+
+
+def make_session(intra_op_threads=None, inter_op_threads=None, cpu_affinity=None,
+                 graph=None):
+    '''
+    TensorFlow session with bounded execution resources, to be passed to
+    models.PILCO (possibly to several instances, which then share its thread
+    pools).
+    intra_op_threads: threads used within an op, e.g. a matmul (None for one
+        per core)
+    inter_op_threads: ops run concurrently (None for one per core)
+    cpu_affinity: cores the process is restricted to (Linux only, OSError
+        elsewhere). Applies to the whole process, and to the threads
+        TensorFlow starts from then on.
+    graph: graph of the session, the default graph if None
+    '''
+    if cpu_affinity is not None:
+        if not hasattr(os, 'sched_setaffinity'):
+            raise OSError('CPU affinity is not supported on this platform')
+        os.sched_setaffinity(0, cpu_affinity)
+    config = tf.ConfigProto(
+        intra_op_parallelism_threads=intra_op_threads or 0,
+        inter_op_parallelism_threads=inter_op_threads or 0,
+        # Sessions with different limits in the same process need their own pools
+        use_per_session_threads=intra_op_threads is not None or inter_op_threads is not None)
+    return tf.Session(graph=graph or tf.get_default_graph(), config=config)
+
+
+@contextlib.contextmanager
+def session_scope(session):
+    '''
+    Makes the session, and its graph, the defaults, so that everything built
+    or run in the scope, by any object, uses them. Does nothing for None.
+    '''
+    if session is None:
+        yield
+        return
+    with session.as_default(), session.graph.as_default():
+        yield
+
+
+def in_session(method):
+    '''
+    Runs a method in the session_scope of the `session` attribute of its object.
+    Without one, in the scope of the session the object runs in once built:
+    the default graph is per thread, and in other threads than the one that
+    built it, e.g. the workers of training.optimize_policies, it isn't the
+    graph of the object.
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        session = self.session
+        if session is None and self.graph is not None:
+            session = self.enquire_session()
+        with session_scope(session):
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,143 @@
+import copy
+import time
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import numpy_backend
+
+
+class SnapshotPolicy:
+    '''
+    Frozen, TensorFlow-free copy of a controller, with the same compute_action
+    as PILCO, so that it can be passed to a rollout function in place of the
+    PILCO object. Safe to use from other threads (or, being picklable, other
+    processes) while the original controller is being optimised.
+    '''
+    def __init__(self, controller):
+        # Imported here, so that unpickling a snapshot doesn't import TensorFlow
+        from . import controllers
+        # gpflow assigns the values of parameters in place, so the exported
+        # arrays would follow the optimisation of the controller
+        values = copy.deepcopy(controller.export())
+        if isinstance(controller, controllers.RbfController):
+            self.controller = numpy_backend.RbfController(**values)
+        elif isinstance(controller, controllers.LinearController):
+            self.controller = numpy_backend.LinearController(**values)
+        else:
+            raise TypeError('Cannot snapshot controller %s, only RbfController and '
+                            'LinearController are supported' % type(controller).__name__)
+
+    def compute_action(self, x_m):
+        s = np.zeros((x_m.shape[0], x_m.shape[1], x_m.shape[1]))
+        return self.controller.compute_action(x_m, s)[0]
+
+
+class HorizonCurriculum:
+    '''
+    Grows the horizon of the policy optimisation across iterations, see
+    PILCO.set_horizon. Early on the predictions far ahead are too uncertain
+    to be worth optimising through, so the horizon starts short and is
+    multiplied by `growth` after every iteration whose predicted final state
+    has a variance (trace) below max_variance, up to the full horizon.
+    max_variance: None to grow after every iteration
+    '''
+    def __init__(self, horizon, initial=None, growth=1.5, max_variance=None):
+        self.horizon = horizon
+        self.initial = initial if initial is not None else max(1, horizon // 4)
+        self.growth = growth
+        self.max_variance = max_variance
+        self.current = None
+
+    def __call__(self, pilco):
+        '''
+        Sets the horizon of pilco for the next policy optimisation
+        OUT: the horizon
+        '''
+        if self.current is None:
+            self.current = self.initial
+        elif self.current < self.horizon:
+            if self.max_variance is None or \
+                    np.trace(pilco.compute_rollout()[1]) < self.max_variance:
+                self.current = min(self.horizon, max(self.current + 1,
+                                                     int(self.current * self.growth)))
+        pilco.set_horizon(self.current)
+        return self.current
+
+
+def optimize_policies(pilcos, executor=None, **policy_kwargs):
+    '''
+    Runs optimize_policy of several PILCO objects concurrently, e.g. of
+    controllers for different targets sharing one dynamics model (see
+    PILCO.share_model). TensorFlow releases the GIL while evaluating the
+    rollouts, so threads are enough.
+    executor: concurrent.futures executor, by default a thread pool with a
+        worker per PILCO object
+    '''
+    # Graphs have to be built from a single thread
+    for pilco in pilcos:
+        pilco.build_policy_optimizer()
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=len(pilcos))
+    try:
+        futures = [executor.submit(pilco.optimize_policy, **policy_kwargs) for pilco in pilcos]
+        for future in futures:
+            future.result()
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+
+
+def train(pilco, rollout, X, Y, iterations, staleness=1, executor=None,
+          models_kwargs=None, policy_kwargs=None, curriculum=None):
+    '''
+    PILCO's training loop, with the data collection overlapped with the
+    optimisation of the models and the policy.
+    rollout: function from a policy (with a compute_action(x_m) method) to
+        the new transitions (X_new, Y_new)
+    staleness: number of iterations the policy of a rollout may lag behind
+        the latest one. With 0 the loop is serial: optimise, then collect. With
+        s > 0, up to s rollouts run in the background, with the latest policy
+        snapshot at the time they were started, while the optimisation runs
+        on the data collected so far.
+    executor: concurrent.futures executor for the rollouts, by default a
+        thread pool with `staleness` workers
+    curriculum: optional HorizonCurriculum, setting the horizon before every
+        policy optimisation
+    OUT: the final dataset X, Y
+    '''
+    models_kwargs = models_kwargs or {}
+    policy_kwargs = policy_kwargs or {}
+    own_executor = executor is None and staleness > 0
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=staleness)
+    pending = deque()
+    try:
+        for iteration in range(iterations):
+            while len(pending) < staleness:
+                pending.append(executor.submit(rollout, SnapshotPolicy(pilco.controller)))
+            start = time.time()
+            pilco.optimize_models(**models_kwargs)
+            if curriculum is not None:
+                curriculum(pilco)
+            pilco.optimize_policy(**policy_kwargs)
+            end = time.time()
+            if staleness == 0:
+                X_new, Y_new = rollout(SnapshotPolicy(pilco.controller))
+            else:
+                X_new, Y_new = pending.popleft().result()
+            print("Iteration %d: optimisation took %.1f seconds, waited %.1f seconds for data." %
+                  (iteration, end - start, time.time() - end))
+            X = np.vstack((X, X_new)); Y = np.vstack((Y, Y_new))
+            pilco.mgpr.set_XY(X, Y)
+        # Rollouts still in flight are kept as well
+        if pending:
+            for future in pending:
+                X_new, Y_new = future.result()
+                X = np.vstack((X, X_new)); Y = np.vstack((Y, Y_new))
+            pilco.mgpr.set_XY(X, Y)
+    finally:
+        if own_executor:
+            executor.shutdown(wait=True)
+    return X, Y
@@ -0,0 +1,38 @@
+from pilco.models import MGPR
+from pilco.models.active_set import select_by_variance, select_by_recency, prediction_error
+import numpy as np
+
+
+def test_active_set():
+    np.random.seed(0)
+    d = 3  # Input dimension
+    k = 2  # Number of outputs
+
+    X0 = np.random.rand(300, d)
+    A = np.random.rand(d, k)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(300, k) - 0.5)
+    mgpr = MGPR(X0[:50], Y0[:50], max_datapoints=40)
+    assert mgpr.num_datapoints == 40
+    mgpr.optimize(maxiter=50)
+
+    mgpr.set_XY(X0, Y0)
+    assert mgpr.num_datapoints == 40
+    assert mgpr.selection_error.shape == (k,)
+
+    # When the latest transitions cover only part of the state space, as
+    # along a trajectory, spreading the points by posterior variance beats
+    # keeping the latest ones. On i.i.d. data neither is better in general.
+    order = np.argsort(X0[:, 0])
+    X0, Y0 = X0[order], Y0[order]
+    lengthscales, variances, noises = mgpr.hyperparameter_values()
+    by_variance = select_by_variance(X0, lengthscales, variances, noises, 40)
+    by_recency = select_by_recency(X0, 40)
+    assert len(np.unique(by_variance)) == 40
+    assert np.all(
+        prediction_error(X0, Y0, by_variance, lengthscales, variances, noises) <
+        prediction_error(X0, Y0, by_recency, lengthscales, variances, noises)
+    )
+
+
+if __name__ == '__main__':
+    test_active_set()
@@ -0,0 +1,34 @@
+from pilco.models import PILCO
+import numpy as np
+import tensorflow as tf
+from gpflow import autoflow
+
+
+@autoflow()
+def reward_and_gradients(pilco):
+    params = pilco.trainable_tensors
+    reward = pilco._checkpointed_predict(pilco.m_init, pilco.S_init, pilco.horizon)[2]
+    full_reward = pilco._rollout(pilco.m_init, pilco.S_init, pilco.horizon)[2]
+    return [reward, full_reward] + tf.gradients(reward, params) + tf.gradients(full_reward, params)
+
+
+def test_checkpointed_gradients():
+    np.random.seed(0)
+    d = 2  # State dimenstion
+    k = 1  # Controller's output dimension
+
+    X0 = np.random.rand(100, d + k)
+    A = np.random.rand(d + k, d)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, d) - 0.5)
+    # Uneven segments: 4 + 4 + 2 steps
+    pilco = PILCO(X0, Y0, horizon=10, checkpoints=3)
+
+    values = reward_and_gradients(pilco)
+    num_params = (len(values) - 2) // 2
+    np.testing.assert_allclose(values[0], values[1], rtol=1e-8)
+    for g, full_g in zip(values[2:2 + num_params], values[2 + num_params:]):
+        np.testing.assert_allclose(g, full_g, rtol=1e-6, atol=1e-10)
+
+
+if __name__ == '__main__':
+    test_checkpointed_gradients()
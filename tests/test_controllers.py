@@ -1,4 +1,5 @@
 from pilco.controllers import RbfController, LinearController, squash_sin
+from pilco import numpy_backend
 import numpy as np
 import os
 from gpflow import autoflow
@@ -36,9 +37,7 @@ def test_rbf():
     M, S, V = compute_action_wrapper(rbf, m, s)
 
     # convert data to the struct expected by the MATLAB implementation
-    lengthscales = np.stack([model.kern.lengthscales.value for model in rbf.models])
-    variance = np.stack([model.kern.variance.value for model in rbf.models])
-    noise = np.stack([model.likelihood.variance.value for model in rbf.models])
+    lengthscales, variance, noise = rbf.hyperparameter_values()
 
     hyp = np.log(np.hstack(
         (lengthscales,
@@ -61,6 +60,29 @@ def test_rbf():
     np.testing.assert_allclose(S, S_mat, rtol=1e-4)
     np.testing.assert_allclose(V, V_mat, rtol=1e-4)
 
+def test_rbf_shared_basis():
+    np.random.seed(0)
+    d = 3  # Input dimension
+    k = 2  # Number of outputs
+    b = 40 # basis functions
+    rbf = RbfController(d, k, b, max_action=1.5)
+    rbf.randomize()
+
+    # One set of centers and targets for all the controls
+    sizes = {p.pathname.split('/')[-1]: p.size for p in rbf.trainable_parameters}
+    assert sizes == {'centers': b * d, 'targets': b * k,
+                     'basis_lengthscales': k * d, 'basis_noise': k}
+
+    m = np.random.rand(1, d)
+    s = np.random.rand(d, d)
+    s = 0.1 * s.dot(s.T)
+    np_rbf = numpy_backend.RbfController(**rbf.export())
+    M, S, V = compute_action_wrapper(rbf, m, s)
+    M_np, S_np, V_np = np_rbf.compute_action(m, s[None], squash=False)
+    np.testing.assert_allclose(M, M_np, rtol=1e-8)
+    np.testing.assert_allclose(S, S_np[0], rtol=1e-8, atol=1e-12)
+    np.testing.assert_allclose(V, V_np[0], rtol=1e-8, atol=1e-12)
+
 def test_linear():
     np.random.seed(0)
     d = 3  # Input dimension
@@ -122,5 +144,6 @@ def test_squash():
 
 if __name__ == '__main__':
     test_rbf()
+    test_rbf_shared_basis()
     test_linear()
     test_squash()
@@ -0,0 +1,68 @@
+from pilco.models import PILCO
+from pilco.training import HorizonCurriculum
+import numpy as np
+
+
+def test_horizon_curriculum():
+    class Rollouts:
+        variance = 1.0
+
+        def set_horizon(self, horizon):
+            self.horizon = horizon
+
+        def compute_rollout(self):
+            return None, self.variance * np.eye(2), None
+
+    pilco = Rollouts()
+    curriculum = HorizonCurriculum(20, initial=4, growth=2, max_variance=5.0)
+    assert [curriculum(pilco) for _ in range(3)] == [4, 8, 16]
+    # Too uncertain to grow
+    pilco.variance = 10.0
+    assert curriculum(pilco) == 16
+    pilco.variance = 1.0
+    assert [curriculum(pilco) for _ in range(2)] == [20, 20]
+    assert pilco.horizon == 20
+
+
+def test_early_termination():
+    '''
+    Rollouts that stop early agree with the NumPy ones, and the horizon is
+    changed without rebuilding the objective.
+    '''
+    np.random.seed(0)
+    d = 2  # State dimenstion
+    k = 1  # Controller's output dimension
+
+    X0 = np.random.rand(100, d + k)
+    A = np.random.rand(d + k, d)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, d) - 0.5)
+    pilco = PILCO(X0, Y0, horizon=10)
+    pilco.optimize_models(maxiter=20)
+    full = pilco.compute_rollout()
+
+    # Every step starts above the threshold, all of them score the first state
+    stopped = pilco.share_model(max_variance=0.0)
+    m, s, reward = stopped.compute_rollout()
+    np.testing.assert_allclose(m, stopped.m_init)
+    first = stopped.evaluate_policies(stopped._policy_vector()[None])[0]
+    np.testing.assert_allclose(reward[0, 0], first, rtol=1e-6)
+
+    threshold = np.trace(full[1]) / 2
+    stopped = pilco.share_model(max_variance=threshold)
+    m, s, reward = stopped.compute_rollout()
+    assert np.trace(s) > threshold
+    np.testing.assert_allclose(reward[0, 0],
+                               stopped.evaluate_policies(stopped._policy_vector()[None])[0],
+                               rtol=1e-6)
+
+    pilco.set_horizon(5)
+    reward = pilco.compute_reward()
+    np.testing.assert_allclose(reward[0, 0],
+                               pilco.evaluate_policies(pilco._policy_vector()[None])[0],
+                               rtol=1e-6)
+    assert not np.allclose(reward, full[2])
+
+
+if __name__ == '__main__':
+    test_horizon_curriculum()
+    test_early_termination()
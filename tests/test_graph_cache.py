@@ -0,0 +1,111 @@
+from pilco.models import PILCO, MGPR
+from pilco.controllers import RbfController, LinearController
+from pilco import graph_cache
+from pilco import numpy_backend
+from pilco.training import SnapshotPolicy
+import gpflow
+import numpy as np
+import tensorflow as tf
+
+
+def cached_graphs():
+    return sum(len(entries) for entries in graph_cache._graphs.values())
+
+
+def test_shared_graphs():
+    '''
+    Objects with the same structure evaluate one graph, each with its own
+    parameters and data.
+    '''
+    np.random.seed(0)
+    d = 2  # State dimenstion
+    k = 1  # Controller's output dimension
+    graph_cache.clear()
+
+    pilcos = []
+    for _ in range(3):
+        X0 = np.random.rand(50, d + k)
+        A = np.random.rand(d + k, d)
+        Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(50, d) - 0.5)
+        controller = RbfController(d, k, num_basis_functions=5, max_action=1.0)
+        pilcos.append(PILCO(X0, Y0, horizon=10, controller=controller,
+                            m_init=np.zeros((1, d)), S_init=0.1 * np.eye(d)))
+
+    x = np.random.rand(1, d)
+    for pilco in pilcos:
+        np.testing.assert_allclose(pilco.compute_action(x),
+                                   SnapshotPolicy(pilco.controller).compute_action(x),
+                                   rtol=1e-8)
+    assert cached_graphs() == 1
+
+    m = np.random.rand(1, d + k)
+    s = np.random.rand(d + k, d + k)
+    s = 0.1 * s.dot(s.T)
+    for pilco in pilcos:
+        M, S, V = pilco.mgpr.compute_prediction(m, s)
+        mgpr = numpy_backend.MGPR(**pilco.mgpr.export())
+        M_np, S_np, V_np = mgpr.predict_on_noisy_inputs(m, s[None])
+        np.testing.assert_allclose(M, M_np, rtol=1e-6)
+        np.testing.assert_allclose(S, S_np[0], rtol=1e-6)
+        np.testing.assert_allclose(V, V_np[0], rtol=1e-6)
+
+    # Another structure has its own graph
+    X0 = np.random.rand(50, d + k)
+    mgpr = MGPR(X0, np.sin(X0))
+    mgpr.compute_prediction(m, s)
+    assert cached_graphs() == 4
+
+
+def test_structure_key():
+    '''
+    Attributes and transforms that the graphs depend on separate the
+    objects, and objects that can't be compared get graphs of their own.
+    '''
+    np.random.seed(0)
+    graph_cache.clear()
+    x = np.random.rand(1, 2)
+
+    # Lists are compared by value
+    controllers = [LinearController(2, 2, max_action=[1.0, 2.0]),
+                   LinearController(2, 2, max_action=[3.0, 4.0]),
+                   LinearController(2, 2, max_action=[3.0, 4.0])]
+    keys = [graph_cache.structure_key(controller) for controller in controllers]
+    assert keys[0] != keys[1] and keys[1] == keys[2]
+
+    # So are the transforms of the parameters
+    with gpflow.defer_build():
+        positive = LinearController(2, 2, max_action=[1.0, 2.0])
+        positive.b.transform = gpflow.transforms.Log1pe(lower=1e-3)
+    assert graph_cache.structure_key(positive) != keys[0]
+
+    # An attribute of unknown type
+    controllers[2].action_filter = lambda u: u
+    assert graph_cache.structure_key(controllers[2]) is None
+
+    for controller in controllers:
+        pilco = PILCO(np.random.rand(20, 4), np.random.rand(20, 2), horizon=2,
+                      controller=controller)
+        np.testing.assert_allclose(pilco.compute_action(x),
+                                   SnapshotPolicy(controller).compute_action(x), rtol=1e-8)
+    assert cached_graphs() == 2
+
+
+def test_graphs_released():
+    '''
+    The cache refers to the tensors of its graphs by name, so that the graphs
+    of closed sessions can be released.
+    '''
+    graph_cache.clear()
+    graph = tf.Graph()
+    with tf.Session(graph=graph):
+        pilco = PILCO(np.random.rand(20, 3), np.random.rand(20, 2), horizon=2)
+        pilco.compute_action(np.random.rand(1, 2))
+    assert list(graph_cache._graphs.keys()) == [graph]
+    for entry in graph_cache._graphs[graph].values():
+        assert all(isinstance(name, str) for name in tf.contrib.framework.nest.flatten(entry))
+
+
+if __name__ == '__main__':
+    test_shared_graphs()
+    test_structure_key()
+    test_graphs_released()
@@ -0,0 +1,80 @@
+from pilco.models import MGPR
+from pilco.models import iterative
+import numpy as np
+import tensorflow as tf
+from gpflow import settings
+
+float_type = settings.dtypes.float_type
+
+
+def rbf(X, lengthscales, variance):
+    d = (X[:, None, :] - X[None, :, :]) / lengthscales
+    return variance * np.exp(-np.sum(np.square(d), -1) / 2)
+
+
+def test_conjugate_gradient():
+    np.random.seed(0)
+    N = 300
+    X = np.random.rand(N, 2) * 3
+    K = np.stack([rbf(X, 0.5, 1.0), rbf(X, 1.0, 2.0)])
+    noise = np.array([1e-2, 1e-1])
+    Kn = K + noise[:, None, None] * np.eye(N)
+    B = np.random.randn(2, N, 3)
+
+    L = iterative.pivoted_cholesky(tf.constant(K), rank=30)
+    precondition, logdet_P = iterative.preconditioner(L, tf.constant(noise))
+    solution = iterative.conjugate_gradient(tf.constant(Kn), tf.constant(B), precondition,
+                                            tolerance=1e-10)[0]
+    Z = iterative.probes(L, tf.constant(noise), 20)
+    _, alphas, betas, active = iterative.conjugate_gradient(tf.constant(Kn), Z, precondition)
+    norms = tf.reduce_sum(Z * precondition(Z), 1)
+    logdet = logdet_P + iterative.lanczos_logdet(alphas, betas, active, norms)
+    with tf.Session() as sess:
+        solution, logdet = sess.run([solution, logdet])
+
+    np.testing.assert_allclose(solution, np.linalg.solve(Kn, B), rtol=1e-4, atol=1e-6)
+    np.testing.assert_allclose(logdet, np.linalg.slogdet(Kn)[1], rtol=1e-2)
+
+
+def test_cg_mgpr():
+    np.random.seed(0)
+    d = 3  # Input dimension
+    k = 2  # Number of outputs
+    X0 = np.random.rand(200, d)
+    A = np.random.rand(d, k)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(200, k) - 0.5)
+
+    mgpr = MGPR(X0, Y0)
+    mgpr.optimize(maxiter=100)
+    cg = MGPR(X0, Y0, solver='cg')
+    cg.set_hyperparameters(*mgpr.hyperparameter_values())
+
+    for model, cg_model in zip(mgpr.models, cg.models):
+        np.testing.assert_allclose(cg_model.compute_log_likelihood(),
+                                   model.compute_log_likelihood(), rtol=1e-2)
+
+    m = np.random.rand(1, d)
+    s = np.random.rand(d, d)
+    s = 0.01 * s.dot(s.T)
+    M, S, V = mgpr.compute_prediction(m, s)
+    M_cg, S_cg, V_cg = cg.compute_prediction(m, s)
+    np.testing.assert_allclose(M_cg, M, rtol=1e-4)
+    np.testing.assert_allclose(V_cg, V, rtol=1e-3, atol=1e-6)
+    # The expected posterior variance is taken at the sigma points
+    np.testing.assert_allclose(S_cg, S, rtol=1e-1, atol=1e-5)
+
+    # The NumPy predictions of evaluate_policies and MPC need inv(K)
+    try:
+        cg.export()
+        assert False
+    except ValueError:
+        pass
+
+    # Training without Cholesky
+    cg.optimize(maxiter=20)
+    assert all(np.isfinite(cg_model.compute_log_likelihood()) for cg_model in cg.models)
+
+
+if __name__ == '__main__':
+    test_conjugate_gradient()
+    test_cg_mgpr()
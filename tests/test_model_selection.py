@@ -0,0 +1,83 @@
+from pilco.models import PILCO, MGPR, SMGPR
+from pilco.models import model_selection
+import numpy as np
+from gpflow import settings
+
+
+def test_affordable_points():
+    itemsize = np.dtype(settings.float_type).itemsize
+    budget = model_selection.LIVE_TENSORS * itemsize * 3**2 * 100**2
+    np.testing.assert_allclose(model_selection.affordable_points(3, memory_budget=budget), 100)
+    # Predictions take time quadratic in the number of points
+    np.testing.assert_allclose(
+        model_selection.affordable_points(3, time_budget=0.4, measured=(50, 0.1)), 100)
+    assert model_selection.affordable_points(3) == np.inf
+
+
+def test_select_model():
+    np.random.seed(0)
+    X = np.random.rand(80, 2)
+    Y = np.sin(X)
+    assert model_selection.select_model(X, Y, 80) is None
+    # Candidates of 40, 20 and 10 points, the fewest within the tolerance
+    model = model_selection.select_model(X, Y, 40, tolerance=np.inf, maxiter=5)
+    assert isinstance(model, SMGPR) and model.num_induced_points == 10
+    # Fitted to the held-in data, and holding all of it
+    lengthscales, _, _ = model.hyperparameter_values()
+    assert not np.allclose(lengthscales, 1.0)
+    assert model.num_datapoints == 80
+    model = model_selection.select_model(X, Y, 40, tolerance=0.0, maxiter=5)
+    assert model.num_induced_points in (10, 20, 40)
+
+
+def test_autotune_model():
+    np.random.seed(0)
+    d = 2  # State dimension
+    k = 1  # Control dimension
+    X = np.random.rand(120, d + k)
+    Y = np.sin(X[:, :d]) + 1e-2 * np.random.rand(120, d)
+    pilco = PILCO(X[:40], Y[:40], horizon=3)
+    other = pilco.share_model()
+    pilco.optimize_models()
+    # The control doesn't affect the transitions
+    np.testing.assert_array_equal(pilco.prune_inputs(threshold=0.15), np.arange(d))
+    pilco.optimize_models()
+    reward = pilco.compute_reward()
+    hyperparameters = pilco.mgpr.hyperparameter_values()
+
+    itemsize = np.dtype(settings.float_type).itemsize
+    budget = model_selection.LIVE_TENSORS * itemsize * d**2 * 50**2
+    # Small data fits within the budget, the exact model is kept
+    assert pilco.autotune_model(X[:50], Y[:50], memory_budget=budget) is None
+    assert type(pilco.mgpr) is MGPR
+    assert pilco.mgpr.num_datapoints == 50
+
+    # Large data doesn't, the sparse model selected within the budget, as
+    # fitted, replaces it for both objects
+    M = pilco.autotune_model(X, Y, memory_budget=budget, maxiter=10)
+    assert M is not None and M <= 50
+    assert isinstance(pilco.mgpr, SMGPR) and other.mgpr is pilco.mgpr
+    assert pilco.mgpr.num_induced_points == M
+    lengthscales, _, _ = pilco.mgpr.hyperparameter_values()
+    assert not np.allclose(lengthscales, 1.0)
+    # The pruned inputs stay pruned
+    np.testing.assert_array_equal(pilco.mgpr.active_dims, np.arange(d))
+    assert np.isfinite(pilco.compute_reward())
+    # The policy of the other object, reward compared below unchanged
+    other.optimize_policy(maxiter=2)
+    assert np.isfinite(other.compute_reward())
+
+    # Back to the exact model
+    assert other.autotune_model(X[:40], Y[:40], memory_budget=budget) is None
+    assert type(pilco.mgpr) is MGPR and other.mgpr is pilco.mgpr
+    np.testing.assert_array_equal(pilco.mgpr.active_dims, np.arange(d))
+    # Fits from other starts may end in other optima, the same
+    # hyperparameters give the same reward
+    pilco.mgpr.set_hyperparameters(*hyperparameters)
+    np.testing.assert_allclose(pilco.compute_reward(), reward, rtol=1e-6)
+
+
+if __name__ == '__main__':
+    test_affordable_points()
+    test_select_model()
+    test_autotune_model()
@@ -0,0 +1,45 @@
+from pilco import numpy_backend
+from pilco.mpc import MPC
+import numpy as np
+
+
+def make_model():
+    # x' = x + u/2
+    np.random.seed(0)
+    X = 4 * np.random.rand(50, 2) - 2
+    Y = X[:, 1:2] / 2
+    lengthscales = np.array([[3.0, 3.0]]); variance = np.array([1.0]); noise = np.array([1e-4])
+    iK, beta = numpy_backend.factorize(X[None], Y[None], lengthscales[None],
+                                       variance[None], noise[None])
+    return numpy_backend.MGPR(X, lengthscales, variance, iK[0], beta[0], noise)
+
+
+def test_mpc():
+    mgpr = make_model()
+    reward = numpy_backend.ExponentialReward(np.eye(1), np.array([[1.0]]))
+    mpc = MPC(mgpr, reward, control_dim=1, horizon=5, max_action=1.0, iterations=10)
+    m = np.zeros((1, 1)); s = 0.01 * np.eye(1)
+
+    # Open-loop sequences match the rollouts of constant linear controllers
+    u = np.array([0.3, -0.5])
+    values = mpc.evaluate(m, s, np.tile(u[:, None, None], [1, 5, 1]))
+    for value, action in zip(values, u):
+        controller = numpy_backend.LinearController(np.zeros((1, 1)), np.arcsin([[action]]), 1.0)
+        pilco = numpy_backend.PILCO(mgpr, controller, reward)
+        np.testing.assert_allclose(value, pilco.predict(m, s[None], 5)[2][0], rtol=1e-8)
+
+    # The target is ahead, the first action pushes towards it
+    action = mpc.compute_action(m)
+    assert action.shape == (1, 1)
+    assert 0 < action[0, 0] <= 1.0
+    # The next plan starts from the shifted one
+    assert mpc.plan.shape == (5, 1)
+
+    # With no time to plan, the warm start is returned
+    mpc.time_budget = 0.0
+    plan = mpc.plan
+    np.testing.assert_allclose(mpc.compute_action(m), plan[1:2])
+
+
+if __name__ == '__main__':
+    test_mpc()
@@ -0,0 +1,74 @@
+from pilco.models import MGPR
+from pilco import numpy_backend
+import numpy as np
+from gpflow import autoflow
+from gpflow import settings
+
+float_type = settings.dtypes.float_type
+
+@autoflow((float_type,[None, None]), (float_type,[None, None]))
+def predict_wrapper(mgpr, m, s):
+    return mgpr.predict_on_noisy_inputs(m, s)
+
+def test_normalization():
+    '''
+    On badly scaled data the normalized model predicts in the original units:
+    as the NumPy implementation, and a Monte Carlo estimate of the moments, do,
+    and close to a model fitted to the raw data.
+    '''
+    np.random.seed(0)
+    d = 3  # Input dimension
+    k = 2  # Number of outputs
+    input_scales = np.array([100.0, 1.0, 0.01])
+    output_scales = np.array([10.0, 0.1])
+
+    X0 = np.random.rand(100, d)
+    A = np.random.rand(d, k)
+    Y0 = (np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, k) - 0.5)) * output_scales
+    X0 = X0 * input_scales
+    mgpr = MGPR(X0, Y0, normalize=True)
+    mgpr.optimize()
+    raw = MGPR(X0, Y0)
+    raw.optimize(restarts=3)
+
+    m = np.random.rand(1, d) * input_scales
+    s = np.random.rand(d, d)
+    s = 1e-3 * s.dot(s.T) * input_scales[:, None] * input_scales[None, :]
+
+    M, S, V = predict_wrapper(mgpr, m, s)
+    params = mgpr.export()
+    M_np, S_np, V_np = numpy_backend.MGPR(**params).predict_on_noisy_inputs(m, s[None])
+    # The noise of the normalized data is at its lower bound and the
+    # covariances have condition numbers ~1e9, so the order of the operations
+    # shows at the 1e-5 level, in the small entries of S (differences of large
+    # ones) in particular. Compared in units of the scales of the data.
+    S_scale = output_scales[:, None] * output_scales[None, :]
+    V_scale = output_scales[None, :] / input_scales[:, None]
+    np.testing.assert_allclose(M, M_np, rtol=1e-6)
+    np.testing.assert_allclose(S / S_scale, S_np[0] / S_scale, rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(V / V_scale, V_np[0] / V_scale, rtol=1e-4, atol=1e-5)
+
+    # Monte Carlo estimate of the moments, with the posterior of the
+    # normalized GPs mapped back to the original units
+    x = np.random.multivariate_normal(m[0], s, size=200000)
+    k = numpy_backend.kernel((x - params['input_mean']) / params['input_scale'],
+                             params['X'], params['lengthscales'], params['variance'])
+    f = np.einsum('epn,en->pe', k, params['beta']) * params['output_scale'] \
+        + params['output_mean']
+    latent_variance = (params['variance'][None, :] - np.einsum(
+        'epn,enm,epm->pe', k, params['iK'], k)) * params['output_scale']**2
+    M_mc = np.mean(f, 0)[None, :]
+    S_mc = np.cov(f.T) + np.diag(np.mean(latent_variance, 0))
+    C_mc = np.cov(np.hstack([x, f]).T)[:d, d:]
+    C_scale = input_scales[:, None] * output_scales[None, :]
+    np.testing.assert_allclose(M / output_scales, M_mc / output_scales, rtol=1e-2, atol=1e-2)
+    np.testing.assert_allclose(S / S_scale, S_mc / S_scale, rtol=5e-2, atol=1e-2)
+    np.testing.assert_allclose(s @ V / C_scale, C_mc / C_scale, rtol=5e-2, atol=1e-2)
+
+    M_raw, S_raw, V_raw = predict_wrapper(raw, m, s)
+    # The raw data is harder to fit, within the predicted spread
+    assert np.all(np.abs(M - M_raw) < np.sqrt(np.diag(S)))
+
+
+if __name__ == '__main__':
+    test_normalization()
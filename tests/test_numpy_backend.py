@@ -0,0 +1,94 @@
+from pilco.models import PILCO
+from pilco.controllers import RbfController
+from pilco.rewards import ExponentialReward
+from pilco import numpy_backend
+from pilco.training import SnapshotPolicy
+import numpy as np
+import pickle
+import subprocess
+import sys
+from gpflow import autoflow
+from gpflow import settings
+
+float_type = settings.dtypes.float_type
+
+@autoflow((float_type,[None, None]), (float_type,[None, None]), (np.int32, []))
+def predict_wrapper(pilco, m, s, horizon):
+    return pilco.predict(m, s, horizon)
+
+@autoflow((float_type,[None, None]), (float_type,[None, None]))
+def predict_one_step_wrapper(mgpr, m, s):
+    return mgpr.predict_on_noisy_inputs(m, s)
+
+@autoflow((float_type,[None, None]), (float_type,[None, None]))
+def compute_action_wrapper(controller, m, s):
+    return controller.compute_action(m, s)
+
+def test_numpy_backend():
+    np.random.seed(0)
+    d = 2  # State dimenstion
+    k = 1  # Controller's output dimension
+    horizon = 10
+
+    # Training Dataset
+    X0 = np.random.rand(100, d + k)
+    A = np.random.rand(d + k, d)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, d) - 0.5)  #  Just something smooth
+    controller = RbfController(d, k, num_basis_functions=10, max_action=2.0)
+    reward = ExponentialReward(d, t=np.array([0.5, 0.5]))
+    pilco = PILCO(X0, Y0, controller=controller, reward=reward)
+    pilco.optimize_models(maxiter=50)
+
+    mgpr = numpy_backend.MGPR(**pilco.mgpr.export())
+    rbf = numpy_backend.RbfController(**controller.export())
+    exp_reward = numpy_backend.ExponentialReward(**reward.export())
+    np_pilco = numpy_backend.PILCO(mgpr, rbf, exp_reward)
+
+    # A batch of two input distributions
+    m = np.random.rand(2, d + k)
+    s = np.random.rand(2, d + k, d + k)
+    s = s @ np.transpose(s, [0, 2, 1])
+
+    M, S, V = mgpr.predict_on_noisy_inputs(m, s)
+    for b in range(2):
+        M_tf, S_tf, V_tf = predict_one_step_wrapper(pilco.mgpr, m[b:b+1], s[b])
+        np.testing.assert_allclose(M[b:b+1], M_tf, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(S[b], S_tf, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(V[b], V_tf, rtol=1e-8, atol=1e-10)
+
+    M, S, V = rbf.compute_action(m[:, :d], s[:, :d, :d])
+    for b in range(2):
+        M_tf, S_tf, V_tf = compute_action_wrapper(controller, m[b:b+1, :d], s[b, :d, :d])
+        np.testing.assert_allclose(M[b:b+1], M_tf, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(S[b], S_tf, rtol=1e-8, atol=1e-10)
+        np.testing.assert_allclose(V[b], V_tf, rtol=1e-8, atol=1e-10)
+
+    M, S, total_reward = np_pilco.predict(m[:, :d], s[:, :d, :d], horizon)
+    for b in range(2):
+        M_tf, S_tf, reward_tf = predict_wrapper(pilco, m[b:b+1, :d], s[b, :d, :d], horizon)
+        np.testing.assert_allclose(M[b:b+1], M_tf, rtol=1e-6, atol=1e-10)
+        np.testing.assert_allclose(S[b], S_tf, rtol=1e-6, atol=1e-10)
+        np.testing.assert_allclose(total_reward[b], reward_tf[0, 0], rtol=1e-6, atol=1e-10)
+
+    # The policy snapshots used by the training loop act as the controller
+    np.testing.assert_allclose(
+        SnapshotPolicy(controller).compute_action(m[:, :d]),
+        np.vstack([pilco.compute_action(m[b:b+1, :d]) for b in range(2)]),
+        rtol=1e-8, atol=1e-10)
+
+    # and can be sent to processes without TensorFlow
+    code = "import sys, pickle; pickle.loads(sys.stdin.buffer.read()); " \
+           "assert 'tensorflow' not in sys.modules"
+    subprocess.run([sys.executable, '-c', code], input=pickle.dumps(SnapshotPolicy(controller)),
+                   check=True)
+
+def test_import_without_tensorflow():
+    code = "import sys, pilco.numpy_backend, pilco.optimizers, pilco.models.active_set, " \
+           "pilco.training; " \
+           "assert 'tensorflow' not in sys.modules and 'pandas' not in sys.modules"
+    subprocess.check_call([sys.executable, '-c', code])
+
+
+if __name__ == '__main__':
+    test_numpy_backend()
+    test_import_without_tensorflow()
@@ -0,0 +1,78 @@
+from pilco.models import MGPR
+import pilco.models.mgpr as mgpr_module
+from pilco.optimizers import Scheduler
+import numpy as np
+
+
+def test_scheduler_deadlines():
+    scheduler = Scheduler(time_budget=10.0, model_share=0.3)
+    scheduler.start_iteration()
+    start = scheduler.iteration_start
+    np.testing.assert_allclose(scheduler.deadline('models'), start + 3.0)
+    np.testing.assert_allclose(scheduler.deadline('policy'), start + 10.0)
+    assert Scheduler().deadline('models') is None
+    # Optimising the policy again, without a model fit, is a new iteration
+    scheduler.iteration_start = 0.0
+    assert scheduler.deadline('policy') > 10.0
+
+
+def test_exhausted_budget_skips_restarts():
+    np.random.seed(0)
+    d = 3  # Input dimension
+    k = 2  # Number of outputs
+
+    X0 = np.random.rand(100, d)
+    A = np.random.rand(d, k)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, k) - 0.5)
+    mgpr = MGPR(X0, Y0)
+    mgpr.optimize(maxiter=20)
+    values = mgpr.read_values()
+
+    scheduler = Scheduler(time_budget=0.0)
+    scheduler.start_iteration()
+    mgpr.optimize(restarts=5, maxiter=20, scheduler=scheduler)
+
+    # No restart fits in the budget, so the hyperparameters are left untouched
+    for key, value in mgpr.read_values().items():
+        np.testing.assert_allclose(value, values[key])
+
+    # Nor does more than the first iteration of the first fit
+    scheduler.start_iteration()
+    mgpr = MGPR(X0, Y0)
+    mgpr.optimize(maxiter=1000, scheduler=scheduler)
+    for optimizer in mgpr.optimizers:
+        assert optimizer._optimizer.optimizer_kwargs['options']['maxiter'] == 0
+
+
+def test_warm_started_refits():
+    np.random.seed(0)
+    d = 3  # Input dimension
+    k = 2  # Number of outputs
+
+    X0 = np.random.rand(101, d)
+    A = np.random.rand(d, k)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(101, k) - 0.5)
+    mgpr = MGPR(X0[:100], Y0[:100])
+    mgpr.optimize(maxiter=50)
+
+    restarts = []
+    randomize = mgpr_module.randomize
+    mgpr_module.randomize = lambda model: (restarts.append(model), randomize(model))
+    try:
+        # One more point barely changes the likelihood, so no restarts are run
+        mgpr.set_XY(X0, Y0)
+        mgpr.optimize(restarts=3, maxiter=50, warm_start_iter=10, restart_threshold=0.1)
+        assert len(restarts) == 0
+        # Unless any drop triggers them
+        mgpr.set_XY(X0[:50], 2 * Y0[:50])
+        mgpr.optimize(restarts=3, maxiter=50, warm_start_iter=10, restart_threshold=-np.inf)
+        assert len(restarts) == 3 * k
+    finally:
+        mgpr_module.randomize = randomize
+    assert len(mgpr.log_likelihoods) == k
+
+
+if __name__ == '__main__':
+    test_scheduler_deadlines()
+    test_exhausted_budget_skips_restarts()
+    test_warm_started_refits()
@@ -0,0 +1,87 @@
+from pilco import numpy_backend
+from pilco.parallel import ShardedMGPR
+import numpy as np
+
+
+def test_sharded_mgpr():
+    np.random.seed(0)
+    N, d, k = 300, 3, 2
+    X = 3 * np.random.rand(N, d)
+    Y = np.stack([np.sin(X).sum(1), np.cos(X).sum(1)], 1) + 0.05 * np.random.randn(N, k)
+    lengthscales = np.array([[0.8, 1.0, 1.2], [1.1, 0.9, 0.7]])
+    variance = np.array([1.2, 0.8])
+    noise = np.array([1e-2, 2e-2])
+
+    iK, beta = numpy_backend.factorize(X[None], Y[None], lengthscales[None],
+                                       variance[None], noise[None])
+    mgpr = numpy_backend.MGPR(X, lengthscales, variance, iK[0], beta[0])
+
+    with ShardedMGPR(X, Y, processes=3, hyperparameters=(lengthscales, variance, noise)) as sharded:
+        np.testing.assert_allclose(sharded.beta, beta[0], rtol=1e-4, atol=1e-4)
+
+        m = 3 * np.random.rand(4, d)
+        s = np.random.rand(4, d, d)
+        s = 0.02 * s @ np.swapaxes(s, 1, 2)
+        M, S, V = mgpr.predict_on_noisy_inputs(m, s)
+        M_, S_, V_ = sharded.predict_on_noisy_inputs(m, s)
+        np.testing.assert_allclose(M_, M, atol=1e-4)
+        np.testing.assert_allclose(V_, V, atol=1e-4)
+        # The expected posterior variance is taken at the sigma points
+        np.testing.assert_allclose(S_, S, atol=1e-2)
+
+        K = variance[:, None, None] * numpy_backend.kernel(X, X, lengthscales, np.ones(k)) + \
+            noise[:, None, None] * np.eye(N)
+        exact = -0.5 * (N * np.log(2 * np.pi) + np.linalg.slogdet(K)[1] +
+                        np.einsum('ne,enm,me->e', Y, np.linalg.inv(K), Y))
+        prior = -np.sum(lengthscales, -1) / 10 + 0.5 * np.log(variance) - variance / 2
+        np.testing.assert_allclose(sharded.log_likelihood(), exact + prior, rtol=5e-2)
+
+        before = np.sum(sharded.log_likelihood())
+        sharded.optimize(maxiter=10)
+        assert np.sum(sharded.log_likelihood()) > before
+
+        # An error in the workers leaves them in step with the parent
+        try:
+            sharded._run('unknown')
+            assert False
+        except ValueError:
+            pass
+        np.testing.assert_allclose(sharded.matvec(Y.T[:, :, None]),
+                                   sharded.matvec(Y.T[:, :, None]))
+
+
+def test_sharded_gradient():
+    '''
+    The gradient of log_likelihood against central differences of it, in
+    the log hyperparameters. Both are stochastic estimates, with enough
+    probes to agree within a few percent.
+    '''
+    np.random.seed(0)
+    N, d, k = 300, 3, 2
+    X = 3 * np.random.rand(N, d)
+    Y = np.stack([np.sin(X).sum(1), np.cos(X).sum(1)], 1) + 0.05 * np.random.randn(N, k)
+    x = np.log(np.array([[0.8, 1.0, 1.2, 1.2, 1e-2], [1.1, 0.9, 0.7, 0.8, 2e-2]]))
+
+    def hyperparameters(x):
+        x = np.exp(x)
+        return x[:, :d], x[:, d], x[:, d + 1]
+
+    with ShardedMGPR(X, Y, processes=3, num_probes=200,
+                     hyperparameters=hyperparameters(x)) as sharded:
+        gradient = sharded.log_likelihood(gradient=True)[1]
+        differences = np.zeros_like(x)
+        step = 1e-4
+        for i in np.ndindex(*x.shape):
+            values = []
+            for sign in [1, -1]:
+                shifted = x.copy()
+                shifted[i] += sign * step
+                sharded.set_hyperparameters(*hyperparameters(shifted))
+                values.append(sharded.log_likelihood()[i[0]])
+            differences[i] = (values[0] - values[1]) / (2 * step)
+    np.testing.assert_allclose(gradient, differences, rtol=1e-1)
+
+
+if __name__ == '__main__':
+    test_sharded_mgpr()
+    test_sharded_gradient()
@@ -0,0 +1,49 @@
+from pilco.models import PILCO
+from pilco.controllers import RbfController, LinearController
+from pilco.optimizers import cross_entropy_method
+import numpy as np
+
+
+def test_cross_entropy_method():
+    np.random.seed(0)
+    target = np.array([1.0, -2.0, 0.5])
+    objective = lambda population: -np.sum(np.square(population - target), 1)
+    best, value, elites = cross_entropy_method(objective, np.zeros(3), 1.0, iterations=50)
+    np.testing.assert_allclose(best, target, atol=1e-2)
+    assert elites.shape == (8, 3)
+
+
+def test_population_rollouts():
+    '''
+    The batched NumPy rollouts agree with the TensorFlow objective, and the
+    search improves on the initial controller.
+    '''
+    np.random.seed(0)
+    d = 2  # State dimenstion
+    k = 1  # Controller's output dimension
+
+    X0 = np.random.rand(100, d + k)
+    A = np.random.rand(d + k, d)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, d) - 0.5)
+    for controller in [LinearController(d, k, max_action=1.0),
+                       RbfController(d, k, num_basis_functions=5, max_action=1.0)]:
+        pilco = PILCO(X0, Y0, horizon=10, controller=controller)
+        pilco.optimize_models(maxiter=20)
+
+        vector = pilco._policy_vector()
+        population = vector + 0.1 * np.random.normal(size=(3, vector.size))
+        population[0] = vector
+        values = pilco.evaluate_policies(population)
+        np.testing.assert_allclose(values[0], pilco.compute_reward()[0, 0], rtol=1e-6)
+        pilco._set_policy_vector(population[2])
+        np.testing.assert_allclose(values[2], pilco.compute_reward()[0, 0], rtol=1e-6)
+
+        initial = pilco.compute_reward()[0, 0]
+        pilco.optimize_policy_population(iterations=5, population_size=16, num_elites=4,
+                                         polish=2, maxiter=5)
+        assert pilco.compute_reward()[0, 0] >= initial
+
+
+if __name__ == '__main__':
+    test_cross_entropy_method()
+    test_population_rollouts()
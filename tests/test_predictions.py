@@ -67,5 +67,33 @@ def test_predictions():
     np.testing.assert_allclose(V, V_mat, rtol=1e-4)
 
 
+@autoflow((float_type,[None, None]), (float_type,[None, None]))
+def indexed_wrapper(mgpr, m, s):
+    # Two predictions sharing one model index
+    iK, beta = mgpr.calculate_factorizations()
+    index = mgpr.model_index()
+    return (mgpr.predict_gaussian(m, s, iK, beta, index) +
+            mgpr.predict_gaussian(2*m, s/2, iK, beta, index))
+
+def test_model_index():
+    np.random.seed(0)
+    d = 3  # Input dimension
+    k = 2  # Number of outputs
+    X0 = np.random.rand(100, d)
+    A = np.random.rand(d, k)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, k) - 0.5)
+    mgpr = MGPR(X0, Y0)
+    mgpr.optimize()
+
+    m = np.random.rand(1, d)
+    s = np.random.rand(d, d)
+    s = s.dot(s.T)
+    predictions = indexed_wrapper(mgpr, m, s)
+    for expected, actual in zip(predict_wrapper(mgpr, m, s) + predict_wrapper(mgpr, 2*m, s/2),
+                                predictions):
+        np.testing.assert_allclose(actual, expected, rtol=1e-10)
+
+
 if __name__ == '__main__':
     test_predictions()
+    test_model_index()
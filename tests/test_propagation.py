@@ -0,0 +1,55 @@
+from pilco.models import MGPR
+import numpy as np
+from gpflow import autoflow
+from gpflow import settings
+
+float_type = settings.dtypes.float_type
+
+@autoflow((float_type,[None, None]), (float_type,[None, None]))
+def moment_matching_wrapper(mgpr, m, s):
+    mgpr.propagation = 'moment_matching'
+    return mgpr.predict_on_noisy_inputs(m, s)
+
+@autoflow((float_type,[None, None]), (float_type,[None, None]))
+def unscented_wrapper(mgpr, m, s):
+    mgpr.propagation = 'unscented'
+    return mgpr.predict_on_noisy_inputs(m, s)
+
+@autoflow((float_type,[None, None]), (float_type,[None, None]))
+def linearized_wrapper(mgpr, m, s):
+    mgpr.propagation = 'linearized'
+    return mgpr.predict_on_noisy_inputs(m, s)
+
+def test_propagation():
+    '''
+    For a nearly deterministic input all the approximations should agree with
+    exact moment matching.
+    '''
+    np.random.seed(0)
+    d = 3  # Input dimension
+    k = 2  # Number of outputs
+
+    # Training Dataset
+    X0 = np.random.rand(100, d)
+    A = np.random.rand(d, k)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, k) - 0.5)  #  Just something smooth
+    mgpr = MGPR(X0, Y0)
+    mgpr.optimize()
+
+    m = np.random.rand(1, d)
+    s = np.random.rand(d, d)
+    s = 1e-3 * s.dot(s.T)
+
+    M, S, V = moment_matching_wrapper(mgpr, m, s)
+    for wrapper in [unscented_wrapper, linearized_wrapper]:
+        M_, S_, V_ = wrapper(mgpr, m, s)
+        assert M_.shape == M.shape
+        assert S_.shape == S.shape
+        assert V_.shape == V.shape
+        np.testing.assert_allclose(M_, M, rtol=1e-2, atol=1e-3)
+        np.testing.assert_allclose(S_, S, rtol=5e-2, atol=1e-5)
+        np.testing.assert_allclose(V_, V, rtol=5e-2, atol=1e-3)
+
+
+if __name__ == '__main__':
+    test_propagation()
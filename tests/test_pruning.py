@@ -0,0 +1,52 @@
+from pilco.models import MGPR
+from pilco import numpy_backend
+import numpy as np
+from gpflow import autoflow
+from gpflow import settings
+
+float_type = settings.dtypes.float_type
+
+@autoflow((float_type,[None, None]), (float_type,[None, None]))
+def predict_wrapper(mgpr, m, s):
+    return mgpr.predict_on_noisy_inputs(m, s)
+
+def test_pruning():
+    np.random.seed(0)
+    d = 4  # Input dimension
+    k = 2  # Number of outputs
+
+    # Only the first two inputs matter
+    X0 = np.random.rand(100, d)
+    A = np.random.rand(2, k)
+    Y0 = np.sin(X0[:, :2]).dot(A) + 1e-3*(np.random.rand(100, k) - 0.5)
+    mgpr = MGPR(X0, Y0)
+    mgpr.optimize()
+
+    m = np.random.rand(1, d)
+    s = np.random.rand(d, d)
+    s = 0.1 * s.dot(s.T)
+    M, S, V = predict_wrapper(mgpr, m, s)
+
+    active_dims = mgpr.prune_inputs(threshold=0.05)
+    np.testing.assert_array_equal(active_dims, [0, 1])
+    assert mgpr.models[0].X.value.shape == (100, 2)
+
+    M_, S_, V_ = predict_wrapper(mgpr, m, s)
+    # The learned lengthscales of the dropped inputs are ~100 times the spread
+    # of the data along them, so dropping them barely changes the predictions
+    np.testing.assert_allclose(M_, M, rtol=1e-3, atol=1e-3)
+    np.testing.assert_allclose(S_, S, rtol=1e-3, atol=1e-3)
+    np.testing.assert_allclose(V_, V, rtol=1e-3, atol=1e-3)
+
+    M_np, S_np, V_np = numpy_backend.MGPR(**mgpr.export()).predict_on_noisy_inputs(m, s[None])
+    np.testing.assert_allclose(M_, M_np, rtol=1e-8)
+    np.testing.assert_allclose(S_, S_np[0], rtol=1e-8)
+    np.testing.assert_allclose(V_, V_np[0], rtol=1e-8, atol=1e-12)
+
+    # New data is pruned the same way
+    mgpr.set_XY(X0[:50], Y0[:50])
+    assert mgpr.models[0].X.value.shape == (50, 2)
+
+
+if __name__ == '__main__':
+    test_pruning()
@@ -0,0 +1,63 @@
+from pilco.models import RFFMGPR
+import numpy as np
+from gpflow import autoflow
+from gpflow import settings
+
+float_type = settings.dtypes.float_type
+
+@autoflow((float_type,[None, None]), (float_type,[None, None]))
+def predict_wrapper(rffmgpr, m, s):
+    return rffmgpr.predict_on_noisy_inputs(m, s)
+
+@autoflow()
+def get_factorizations(rffmgpr):
+    return rffmgpr.calculate_factorizations()
+
+@autoflow()
+def get_features(rffmgpr):
+    return rffmgpr.omega, rffmgpr.phases, rffmgpr.amplitudes
+
+def test_rff_predictions():
+    '''
+    Compares the moment matching with a Monte Carlo estimate of the moments
+    of the same feature expansion.
+    '''
+    np.random.seed(0)
+    d = 3  # Input dimension
+    k = 2  # Number of outputs
+
+    # Training Dataset
+    X0 = np.random.rand(100, d)
+    A = np.random.rand(d, k)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, k) - 0.5)  #  Just something smooth
+    rffmgpr = RFFMGPR(X0, Y0, num_features=50)
+    rffmgpr.optimize(maxiter=100)
+
+    m = np.random.rand(1, d)
+    s = np.random.rand(d, d)
+    s = 0.1 * s.dot(s.T)
+
+    M, S, V = predict_wrapper(rffmgpr, m, s)
+    Sigma, w = get_factorizations(rffmgpr)
+    omega, phases, amplitudes = get_features(rffmgpr)
+
+    x = np.random.multivariate_normal(m[0], s, size=200000)
+    phi = amplitudes[:, None, None] * np.cos(
+        np.einsum('efd,nd->enf', omega, x) + phases[:, None, :])
+    f = np.einsum('enf,ef->ne', phi, w)
+    latent_variance = np.einsum('enf,efg,eng->ne', phi, Sigma, phi)
+
+    M_mc = np.mean(f, 0)[None, :]
+    S_mc = np.cov(f.T) + np.diag(np.mean(latent_variance, 0))
+    C_mc = np.cov(np.hstack([x, f]).T)[:d, d:]
+
+    assert M.shape == (1, k)
+    assert S.shape == (k, k)
+    assert V.shape == (d, k)
+    np.testing.assert_allclose(M, M_mc, rtol=1e-2, atol=1e-3)
+    np.testing.assert_allclose(S, S_mc, rtol=5e-2, atol=1e-3)
+    np.testing.assert_allclose(s @ V, C_mc, rtol=5e-2, atol=1e-3)
+
+
+if __name__ == '__main__':
+    test_rff_predictions()
@@ -0,0 +1,40 @@
+from pilco.models import PILCO
+import numpy as np
+from gpflow import autoflow
+
+
+@autoflow()
+def uncached_reward(pilco):
+    return pilco._build_likelihood()
+
+
+def test_rollout_cache():
+    np.random.seed(0)
+    d = 2  # State dimenstion
+    k = 1  # Controller's output dimension
+
+    X0 = np.random.rand(100, d + k)
+    A = np.random.rand(d + k, d)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, d) - 0.5)
+    pilco = PILCO(X0, Y0, horizon=10)
+    pilco.optimize_models(maxiter=20)
+
+    reward = pilco.compute_reward()
+    assert pilco.compute_rollout() is pilco.compute_rollout()
+    np.testing.assert_allclose(reward, uncached_reward(pilco), rtol=1e-10)
+
+    # Any change to the parameters, the models or the data invalidates the cache
+    pilco.optimize_models(maxiter=20, restarts=2)
+    np.testing.assert_allclose(pilco.compute_reward(), uncached_reward(pilco), rtol=1e-10)
+    pilco.controller.randomize()
+    np.testing.assert_allclose(pilco.compute_reward(), uncached_reward(pilco), rtol=1e-10)
+    pilco.mgpr.set_XY(X0[:50], Y0[:50])
+    np.testing.assert_allclose(pilco.compute_reward(), uncached_reward(pilco), rtol=1e-10)
+
+    # The optimizer leaves a rollout at the optimum in the cache
+    pilco.optimize_policy(maxiter=5)
+    np.testing.assert_allclose(pilco.compute_reward(), uncached_reward(pilco), rtol=1e-10)
+
+
+if __name__ == '__main__':
+    test_rollout_cache()
@@ -0,0 +1,31 @@
+from pilco.models import PILCO
+from pilco.sessions import make_session
+import numpy as np
+import tensorflow as tf
+
+
+def test_shared_session():
+    np.random.seed(0)
+    d = 2  # State dimenstion
+    k = 1  # Controller's output dimension
+
+    X0 = np.random.rand(100, d + k)
+    A = np.random.rand(d + k, d)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, d) - 0.5)
+
+    graph = tf.Graph()
+    session = make_session(intra_op_threads=1, inter_op_threads=1, graph=graph)
+    pilcos = [PILCO(X0, Y0, horizon=5, session=session) for _ in range(2)]
+    for pilco in pilcos:
+        # Everything runs in the given session, whatever the default one
+        assert pilco.enquire_session() is session
+        assert pilco.mgpr.models[0].graph is graph
+        pilco.optimize_models(maxiter=5)
+        pilco.optimize_policy(maxiter=5)
+        assert pilco.compute_action(X0[0:1, :d]).shape == (1, k)
+    assert tf.get_default_session() is None
+    session.close()
+
+
+if __name__ == '__main__':
+    test_shared_session()
@@ -0,0 +1,80 @@
+from pilco.models import PILCO
+from pilco.rewards import ExponentialReward
+from pilco.training import optimize_policies
+import numpy as np
+from gpflow import autoflow
+
+
+@autoflow()
+def uncached_reward(pilco):
+    pilco.mgpr.cache_factorizations = False
+    reward = pilco._rollout(pilco.m_init, pilco.S_init, pilco.horizon)[2]
+    pilco.mgpr.cache_factorizations = True
+    return reward
+
+
+def test_shared_model():
+    np.random.seed(0)
+    d = 2  # State dimenstion
+    k = 1  # Controller's output dimension
+
+    X0 = np.random.rand(100, d + k)
+    A = np.random.rand(d + k, d)
+    Y0 = np.sin(X0).dot(A) + 1e-3*(np.random.rand(100, d) - 0.5)
+    pilco = PILCO(X0, Y0, horizon=10, cache_factorizations=True)
+    other = pilco.share_model(reward=ExponentialReward(d, t=np.array([0.5, 0.5])))
+    assert other.mgpr is pilco.mgpr
+
+    # Fitting the model through one object refreshes the factorizations of both
+    pilco.optimize_models(maxiter=20)
+    for p in [pilco, other]:
+        np.testing.assert_allclose(p.compute_reward(), uncached_reward(p), rtol=1e-8)
+    pilco.mgpr.set_XY(X0[:50], Y0[:50])
+    for p in [pilco, other]:
+        np.testing.assert_allclose(p.compute_reward(), uncached_reward(p), rtol=1e-8)
+
+    optimize_policies([pilco, other], maxiter=5)
+    for p in [pilco, other]:
+        np.testing.assert_allclose(p.compute_reward(), uncached_reward(p), rtol=1e-8)
+
+
+def test_shared_model_changes():
+    '''
+    The objects sharing a model don't own it, and are rebuilt along when it
+    changes.
+    '''
+    np.random.seed(0)
+    d = 2  # State dimenstion
+    k = 1  # Controller's output dimension
+
+    # The control doesn't affect the dynamics, so it is pruned
+    X0 = np.random.rand(100, d + k)
+    A = np.random.rand(d, d)
+    Y0 = np.sin(X0[:, :d]).dot(A) + 1e-3*(np.random.rand(100, d) - 0.5)
+    pilco = PILCO(X0, Y0, horizon=10)
+    other = pilco.share_model(reward=ExponentialReward(d, t=np.array([0.5, 0.5])))
+    assert pilco.mgpr.root is pilco.mgpr
+    pilco.optimize_models()
+
+    def check_rewards():
+        # The objectives agree with rollouts of the current model
+        for p in [pilco, other]:
+            np.testing.assert_allclose(p.compute_reward()[0, 0],
+                                       p.evaluate_policies(p._policy_vector()[None])[0],
+                                       rtol=1e-6)
+
+    other.set_propagation('unscented')
+    assert pilco.propagation == 'unscented' and pilco.mgpr.propagation == 'unscented'
+    pilco.set_propagation('moment_matching')
+    assert other.propagation == 'moment_matching'
+    check_rewards()
+
+    np.testing.assert_array_equal(other.prune_inputs(), np.arange(d))
+    # The objective of pilco runs on the new GP models, with the new data
+    pilco.mgpr.set_XY(X0[:50], Y0[:50])
+    check_rewards()
+
+
+if __name__ == '__main__':
+    test_shared_model()
+    test_shared_model_changes()
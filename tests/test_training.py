@@ -0,0 +1,63 @@
+from pilco.controllers import LinearController
+from pilco.training import train
+import numpy as np
+
+
+class Optimisations:
+    '''
+    Stands in for PILCO in train: every policy optimisation sets the bias of
+    the controller to the number of optimisations so far, so that a rollout
+    can tell which policy it was given.
+    '''
+    def __init__(self):
+        self.controller = LinearController(1, 1)
+        self.controller.b.assign([[0.0]])
+        self.mgpr = self
+        self.policies = 0
+        self.data_sizes = []
+
+    def optimize_models(self):
+        pass
+
+    def optimize_policy(self):
+        self.policies += 1
+        self.controller.b.assign([[float(self.policies)]])
+
+    def set_XY(self, X, Y):
+        self.data_sizes.append(X.shape[0])
+
+
+def rollout(policy):
+    # Two transitions, both labelled with the policy that collected them
+    version = policy.controller.b.item()
+    return np.full((2, 1), version), np.full((2, 1), version)
+
+
+def run(staleness, iterations=3):
+    pilco = Optimisations()
+    X, Y = train(pilco, rollout, np.zeros((1, 1)), np.zeros((1, 1)), iterations,
+                 staleness=staleness)
+    np.testing.assert_array_equal(X, Y)
+    return X[1::2, 0], pilco.data_sizes
+
+
+def test_train():
+    # Serial: every rollout uses the policy optimised just before it
+    versions, data_sizes = run(staleness=0)
+    np.testing.assert_array_equal(versions, [1, 2, 3])
+    assert data_sizes == [3, 5, 7]
+
+    # Every rollout lags one optimisation behind
+    versions, data_sizes = run(staleness=1)
+    np.testing.assert_array_equal(versions, [0, 1, 2])
+    assert data_sizes == [3, 5, 7]
+
+    # Two lag behind, and the rollout still in flight after the last
+    # iteration is added at the end
+    versions, data_sizes = run(staleness=2)
+    np.testing.assert_array_equal(versions, [0, 0, 1, 2])
+    assert data_sizes == [3, 5, 7, 9]
+
+
+if __name__ == '__main__':
+    test_train()